@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Coordinator benchmark for the asyncio worker engine.
+
+For every worker count a fresh interpreter is started, so that the peak RSS
+reported is the one of a single coordinator run. Every sipp instance is
+replaced by a no-op executable (``/bin/true`` by default) to measure only the
+coordinator overhead:
+
+    $ python benchmarks/bench_engine.py -n 100 -n 1000 -n 10000
+"""
+
+import click
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from canyantester.engine import run_workers  # noqa: E402
+from canyantester.sipp import SippWorker  # noqa: E402
+from canyantester.utils import percentile  # noqa: E402
+
+
+def measure(number, executable):
+    directory = tempfile.mkdtemp()
+    launches = []
+
+    def log(message):
+        launches.append(time.monotonic())
+
+    workers = []
+    for i in range(number):
+        worker = SippWorker(
+            worker_id="%06d_%06d" % (0, i),
+            config={'values': {'call_duration': 0}},
+            target='127.0.0.1:5060',
+            executable=executable,
+            directory=directory,
+            basedir=directory,
+            log=log,
+        )
+        worker.setup()
+        workers.append(worker)
+
+    started_at = time.monotonic()
+    run_workers(workers)
+    elapsed = time.monotonic() - started_at
+
+    latencies = [(t - started_at) * 1000.0 for t in launches]
+    return {
+        'workers': number,
+        'elapsed_s': round(elapsed, 3),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'launch_latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(max(latencies), 3),
+        },
+        'errors': sum(1 for w in workers if w.get_exit_codes() != [0]),
+    }
+
+
+@click.command()
+@click.option(
+    '-n',
+    '--number',
+    type=click.INT,
+    multiple=True,
+    help='Number of workers, can be repeated (defaults to 100, 1000 and 10000)',
+)
+@click.option('-e', '--executable', default='/bin/true', show_default=True)
+@click.option('--single', is_flag=True, default=False, hidden=True)
+def main(number, executable, single):
+    number = number or (100, 1000, 10000)
+    if single:
+        click.echo(json.dumps(measure(number[0], executable)))
+        return
+    click.echo(
+        "%8s %10s %12s %10s %10s %10s"
+        % ('workers', 'elapsed_s', 'max_rss_kb', 'p50_ms', 'p99_ms', 'max_ms')
+    )
+    for n in number:
+        output = subprocess.run(
+            [sys.executable, __file__, '--single', '-n', str(n), '-e', executable],
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        result = json.loads(output.decode('utf-8').splitlines()[-1])
+        latency = result['launch_latency_ms']
+        click.echo(
+            "%8d %10.3f %12d %10.3f %10.3f %10.3f"
+            % (
+                result['workers'],
+                result['elapsed_s'],
+                result['max_rss_kb'],
+                latency['p50'],
+                latency['p99'],
+                latency['max'],
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
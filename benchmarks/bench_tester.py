@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of `run_tester`.
+
+Every scenario runs a generated configuration in a fresh interpreter against
+a local mock of the rating REST API and of the kamailio xhttp RPC endpoint,
+with sipp replaced by the fake sipp executable of the test suite, which can be
+made to sleep, fail and write statistics:
+
+    $ python benchmarks/bench_tester.py -w 1 -w 100 -r 1 -s 0 -s 100 -o results.jsonl
+
+Each scenario is reported as a JSON line with the time spent until the workers
+start (setup and preparation of the workers), running the workers, in check
+and teardown, and the coordinator overhead per sipp run.
+"""
+
+import click
+import itertools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from canyantester import run_tester  # noqa: E402
+from canyantester.tests.helpers import FAKESIPP  # noqa: E402
+from canyantester.tests.server import StubServer  # noqa: E402
+
+
+def get_config(stub, workers, repeat, setup_steps, sleep, failed):
+    setup = [
+        {
+            'type': 'api',
+            'uri': '/accounts/',
+            'method': 'POST',
+            'store_response': 'account_%d' % i,
+            'payload': {'name': 'account_%d_{random.uuid4}' % i},
+        }
+        for i in range(setup_steps)
+    ]
+    teardown = [
+        {
+            'type': 'api',
+            'uri': '/accounts/{account_%d.id}' % i,
+            'method': 'DELETE',
+        }
+        for i in range(setup_steps)
+    ]
+    return {
+        'setup': setup,
+        'workers': [
+            {
+                'type': 'sipp',
+                'number': workers,
+                'repeat': repeat,
+                'call_number': 10,
+                'stats_interval': 0.5,
+                'values': {'call_duration': 1000},
+                'extra_args': [
+                    '-fake_sleep',
+                    str(sleep),
+                    '-fake_failed',
+                    str(failed),
+                    '-fake_exit',
+                    '0',
+                ],
+            },
+            {
+                'type': 'kamailio_xhttp',
+                'uri': '%s/RPC' % stub.url,
+                'payload': {'jsonrpc': '2.0', 'method': 'core.version'},
+            },
+        ],
+        'teardown': teardown,
+    }
+
+
+def measure(workers, repeat, setup_steps, sleep, failed, parallelism):
+    marks = {}
+    error = None
+
+    def echo(message):
+        for key, prefix in (
+            ('workers', '\nStarting workers:'),
+            ('results', "\nWorkers' timeline:"),
+            ('teardown', 'Starting check process...'),
+            ('teardown', 'Starting teardown process...'),
+        ):
+            if message.startswith(prefix):
+                marks.setdefault(key, time.monotonic())
+
+    with StubServer() as stub:
+        directory = tempfile.mkdtemp()
+        config = os.path.join(directory, 'bench.yaml')
+        with open(config, 'w') as f:
+            yaml.dump(get_config(stub, workers, repeat, setup_steps, sleep, failed), f)
+        started_at = time.monotonic()
+        try:
+            run_tester(
+                config,
+                target='127.0.0.1:5060',
+                executable=FAKESIPP,
+                seed=1,
+                apiurl=stub.url,
+                parallelism=parallelism,
+                echo=echo,
+            )
+        except RuntimeError as e:
+            error = str(e).strip() or 'error'
+        finished_at = time.monotonic()
+        api_requests = len(stub.requests)
+        shutil.rmtree(directory)
+
+    workers_at = marks.get('workers', finished_at)
+    results_at = marks.get('results', finished_at)
+    teardown_at = marks.get('teardown', finished_at)
+    runs = workers * repeat
+    return {
+        'workers': workers,
+        'repeat': repeat,
+        'setup_steps': setup_steps,
+        'parallelism': parallelism,
+        'sleep_s': sleep,
+        'total_s': round(finished_at - started_at, 3),
+        'startup_s': round(workers_at - started_at, 3),
+        'workers_s': round(results_at - workers_at, 3),
+        'teardown_s': round(finished_at - teardown_at, 3),
+        'overhead_per_run_ms': round(
+            max(results_at - workers_at - sleep * repeat, 0) * 1000.0 / runs, 3
+        ),
+        'api_requests': api_requests,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'error': error,
+    }
+
+
+@click.command()
+@click.option(
+    '-w',
+    '--workers',
+    type=click.INT,
+    multiple=True,
+    help='Number of sipp instances, can be repeated (defaults to 1, 10 and 100)',
+)
+@click.option(
+    '-r',
+    '--repeat',
+    type=click.INT,
+    multiple=True,
+    help='Number of runs of each sipp instance, can be repeated (defaults to 1)',
+)
+@click.option(
+    '-s',
+    '--setup-steps',
+    type=click.INT,
+    multiple=True,
+    help='Number of setup and teardown API calls, can be repeated (defaults to 0 and 100)',
+)
+@click.option(
+    '--sleep',
+    type=click.FLOAT,
+    default=0.0,
+    show_default=True,
+    help='Seconds each fake sipp run lasts',
+)
+@click.option(
+    '--failed',
+    type=click.INT,
+    default=0,
+    show_default=True,
+    help='Failed calls reported by each fake sipp run',
+)
+@click.option('-p', '--parallelism', type=click.INT, default=1, show_default=True)
+@click.option(
+    '-o',
+    '--output',
+    type=click.Path(),
+    default=None,
+    help='Append the results to this file, one JSON object per scenario',
+)
+@click.option('--single', is_flag=True, default=False, hidden=True)
+def main(workers, repeat, setup_steps, sleep, failed, parallelism, output, single):
+    workers = workers or (1, 10, 100)
+    repeat = repeat or (1,)
+    setup_steps = setup_steps or (0, 100)
+    if single:
+        click.echo(
+            json.dumps(
+                measure(
+                    workers[0], repeat[0], setup_steps[0], sleep, failed, parallelism
+                )
+            )
+        )
+        return
+    click.echo(
+        "%8s %6s %6s %9s %10s %10s %11s %14s %12s"
+        % (
+            'workers',
+            'repeat',
+            'setup',
+            'total_s',
+            'startup_s',
+            'workers_s',
+            'teardown_s',
+            'overhead_ms',
+            'max_rss_kb',
+        )
+    )
+    for w, r, s in itertools.product(workers, repeat, setup_steps):
+        args = [sys.executable, __file__, '--single', '-w', str(w), '-r', str(r)]
+        args += ['-s', str(s), '--sleep', str(sleep), '--failed', str(failed)]
+        args += ['-p', str(parallelism)]
+        stdout = subprocess.run(args, check=True, stdout=subprocess.PIPE).stdout
+        line = stdout.decode('utf-8').splitlines()[-1]
+        result = json.loads(line)
+        click.echo(
+            "%8d %6d %6d %9.3f %10.3f %10.3f %11.3f %14.3f %12d%s"
+            % (
+                result['workers'],
+                result['repeat'],
+                result['setup_steps'],
+                result['total_s'],
+                result['startup_s'],
+                result['workers_s'],
+                result['teardown_s'],
+                result['overhead_per_run_ms'],
+                result['max_rss_kb'],
+                ' (%s)' % result['error'] if result['error'] else '',
+            )
+        )
+        if output is not None:
+            with open(output, 'a') as f:
+                f.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,17 @@
 import click
+import contextlib
+import json
 import os
 import random
-import requests
 import shutil
-import signal
 import tempfile
-import threading
 import time
 
-from yaml import load
+from collections import Counter
 
-
-try:
-    from yaml import CLoader as Loader
-except ImportError:
-    from yaml import Loader  # type: ignore
-
-from .utils import generate_random_seed, get_int_from_config
-from .api import api_client
-from .sipp import SippWorker
+from .utils import generate_random_seed, get_int_from_config, load_yaml
+from .logs import with_log_sink
+from .ports import MEDIA_PORTS, SIGNALLING_PORTS, PortAllocator, check_ports
 
 
 def print_version(ctx, _, value):
@@ -28,57 +21,276 @@ def print_version(ctx, _, value):
     ctx.exit()
 
 
-@click.command()
+class TesterGroup(click.Group):
+    """
+    Run the `run` command when the first argument is not a command, so that
+    `canyantester config.yaml` keeps working
+    """
+
+    def parse_args(self, ctx, args):
+        if not args or (
+            args[0] not in self.commands and args[0] not in ('--help', '--version')
+        ):
+            args = ['run'] + list(args)
+        return super(TesterGroup, self).parse_args(ctx, args)
+
+
+@click.group(cls=TesterGroup)
 @click.option(
     '--version', is_flag=True, callback=print_version, expose_value=False, is_eager=True
 )
+def canyantester():
+    """
+    Test coordinator and runner, it allows to run real-world scenarios and stress tests
+    coordinating multiple sipp instances.
+    """
+
+
+def shared_options(*groups):
+    """
+    Decorate a command with the options of the given groups, in order
+    """
+
+    def decorator(func):
+        for group in reversed(groups):
+            for option in reversed(group):
+                func = option(func)
+        return func
+
+    return decorator
+
+
+# options of the commands running sipp processes
+PROCESS_OPTIONS = (
+    click.option(
+        '-e',
+        '--executable',
+        type=click.STRING,
+        default="sipp",
+        help='Command to exec for running sipp',
+    ),
+    click.option(
+        '-d',
+        '--directory',
+        type=click.Path(exists=True),
+        default=None,
+        help='Working directory, if not specified a temporary directory is created.',
+    ),
+)
+
+# options of the commands running sipp instances
+SIPP_OPTIONS = PROCESS_OPTIONS + (
+    click.option(
+        '--control-port-base',
+        type=click.INT,
+        default=8888,
+        show_default=True,
+        help='First remote control UDP port of the sipp instances with a load profile',
+    ),
+    click.option(
+        '--signalling-ports',
+        default=SIGNALLING_PORTS,
+        help='Range of the local signalling ports assigned to the sipp instances, '
+        'e.g. 5061-8887, by default each sipp instance picks a free port',
+    ),
+    click.option(
+        '--media-ports',
+        default=MEDIA_PORTS,
+        show_default=True,
+        help='Range of the local media ports assigned to the sipp instances with '
+        'media_ports',
+    ),
+    click.option(
+        '--source-ip',
+        'source_ips',
+        multiple=True,
+        help='Local address of the sipp instances, can be repeated to spread them '
+        'across several addresses',
+    ),
+)
+
+# options of the commands compiling a configuration file
+TARGET_OPTIONS = (
+    click.option(
+        '-t',
+        '--target',
+        default='sbc:5060',
+        type=click.STRING,
+        required=False,
+        help='IP address of the SIP server to use as target',
+    ),
+    click.option(
+        '-s',
+        '--seed',
+        type=click.INT,
+        default=None,
+        help='Initialize the Python random machine with this seed value.',
+    ),
+    click.option('-a', '--apiurl', default='http://api:8000', show_default=True),
+)
+
+# options of the commands running the setup, check and teardown steps
+API_OPTIONS = (
+    click.option(
+        "--no-setup",
+        is_flag=True,
+        default=False,
+        help="Skip setup step in yaml file",
+        hidden=False,
+    ),
+    click.option(
+        "--no-teardown",
+        is_flag=True,
+        default=False,
+        help="Skip teardown step in yaml file",
+        hidden=False,
+    ),
+    click.option(
+        '-p',
+        '--parallelism',
+        type=click.INT,
+        default=1,
+        show_default=True,
+        help='Maximum number of independent setup, check and teardown steps run '
+        'concurrently',
+    ),
+    click.option(
+        '--api-timeout',
+        type=click.FLOAT,
+        default=60.0,
+        show_default=True,
+        help='Timeout in seconds of the HTTP requests to the API and kamailio nodes',
+    ),
+    click.option(
+        '--api-retries',
+        type=click.INT,
+        default=3,
+        show_default=True,
+        help='Number of retries of the HTTP requests failing with a 5xx or '
+        'connection error',
+    ),
+)
+
+SATURATION_OPTION = click.option(
+    '--saturation-interval',
+    type=click.FLOAT,
+    default=0.0,
+    help='Number of seconds between two samples of the CPU, memory and UDP drops '
+    'of the sipp processes and of the host, disabled by default',
+)
+
+# options of the coordinator and of its agents
+TOKEN_OPTION = click.option(
+    '--token',
+    envvar='CANYANTESTER_TOKEN',
+    default=None,
+    help='Token shared by the coordinator and its agents, or by a warm server and '
+    'its clients, required with agents and servers, also read from the '
+    'CANYANTESTER_TOKEN environment variable',
+)
+
+VERBOSE_OPTION = click.option("--verbose", is_flag=True, default=False, hidden=False)
+
+
+@canyantester.command()
 @click.argument('config', type=click.File('rb'))
+@shared_options(TARGET_OPTIONS, SIPP_OPTIONS, API_OPTIONS)
 @click.option(
-    '-t',
-    '--target',
-    default='sbc:5060',
-    type=click.STRING,
-    required=False,
-    help='IP address of the SIP server to use as target',
+    '--cache-accounts',
+    type=click.Path(file_okay=False),
+    default=None,
+    help='Cache the entities created by the setup in this directory and reuse them '
+    'in the following runs, skipping the setup and their teardown',
 )
 @click.option(
-    '-e',
-    '--executable',
-    type=click.STRING,
-    default="sipp",
-    help='Command to exec for running sipp',
+    '--metrics-port',
+    type=click.INT,
+    default=None,
+    help='Expose the metrics of the run in the Prometheus format on this port',
 )
 @click.option(
-    '-d',
-    '--directory',
-    type=click.Path(exists=True),
-    default=None,
-    help='Working directory, if not specified a temporary directory is created.',
+    '--metrics-address',
+    default='0.0.0.0',
+    show_default=True,
+    help='Address the metrics endpoint listens on',
 )
 @click.option(
-    '-s',
-    '--seed',
+    '--agents',
     type=click.INT,
-    default=None,
-    help='Initialize the Python random machine with this seed value.',
+    default=0,
+    help='Number of agents to shard the sipp workers across, 0 to run them locally',
 )
-@click.option('-a', '--apiurl', default='http://api:8000', show_default=True)
 @click.option(
-    "--no-setup",
-    is_flag=True,
-    default=False,
-    help="Skip setup step in yaml file",
-    hidden=False,
+    '--listen',
+    default='127.0.0.1:8765',
+    show_default=True,
+    help='Address and port the coordinator listens on for the agents',
 )
+@TOKEN_OPTION
 @click.option(
-    "--no-teardown",
+    '--agents-timeout',
+    type=click.FLOAT,
+    default=300.0,
+    show_default=True,
+    help='Number of seconds to wait for the agents to register',
+)
+@click.option(
+    '--start-delay',
+    type=click.FLOAT,
+    default=5.0,
+    show_default=True,
+    help='Number of seconds between the assignment of the workers to the agents '
+    'and their synchronized start',
+)
+@click.option(
+    '--teardown-timeout',
+    type=click.FLOAT,
+    default=60.0,
+    show_default=True,
+    help='Number of seconds the teardown may take after an interruption',
+)
+@SATURATION_OPTION
+@click.option(
+    '--stats',
     is_flag=True,
     default=False,
-    help="Skip teardown step in yaml file",
-    hidden=False,
+    help='Trace the statistics and response times of the sipp workers and report '
+    'them, implied by --metrics-port, --results and a failure budget',
+)
+@click.option(
+    '--results',
+    type=click.Path(dir_okay=False),
+    default=None,
+    help='File the record of the run, including its configuration, is appended '
+    'to, an SQLite database for a .db, .sqlite or .sqlite3 file, JSON lines '
+    'otherwise; no record is kept by default',
+)
+@click.option(
+    '--tag',
+    default=None,
+    help='Tag of the record of the run, e.g. baseline',
+)
+@click.option(
+    '--trace',
+    type=click.Path(dir_okay=False),
+    default=None,
+    help='Write the spans of the setup steps, API calls, worker runs, check and '
+    'teardown to this file, in the Chrome trace format',
+)
+@click.option(
+    '--otlp-endpoint',
+    default=None,
+    help='Export the spans of the run to this OpenTelemetry collector, e.g. '
+    'http://127.0.0.1:4318/v1/traces',
+)
+@click.option(
+    '--server',
+    default=None,
+    help='URL of a warm `canyantester serve` process to submit the run to, '
+    'e.g. http://127.0.0.1:8790',
 )
-@click.option("--verbose", is_flag=True, default=False, hidden=False)
-def canyantester(
+@VERBOSE_OPTION
+def run(
     config,
     target,
     executable,
@@ -88,30 +300,474 @@ def canyantester(
     cache_accounts=None,
     no_setup=False,
     no_teardown=False,
+    parallelism=1,
+    api_timeout=60.0,
+    api_retries=3,
+    metrics_port=None,
+    metrics_address='0.0.0.0',
+    agents=0,
+    listen='127.0.0.1:8765',
+    token=None,
+    agents_timeout=300.0,
+    start_delay=5.0,
+    control_port_base=8888,
+    signalling_ports=SIGNALLING_PORTS,
+    media_ports=MEDIA_PORTS,
+    source_ips=(),
+    teardown_timeout=60.0,
+    saturation_interval=0.0,
+    stats=False,
+    results=None,
+    tag=None,
+    trace=None,
+    otlp_endpoint=None,
+    server=None,
     verbose=False,
 ):
     """
-    Test coordinator and runner, it allows to run real-world scenarios and stress tests
-    coordinating multiple sipp instances.
+    Run the scenarios and stress tests of a configuration file.
     """
+    from .serve import submit_run
+
+    options = dict(
+        target=target,
+        executable=executable,
+        directory=directory,
+        seed=seed,
+        apiurl=apiurl,
+        cache_accounts=cache_accounts,
+        no_setup=no_setup,
+        no_teardown=no_teardown,
+        parallelism=parallelism,
+        api_timeout=api_timeout,
+        api_retries=api_retries,
+        metrics_port=metrics_port,
+        metrics_address=metrics_address,
+        agents=agents,
+        listen=listen,
+        token=token,
+        agents_timeout=agents_timeout,
+        start_delay=start_delay,
+        control_port_base=control_port_base,
+        signalling_ports=signalling_ports,
+        media_ports=media_ports,
+        source_ips=source_ips,
+        teardown_timeout=teardown_timeout,
+        saturation_interval=saturation_interval,
+        stats=stats,
+        results=results,
+        tag=tag,
+        trace=trace,
+        otlp_endpoint=otlp_endpoint,
+        verbose=verbose,
+    )
     try:
-        run_tester(
+        if server is not None:
+            # the server runs its own sipp executable
+            del options['executable']
+            submit_run(server, config.name, options, token=token, echo=click.echo)
+        else:
+            run_tester(config=config, echo=click.echo, **options)
+    except RuntimeError as e:
+        raise click.Abort(str(e))
+
+
+@canyantester.command()
+@click.argument('config', type=click.File('rb'))
+@shared_options(TARGET_OPTIONS, SIPP_OPTIONS, API_OPTIONS)
+@click.option(
+    '-o',
+    '--output',
+    type=click.Path(),
+    default=None,
+    help='Write the result and the measured points of the search to this JSON file',
+)
+@VERBOSE_OPTION
+def capacity(config, output=None, **options):
+    """
+    Search the highest call rate, or concurrency, of a sipp worker meeting the
+    service level objectives of the `capacity` section of a configuration file.
+    """
+    try:
+        run_capacity(config=config, output=output, echo=click.echo, **options)
+    except RuntimeError as e:
+        raise click.Abort(str(e))
+
+
+@canyantester.command()
+@click.argument('config', type=click.File('rb'))
+@shared_options(TARGET_OPTIONS, SIPP_OPTIONS, API_OPTIONS)
+@click.option(
+    '-o',
+    '--output',
+    type=click.Path(),
+    default=None,
+    help='Write the results of the cells to this CSV file',
+)
+@VERBOSE_OPTION
+def matrix(config, output=None, **options):
+    """
+    Run the setup once, then a worker with every combination of the parameter
+    values of the `matrix` section of a configuration file.
+    """
+    try:
+        run_matrix(config=config, output=output, echo=click.echo, **options)
+    except RuntimeError as e:
+        raise click.Abort(str(e))
+
+
+@canyantester.command()
+@click.argument('coordinator', type=click.STRING)
+@TOKEN_OPTION
+@shared_options(SIPP_OPTIONS)
+@SATURATION_OPTION
+@VERBOSE_OPTION
+def agent(
+    coordinator,
+    executable,
+    directory,
+    token=None,
+    control_port_base=8888,
+    signalling_ports=SIGNALLING_PORTS,
+    media_ports=MEDIA_PORTS,
+    source_ips=(),
+    saturation_interval=0.0,
+    verbose=False,
+):
+    """
+    Run the sipp workers assigned by the coordinator listening on the given URL,
+    e.g. http://coordinator:8765
+    """
+    from .distributed import run_agent
+
+    try:
+        run_agent(
+            coordinator,
+            token,
+            executable=executable,
+            directory=directory,
+            control_port_base=control_port_base,
+            signalling_ports=signalling_ports,
+            media_ports=media_ports,
+            source_ips=source_ips,
+            saturation_interval=saturation_interval,
+            verbose=verbose,
+            log=click.echo,
+        )
+    except RuntimeError as e:
+        raise click.Abort(str(e))
+
+
+@canyantester.command()
+@click.argument('config', type=click.File('rb'))
+@shared_options(TARGET_OPTIONS, SIPP_OPTIONS)
+@click.option(
+    '--agents',
+    type=click.INT,
+    default=0,
+    help='Number of agents to shard the sipp workers across, 0 to run them locally',
+)
+@click.option(
+    '-o',
+    '--output',
+    type=click.Path(),
+    default=None,
+    help='Write the plan to this JSON file instead of the standard output',
+)
+def plan(
+    config,
+    target,
+    executable,
+    directory,
+    seed,
+    apiurl=None,
+    agents=0,
+    control_port_base=8888,
+    signalling_ports=SIGNALLING_PORTS,
+    media_ports=MEDIA_PORTS,
+    source_ips=(),
+    output=None,
+):
+    """
+    Compile a configuration file and a seed into an execution plan, which can
+    be compared with the plans of other seeds and run in place of the
+    configuration file.
+    """
+    try:
+        run_plan(
             config=config,
             target=target,
             executable=executable,
             directory=directory,
             seed=seed,
             apiurl=apiurl,
+            agents=agents,
+            control_port_base=control_port_base,
+            signalling_ports=signalling_ports,
+            media_ports=media_ports,
+            source_ips=source_ips,
+            output=output,
+            echo=click.echo,
+        )
+    except RuntimeError as e:
+        raise click.Abort(str(e))
+
+
+@canyantester.command()
+@click.argument('results', type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--run',
+    'run_id',
+    default='last',
+    show_default=True,
+    help='Run to check: last, previous, an id or a tag',
+)
+@click.option(
+    '--baseline',
+    default='baseline',
+    show_default=True,
+    help='Run to compare with: last, previous, an id or a tag',
+)
+@click.option(
+    '--tolerance',
+    'tolerances',
+    multiple=True,
+    help='Tolerance of a metric as NAME=VALUE, relative with a % suffix '
+    '(e.g. response_time.p95=20%), absolute otherwise (e.g. failure_rate=0.01)',
+)
+@click.option(
+    '--default-tolerance',
+    default='10%',
+    show_default=True,
+    help='Tolerance of the metrics without their own',
+)
+def compare(results, run_id, baseline, tolerances, default_tolerance):
+    """
+    Compare a run with a baseline run of a results store, failing on
+    regressions.
+    """
+    try:
+        run_compare(
+            results,
+            run_id=run_id,
+            baseline=baseline,
+            tolerances=tolerances,
+            default_tolerance=default_tolerance,
+            echo=click.echo,
+        )
+    except RuntimeError as e:
+        raise click.Abort(str(e))
+
+
+@canyantester.command()
+@click.option(
+    '--listen',
+    default='127.0.0.1:8790',
+    show_default=True,
+    help='Address and port the server accepts the runs on',
+)
+@click.option(
+    '--pool-maxsize',
+    type=click.INT,
+    default=50,
+    show_default=True,
+    help='Number of keep-alive connections to each API host kept across the runs',
+)
+@TOKEN_OPTION
+@shared_options(PROCESS_OPTIONS)
+@click.option(
+    '--cache-accounts',
+    type=click.Path(file_okay=False),
+    default=None,
+    help='Cache the entities created by the setup of the runs in this directory',
+)
+@click.option(
+    '--results',
+    type=click.Path(dir_okay=False),
+    default=None,
+    help='File the records of the runs are appended to',
+)
+def serve(
+    listen,
+    pool_maxsize,
+    executable,
+    directory,
+    token=None,
+    cache_accounts=None,
+    results=None,
+):
+    """
+    Keep a warm process running the configurations submitted with
+    `canyantester run --server`, reusing its parsed configurations and
+    scenarios and its API connections across the runs.
+    """
+    try:
+        run_serve(
+            listen,
+            pool_maxsize,
+            token,
+            executable=executable,
+            directory=directory,
             cache_accounts=cache_accounts,
-            no_setup=no_setup,
-            no_teardown=no_teardown,
-            verbose=verbose,
+            results=results,
             echo=click.echo,
         )
     except RuntimeError as e:
         raise click.Abort(str(e))
 
 
+def run_serve(
+    listen='127.0.0.1:8790',
+    pool_maxsize=50,
+    token=None,
+    executable='sipp',
+    directory=None,
+    cache_accounts=None,
+    results=None,
+    echo=print,
+):
+    from .serve import RunServer, WarmCache
+
+    cache = WarmCache(pool_maxsize=pool_maxsize)
+
+    def runner(config, output, **options):
+        run_tester(
+            config=config,
+            executable=executable,
+            directory=directory,
+            cache_accounts=cache_accounts,
+            results=results,
+            echo=output,
+            cache=cache,
+            **options
+        )
+
+    address, port = listen.rsplit(':', 1)
+    server = RunServer(runner, token, address, int(port), log=echo)
+    echo("Serving runs on http://%s:%d" % (address, server.get_port()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        cache.close()
+
+
+def run_compare(
+    results,
+    run_id='last',
+    baseline='baseline',
+    tolerances=(),
+    default_tolerance='10%',
+    echo=print,
+):
+    """
+    Compare the metrics of a run with the ones of a baseline run, raise
+    RuntimeError when the run did not pass or any metric regressed
+    """
+    from .results import compare_records, find_record, format_comparison, open_store
+
+    records = open_store(results).get_records()
+    current = find_record(records, run_id)
+    reference = find_record(records, baseline)
+    parsed = {}
+    for tolerance in tolerances:
+        name, separator, value = tolerance.partition('=')
+        if not separator:
+            raise RuntimeError("Invalid tolerance %s, expected NAME=VALUE" % tolerance)
+        parsed[name.strip()] = value
+    echo(
+        "Comparing run %s (%s) with baseline %s (%s)"
+        % (
+            current['id'],
+            current['started_at'],
+            reference['id'],
+            reference['started_at'],
+        )
+    )
+    rows = compare_records(current, reference, parsed, default_tolerance)
+    for line in format_comparison(rows):
+        echo(line)
+    regressions = [row['metric'] for row in rows if row['regression']]
+    if current['status'] != 'passed':
+        raise RuntimeError(
+            "Run %s did not pass: %s" % (current['id'], current['status'])
+        )
+    if regressions:
+        raise RuntimeError("Regressions detected: %s" % ', '.join(regressions))
+    echo("No regressions")
+    return rows
+
+
+def run_plan(
+    config,
+    target='sbc:5060',
+    executable='sipp',
+    directory=None,
+    seed=None,
+    apiurl=None,
+    agents=0,
+    control_port_base=8888,
+    signalling_ports=SIGNALLING_PORTS,
+    media_ports=MEDIA_PORTS,
+    source_ips=(),
+    output=None,
+    echo=print,
+):
+    """
+    Compile the execution plan of a configuration without running it, and
+    write it as JSON to `output` or echo it. The scenarios are rendered in
+    `directory`, by default a temporary directory removed afterwards.
+    """
+    from .budget import get_budget_config
+    from .plan import compile_plan, format_plan
+    from .templates import ScenarioCache
+
+    if seed is None:
+        seed = generate_random_seed()
+    if isinstance(config, str):
+        config = open(config, 'rb')
+
+    # the plan refers to the directory as {directory}, a temporary one is
+    # only needed to render the scenarios
+    remove_directory_when_done = directory is None
+    if remove_directory_when_done:
+        directory = tempfile.mkdtemp()
+    try:
+        config_data = load_yaml(config)
+        basedir = config_data.setdefault('basedir', os.path.dirname(config.name))
+        get_budget_config(config_data)
+        execution_plan = compile_plan(
+            config_data,
+            seed,
+            target,
+            executable,
+            directory,
+            PortAllocator(signalling_ports, media_ports, control_port_base, source_ips),
+            ScenarioCache(directory, basedir),
+            apiurl=apiurl,
+            agents=agents,
+        )
+        content = json.dumps(execution_plan, indent=2, sort_keys=True, default=str)
+        if output is None:
+            echo(content)
+        else:
+            with open(output, 'w') as f:
+                f.write(content + '\n')
+            for line in format_plan(execution_plan):
+                echo(line)
+            echo(
+                "\nPlan of %d worker instances written to %s"
+                % (len(execution_plan['workers']), output)
+            )
+    finally:
+        if remove_directory_when_done:
+            shutil.rmtree(directory)
+    return execution_plan
+
+
+@with_log_sink
 def run_tester(
     config,
     target='sbc:5060',
@@ -122,9 +778,72 @@ def run_tester(
     cache_accounts=None,
     no_setup=False,
     no_teardown=False,
+    parallelism=1,
+    api_timeout=60.0,
+    api_retries=3,
+    metrics_port=None,
+    metrics_address='0.0.0.0',
+    agents=0,
+    listen='127.0.0.1:8765',
+    token=None,
+    agents_timeout=300.0,
+    start_delay=5.0,
+    control_port_base=8888,
+    signalling_ports=SIGNALLING_PORTS,
+    media_ports=MEDIA_PORTS,
+    source_ips=(),
+    teardown_timeout=60.0,
+    saturation_interval=0.0,
+    stats=False,
+    results=None,
+    tag=None,
+    trace=None,
+    otlp_endpoint=None,
     verbose=False,
     echo=print,
+    cache=None,
 ):
+    from .budget import FailureBudget, get_budget_config
+    from .distributed import Coordinator, distribute_workers, wait_until
+    from .engine import RunAborted, Timeline, run_workers
+    from .fixtures import FixtureCache, get_fixture_names, get_setup_key
+    from .kamailio import KamailioXHTTPWorker
+    from .metrics import Metrics, MetricsServer
+    from .plan import (
+        PLAN_VERSION,
+        compile_plan,
+        format_plan,
+        get_instance_ports,
+        is_plan,
+    )
+    from .profiles import get_profile_monitors
+    from .results import RunRecorder, open_store
+    from .saturation import SaturationMonitor, format_saturation
+    from .sipp import SippWorker
+    from .stats import format_summary, merge_stats
+    from .steps import resolve_hosts, run_bounded
+    from .templates import ScenarioCache
+    from .tracing import Tracer, span
+    from .uac import UACWorker
+
+    if isinstance(config, str):
+        config = open(config, 'rb')
+
+    config_data = load_yaml(config) if cache is None else cache.load_config(config)
+    execution_plan = None
+    if is_plan(config_data):
+        # a compiled plan is replayed with its own seed and target
+        execution_plan, config_data = config_data, config_data['config']
+        seed, target = execution_plan['seed'], execution_plan['target']
+        if execution_plan['plan_version'] != PLAN_VERSION:
+            raise RuntimeError(
+                "The plan has been compiled by another version, compile it again"
+            )
+        if execution_plan['agents'] != agents:
+            raise RuntimeError(
+                "The plan has been compiled for %d agents" % execution_plan['agents']
+            )
+
     if seed is None:
         seed = generate_random_seed()
 
@@ -140,50 +859,179 @@ def run_tester(
     echo("Using executable: %s" % executable)
     echo("Target: %s" % target)
 
-    if isinstance(config, str):
-        config = open(config, 'rb')
-
-    config_data = load(config, Loader=Loader)
     basedir = config_data.setdefault('basedir', os.path.dirname(config.name))
     stored_responses = {}
-
-    setup = config_data.get('setup', None)
-    if not no_setup and setup is not None:
-        for i, setup_config in enumerate(setup):
-            if setup_config.get('type', 'api') == 'api':
-                store_response = setup_config.get('store_response', None)
-                apiurl = setup_config.get('host', apiurl)
-                response = APIcall(apiurl, setup_config, stored_responses, verbose)
-                if store_response:
-                    stored_responses[store_response] = response
+    recorder = RunRecorder(seed, target, config_data, tag=tag)
+    budget = get_budget_config(config_data)
+    allocator = PortAllocator(
+        signalling_ports, media_ports, control_port_base, source_ips
+    )
+    scenarios = ScenarioCache(
+        directory,
+        basedir,
+        templates=cache.templates if cache is not None else None,
+    )
+    if execution_plan is None:
+        execution_plan = compile_plan(
+            config_data,
+            seed,
+            target,
+            executable,
+            directory,
+            allocator,
+            scenarios,
+            apiurl=apiurl,
+            agents=agents,
+        )
     else:
-        echo("Skipping setup...")
+        # the ports pinned by a replayed plan may have been taken since
+        for instance in execution_plan['workers']:
+            if instance['ports'] is not None:
+                check_ports(get_instance_ports(instance))
+    if verbose:
+        echo("\nExecution plan:")
+        for line in format_plan(execution_plan):
+            echo(line)
+    metrics = Metrics()
+    # the sipp statistics are traced when reported, exposed, watched or recorded
+    stats = stats or any(
+        option is not None for option in (metrics_port, budget, results)
+    )
+    tracer = None
+    run_span = None
+    if trace is not None or otlp_endpoint is not None:
+        tracer = Tracer()
+        run_span = tracer.start('run', seed=seed, target=target)
+    client = new_client(
+        config_data,
+        parallelism,
+        api_timeout,
+        api_retries,
+        metrics=metrics,
+        session=cache.get_session() if cache is not None else None,
+        tracer=tracer,
+    )
 
-    def _do_check():
-        do_check(config_data, apiurl, stored_responses, verbose, echo=echo)
+    coordinator = None
+    if agents:
+        address, port = listen.rsplit(':', 1)
+        coordinator = Coordinator(token, address, int(port), log=echo, metrics=metrics)
+        coordinator.start()
+        echo("Coordinator listening on %s:%d" % (address, coordinator.get_port()))
 
-    def _do_teardown():
-        do_teardown(
-            config_data, no_teardown, apiurl, stored_responses, verbose, echo=echo
+    metrics_server = None
+    if metrics_port is not None:
+        metrics_server = MetricsServer(metrics, metrics_address, metrics_port)
+        metrics_server.start()
+        echo(
+            "Exposing metrics on http://%s:%d/metrics"
+            % (metrics_address, metrics_server.get_port())
         )
 
-    signal.signal(signal.SIGINT, _do_teardown)
+    fixtures = None
+    if cache_accounts:
+        fixtures = FixtureCache(
+            cache_accounts, client, parallelism=max(parallelism, 10), log=echo
+        )
 
     try:
-        workers = config_data.get('workers')
-        if workers is None:
-            echo("No worker has been defined, quit!")
-            raise RuntimeError()
-
-        testers = []
-        other_testers = []
-        for i, worker_config in enumerate(workers):
-            number_of_workers = get_int_from_config(worker_config, 'number', 1)
-
-            for j in range(number_of_workers):
-                if worker_config.get('type', 'sipp') == 'sipp':
+        setup = config_data.get('setup', None)
+        fixture_names = set()
+        if not no_setup and setup is not None:
+            with recorder.phase('setup'), span(tracer, 'setup'):
+                cached = None
+                setup_directory = directory
+                if fixtures is not None:
+                    fixture_key = get_setup_key(setup, apiurl)
+                    fixture_names = get_fixture_names(setup)
+                    cached = fixtures.load(fixture_key, setup, apiurl)
+                    # the files of the bulk steps are cached with the fixtures
+                    setup_directory = os.path.join(cache_accounts, fixture_key)
+                    os.makedirs(setup_directory, exist_ok=True)
+                if cached is not None:
+                    stored_responses.update(cached)
+                    apiurl = (resolve_hosts(setup, apiurl) or [apiurl])[-1]
+                else:
+                    apiurl = do_setup(
+                        config_data,
+                        apiurl,
+                        stored_responses,
+                        verbose,
+                        parallelism,
+                        echo=echo,
+                        client=client,
+                        metrics=metrics,
+                        directory=setup_directory,
+                        tracer=tracer,
+                    )
+                    if fixtures is not None:
+                        fixtures.save(fixture_key, stored_responses)
+        else:
+            echo("Skipping setup...")
+
+        def _do_check():
+            with recorder.phase('check'), span(tracer, 'check'):
+                do_check(
+                    config_data,
+                    apiurl,
+                    stored_responses,
+                    verbose,
+                    parallelism,
+                    echo=echo,
+                    client=client,
+                    metrics=metrics,
+                    tracer=tracer,
+                )
+
+        def _do_teardown():
+            with recorder.phase('teardown'), span(tracer, 'teardown'):
+                do_teardown(
+                    config_data,
+                    no_teardown,
+                    apiurl,
+                    stored_responses,
+                    verbose,
+                    parallelism,
+                    echo=echo,
+                    client=client,
+                    metrics=metrics,
+                    keep=fixture_names,
+                    tracer=tracer,
+                )
+
+        done = False
+        interrupted = False
+        try:
+            workers = config_data.get('workers')
+            if workers is None:
+                echo("No worker has been defined, quit!")
+                raise RuntimeError()
+
+            testers = []
+            remote_instances = []
+            numbers = Counter(
+                instance['group'] for instance in execution_plan['workers']
+            )
+            injection_files = {}
+            for instance in execution_plan['workers']:
+                i, worker_id = instance['group'], instance['worker_id']
+                worker_config = instance['config']
+                if i not in injection_files:
+                    injection_files[i] = get_injection_files(
+                        worker_config, stored_responses, numbers[i], agents=agents
+                    )
+                if instance['remote']:
+                    remote_instances.append(
+                        (worker_id, worker_config, instance['seed'])
+                    )
+                    continue
+                if instance['seed'] is not None:
+                    # an instance draws the same values wherever it runs
+                    random.seed(instance['seed'])
+                if instance['type'] == 'sipp':
+                    j = int(worker_id.split('_', 1)[1])
                     tester = SippWorker(
-                        worker_id="%06d_%06d" % (i, j),
+                        worker_id=worker_id,
                         config=worker_config,
                         target=target,
                         executable=executable,
@@ -192,115 +1040,854 @@ def run_tester(
                         log=echo,
                         stored_responses=stored_responses,
                         verbose=verbose,
+                        scenarios=scenarios,
+                        metrics=metrics,
+                        ports=get_instance_ports(instance),
+                        injection_file=get_injection_file(injection_files[i], j),
+                        tracer=tracer,
+                        stats=stats,
                     )
+                elif instance['type'] == 'uac':
+                    tester = UACWorker(
+                        worker_id=worker_id,
+                        config=worker_config,
+                        target=target,
+                        log=echo,
+                        stored_responses=stored_responses,
+                        verbose=verbose,
+                        metrics=metrics,
+                        ports=get_instance_ports(instance),
+                    )
+                else:
+                    tester = KamailioXHTTPWorker(
+                        worker_id=worker_id,
+                        config=worker_config,
+                        log=echo,
+                        verbose=verbose,
+                        client=client,
+                        metrics=metrics,
+                        tracer=tracer,
+                    )
+                with span(tracer, 'setup %s' % instance['type'], worker_id=worker_id):
                     tester.setup()
-                    testers.append(tester)
-                elif worker_config.get('type', None) == 'kamailio_xhttp':
-                    thread = threading.Thread(
-                        target=kamailioXHTTP, args=(worker_config, verbose)
+                testers.append(tester)
+
+            if agents:
+                start_at, remote_workers = distribute_workers(
+                    coordinator,
+                    remote_instances,
+                    agents,
+                    target=target,
+                    stored_responses=stored_responses,
+                    basedir=basedir,
+                    stats=stats,
+                    agents_timeout=agents_timeout,
+                    start_delay=start_delay,
+                    log=echo,
+                )
+                testers.extend(remote_workers)
+                wait_until(start_at)
+
+            echo("\nStarting workers:")
+            monitors = get_profile_monitors(testers, log=echo)
+            if budget is not None:
+                monitors.append(FailureBudget(budget, log=echo))
+            saturation = None
+            if saturation_interval:
+                saturation = SaturationMonitor(saturation_interval, log=echo)
+                monitors.append(saturation)
+            timeline = Timeline()
+            aborted = None
+            try:
+                with recorder.phase('workers'), span(tracer, 'workers'):
+                    run_workers(testers, timeline=timeline, monitors=monitors)
+            except RunAborted as e:
+                # straight to the results, the check and the teardown
+                aborted = e
+                if coordinator is not None:
+                    coordinator.abort(str(e))
+                    coordinator.wait_for_results(
+                        [worker_id for worker_id, _, _ in remote_instances],
+                        teardown_timeout,
+                    )
+            elapsed = timeline.elapsed() / 1000.0
+
+            echo("\nWorkers' timeline:")
+            for event in timeline.get_events():
+                echo(
+                    "[%s] %s planned at %.3f ms, fired at %.3f ms (lag = %.3f ms)"
+                    % (
+                        event['worker_id'],
+                        event['action'],
+                        event['planned'],
+                        event['fired'],
+                        event['lag'],
+                    )
+                )
+
+            echo("\nWorkers' results:")
+            error = False
+            for tester in testers:
+                tester.debug()
+                exit_status = tester.get_exit_status()
+                if exit_status != 0:
+                    error = True
+                tester.teardown()
+                recorder.add_worker(tester)
+
+            stats = [
+                tester.get_stats()
+                for tester in testers
+                if tester.get_stats() is not None
+            ]
+            summary = merge_stats(stats).summary(elapsed=elapsed)
+            recorder.set_stats(summary)
+            if summary['calls']:
+                echo("\nGlobal statistics: %s" % format_summary(summary))
+
+            if saturation is not None and saturation.is_available():
+                report = saturation.get_report()
+                recorder.set_saturation(report)
+                echo("\nLoad generator:")
+                for line in format_saturation(report):
+                    echo(line)
+
+            if aborted is not None:
+                recorder.set_status('aborted')
+                raise RuntimeError("\nFailure budget exceeded (%s), aborted!" % aborted)
+            elif error:
+                recorder.set_status('failed')
+                raise RuntimeError("\nError detected, aborted!")
+            else:
+                done = True
+                recorder.set_status('passed')
+                echo("\nDone!")
+        except KeyboardInterrupt as e:
+            # the sipp processes have been terminated with their workers
+            interrupted = True
+            recorder.set_status('interrupted')
+            raise RuntimeError("\nInterrupted, aborted!") from e
+        finally:
+            try:
+                if interrupted:
+                    echo(
+                        "\nInterrupted, tearing down within %s seconds..."
+                        % teardown_timeout
                     )
-                    other_testers.append(thread)
-
-        echo("\nStarting workers:")
-        threads = []
-        for tester in testers:
-            t = threading.Thread(target=tester)
-            threads.append(t)
-            t.start()
-
-        for t in threads:
-            t.join()
-
-        for t in other_testers:
-            t.start()
-
-        for t in other_testers:
-            t.join()
-
-        echo("\nWorkers' results:")
-        error = False
-        for tester in testers:
-            tester.debug()
-            exit_status = tester.get_exit_status()
-            if exit_status != 0:
-                error = True
-            tester.teardown()
-
-        if error:
-            raise RuntimeError("\nError detected, aborted!")
+                    run_bounded(_do_teardown, teardown_timeout)
+                else:
+                    _do_check()
+                    _do_teardown()
+                # the teardown may iterate on the files of the bulk steps
+                if done and remove_directory_when_done:
+                    shutil.rmtree(directory)
+            finally:
+                echo_api_stats(client, echo=echo)
+    except RuntimeError as e:
+        recorder.fail(str(e).strip() or None)
+        raise
+    finally:
+        client.close()
+        if coordinator is not None:
+            coordinator.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if results is not None:
+            recorder.set_api(client.get_stats())
+            open_store(results).append(recorder.record)
+            echo("Run %s recorded in %s" % (recorder.record['id'], results))
+        if run_span is not None:
+            tracer.end(run_span, error=recorder.record['status'] != 'passed')
+            export_trace(tracer, trace, otlp_endpoint, echo=echo)
+
+
+def start_run(config, target, executable, directory, seed, echo=print):
+    """
+    Seed the random machine and load the configuration of a run sharing its
+    setup across several worker runs, return the configuration and the
+    working directory
+    """
+    if seed is None:
+        seed = generate_random_seed()
+
+    if directory is None:
+        directory = tempfile.mkdtemp()
+
+    echo("Setting the random seed: %s" % seed)
+    random.seed(seed)
+
+    echo("Using temporary directory: %s" % directory)
+    echo("Using executable: %s" % executable)
+    echo("Target: %s" % target)
+
+    if isinstance(config, str):
+        config = open(config, 'rb')
+
+    config_data = load_yaml(config)
+    config_data.setdefault('basedir', os.path.dirname(config.name))
+    return config_data, directory
+
+
+def new_client(config_data, parallelism=1, api_timeout=60.0, api_retries=3, **kwargs):
+    """
+    Return the HTTP client of the API calls of a run, with a connection pool
+    fitting its concurrent setup and teardown calls
+    """
+    from .bulk import get_bulk_concurrency
+    from .client import HTTPClient
+
+    return HTTPClient(
+        timeout=api_timeout,
+        retries=api_retries,
+        pool_maxsize=get_bulk_concurrency(
+            (config_data.get('setup', None) or [])
+            + (config_data.get('teardown', None) or []),
+            max(parallelism, 10),
+        ),
+        **kwargs
+    )
+
+
+@contextlib.contextmanager
+def setup_session(
+    config_data,
+    apiurl,
+    directory,
+    metrics,
+    no_setup=False,
+    no_teardown=False,
+    parallelism=1,
+    api_timeout=60.0,
+    api_retries=3,
+    verbose=False,
+    echo=print,
+):
+    """
+    Run the setup steps of a configuration and yield the API URL and the
+    responses they stored, then the check and the teardown steps, even when
+    the workers failed
+    """
+    stored_responses = {}
+    client = new_client(
+        config_data, parallelism, api_timeout, api_retries, metrics=metrics
+    )
+    try:
+        setup = config_data.get('setup', None)
+        if not no_setup and setup is not None:
+            apiurl = do_setup(
+                config_data,
+                apiurl,
+                stored_responses,
+                verbose,
+                parallelism,
+                echo=echo,
+                client=client,
+                metrics=metrics,
+                directory=directory,
+            )
         else:
-            if remove_directory_when_done:
-                shutil.rmtree(directory)
-            echo("\nDone!")
+            echo("Skipping setup...")
+
+        try:
+            yield apiurl, stored_responses
+        finally:
+            try:
+                do_check(
+                    config_data,
+                    apiurl,
+                    stored_responses,
+                    verbose,
+                    parallelism,
+                    echo=echo,
+                    client=client,
+                    metrics=metrics,
+                )
+                do_teardown(
+                    config_data,
+                    no_teardown,
+                    apiurl,
+                    stored_responses,
+                    verbose,
+                    parallelism,
+                    echo=echo,
+                    client=client,
+                    metrics=metrics,
+                )
+            finally:
+                echo_api_stats(client, echo=echo)
     finally:
-        _do_check()
-        _do_teardown()
+        client.close()
 
 
-def do_delay(config):
+@with_log_sink
+def run_capacity(
+    config,
+    target='sbc:5060',
+    executable='sipp',
+    directory=None,
+    seed=None,
+    apiurl=None,
+    no_setup=False,
+    no_teardown=False,
+    parallelism=1,
+    api_timeout=60.0,
+    api_retries=3,
+    control_port_base=8888,
+    signalling_ports=SIGNALLING_PORTS,
+    media_ports=MEDIA_PORTS,
+    source_ips=(),
+    output=None,
+    verbose=False,
+    echo=print,
+):
+    """
+    Run the setup once, then measurement windows of the sipp worker selected
+    by the `capacity` section at increasing rates, and finally the check and
+    the teardown. Return the highest value meeting the objectives.
+    """
+    from .capacity import (
+        build_window_config,
+        format_point,
+        get_capacity_config,
+        get_point,
+        search_capacity,
+    )
+    from .engine import run_workers
+    from .metrics import Metrics
+    from .sipp import SippWorker
+    from .stats import merge_stats
+    from .templates import ScenarioCache
+
+    config_data, directory = start_run(
+        config, target, executable, directory, seed, echo=echo
+    )
+    basedir = config_data['basedir']
+    capacity_config = get_capacity_config(config_data)
+    workers = config_data.get('workers') or []
+    i = capacity_config['worker']
+    if i >= len(workers) or workers[i].get('type', 'sipp') != 'sipp':
+        raise RuntimeError("The capacity search needs a sipp worker, got %s" % i)
+    worker_config = workers[i]
+    parameter = capacity_config['parameter']
+
+    metrics = Metrics()
+    with setup_session(
+        config_data,
+        apiurl,
+        directory,
+        metrics,
+        no_setup=no_setup,
+        no_teardown=no_teardown,
+        parallelism=parallelism,
+        api_timeout=api_timeout,
+        api_retries=api_retries,
+        verbose=verbose,
+        echo=echo,
+    ) as (apiurl, stored_responses):
+        scenarios = ScenarioCache(directory, basedir)
+        # the instances keep their ports across the measurement windows
+        allocator = PortAllocator(
+            signalling_ports, media_ports, control_port_base, source_ips
+        )
+        ports = [
+            allocator.allocate(media_ports=worker_config.get('media_ports', 0))
+            for _ in range(get_int_from_config(worker_config, 'number', 1))
+        ]
+
+        def measure(value):
+            window_config = build_window_config(
+                worker_config, parameter, value, capacity_config['window']
+            )
+            testers = []
+            for j in range(len(ports)):
+                tester = SippWorker(
+                    worker_id="%06d_%06d" % (i, j),
+                    config=window_config,
+                    target=target,
+                    executable=executable,
+                    directory=directory,
+                    basedir=basedir,
+                    log=echo,
+                    stored_responses=stored_responses,
+                    verbose=verbose,
+                    scenarios=scenarios,
+                    metrics=metrics,
+                    ports=ports[j],
+                )
+                tester.setup()
+                testers.append(tester)
+            timeline = run_workers(testers)
+            summary = merge_stats([tester.get_stats() for tester in testers])
+            return get_point(
+                value,
+                summary.summary(elapsed=timeline.elapsed() / 1000.0),
+                capacity_config['slo'],
+            )
+
+        echo("\nSearching the capacity (%s):" % parameter)
+        best, points = search_capacity(
+            measure,
+            capacity_config['start'],
+            capacity_config['max'],
+            factor=capacity_config['factor'],
+            precision=capacity_config['precision'],
+            log=echo,
+        )
+
+        echo("\nMeasured points (%s):" % parameter)
+        for point in points:
+            echo(format_point(point))
+
+        if output is not None:
+            with open(output, 'w') as f:
+                json.dump(
+                    {
+                        'parameter': parameter,
+                        'max_sustainable': best,
+                        'slo': capacity_config['slo'],
+                        'points': points,
+                    },
+                    f,
+                    indent=2,
+                )
+
+        if best is None:
+            raise RuntimeError(
+                "\nNo %s meets the service level objectives!" % parameter
+            )
+        echo("\nMaximum sustainable %s: %s" % (parameter, best))
+        return best
+
+
+@with_log_sink
+def run_matrix(
+    config,
+    target='sbc:5060',
+    executable='sipp',
+    directory=None,
+    seed=None,
+    apiurl=None,
+    no_setup=False,
+    no_teardown=False,
+    parallelism=1,
+    api_timeout=60.0,
+    api_retries=3,
+    control_port_base=8888,
+    signalling_ports=SIGNALLING_PORTS,
+    media_ports=MEDIA_PORTS,
+    source_ips=(),
+    output=None,
+    verbose=False,
+    echo=print,
+):
+    """
+    Run the setup once, then the worker selected by the `matrix` section with
+    each combination of the parameter values, in batches of concurrent cells,
+    and finally the check and the teardown. Return a row of results by cell,
+    raise RuntimeError once the results are reported when a cell failed.
+    """
+    from .engine import run_workers
+    from .matrix import (
+        build_cell_config,
+        format_table,
+        get_cells,
+        get_matrix_config,
+        get_row,
+        schedule_cells,
+        write_csv,
+    )
+    from .metrics import Metrics
+    from .sipp import SippWorker
+    from .stats import format_summary, merge_stats
+    from .templates import ScenarioCache
+    from .uac import UACWorker
+
+    config_data, directory = start_run(
+        config, target, executable, directory, seed, echo=echo
+    )
+    basedir = config_data['basedir']
+    matrix_config = get_matrix_config(config_data)
+    worker_config = config_data['workers'][matrix_config['worker']]
+    names = list(matrix_config['parameters'])
+    cells = get_cells(matrix_config['parameters'])
+    cell_configs = [build_cell_config(worker_config, cell) for cell in cells]
+    batches = schedule_cells(
+        [get_int_from_config(c, 'number', 1) for c in cell_configs],
+        matrix_config['parallel'],
+        matrix_config['max_instances'],
+    )
+
+    metrics = Metrics()
+    with setup_session(
+        config_data,
+        apiurl,
+        directory,
+        metrics,
+        no_setup=no_setup,
+        no_teardown=no_teardown,
+        parallelism=parallelism,
+        api_timeout=api_timeout,
+        api_retries=api_retries,
+        verbose=verbose,
+        echo=echo,
+    ) as (apiurl, stored_responses):
+        scenarios = ScenarioCache(directory, basedir)
+        # the instances of the concurrent cells of a batch run on disjoint
+        # ports, reused by the cells of the next batches
+        allocator = PortAllocator(
+            signalling_ports, media_ports, control_port_base, source_ips
+        )
+        ports = {}
+        rows = [None] * len(cells)
+
+        echo(
+            "\nRunning %d cells in %d batches (%s):"
+            % (len(cells), len(batches), ', '.join(names))
+        )
+        for batch in batches:
+            testers = {}
+            for slot, k in enumerate(batch):
+                cell_config = cell_configs[k]
+                testers[k] = []
+                for j in range(get_int_from_config(cell_config, 'number', 1)):
+                    if (slot, j) not in ports:
+                        ports[slot, j] = allocator.allocate(
+                            media_ports=cell_config.get('media_ports', 0)
+                        )
+                    # a worker group by cell
+                    worker_id = "%06d_%06d" % (k, j)
+                    if cell_config.get('type', 'sipp') == 'uac':
+                        tester = UACWorker(
+                            worker_id=worker_id,
+                            config=cell_config,
+                            target=target,
+                            log=echo,
+                            stored_responses=stored_responses,
+                            verbose=verbose,
+                            metrics=metrics,
+                            ports=ports[slot, j],
+                        )
+                    else:
+                        tester = SippWorker(
+                            worker_id=worker_id,
+                            config=cell_config,
+                            target=target,
+                            executable=executable,
+                            directory=directory,
+                            basedir=basedir,
+                            log=echo,
+                            stored_responses=stored_responses,
+                            verbose=verbose,
+                            scenarios=scenarios,
+                            metrics=metrics,
+                            ports=ports[slot, j],
+                        )
+                    tester.setup()
+                    testers[k].append(tester)
+            run_workers([t for k in batch for t in testers[k]])
+            for k in batch:
+                exit_status = 0
+                for tester in testers[k]:
+                    tester.debug()
+                    exit_status = exit_status or tester.get_exit_status()
+                    tester.teardown()
+                summary = merge_stats([t.get_stats() for t in testers[k]])
+                rows[k] = get_row(cells[k], summary.summary(), exit_status)
+                echo(
+                    "[%s] %s, exit status = %s"
+                    % (
+                        ', '.join('%s=%s' % item for item in cells[k].items()),
+                        format_summary(summary.summary()),
+                        exit_status,
+                    )
+                )
+
+        echo("\nMatrix results:")
+        for line in format_table(names, rows):
+            echo(line)
+
+        if output is not None:
+            write_csv(output, names, rows)
+            echo("\nResults written to %s" % output)
+
+        failed = [row for row in rows if row['exit_status'] != 0]
+        if failed:
+            raise RuntimeError(
+                "\nError detected in %d of %d cells, aborted!"
+                % (len(failed), len(rows))
+            )
+        return rows
+
+
+def get_injection_files(worker_config, stored_responses, number, agents=0):
+    """
+    Return the sipp injection file of each instance of a worker using the
+    rows of a bulk setup step, None for the other workers
+    """
+    from .bulk import shard_injection_file
+
+    name = worker_config.get('injection', None)
+    if name is None:
+        return None
+    if agents:
+        raise RuntimeError("Injection files are not supported with agents")
+    bulk = stored_responses.get(name)
+    if not isinstance(bulk, dict) or not bulk.get('filename'):
+        raise RuntimeError("No bulk setup step with fields stored as %s" % name)
+    return shard_injection_file(
+        bulk['filename'], number, worker_config.get('injection_order', 'SEQUENTIAL')
+    )
+
+
+def get_injection_file(filenames, j):
+    """
+    Return the injection file of the j-th instance of a worker, the instances
+    beyond the number of rows sharing the files
+    """
+    if not filenames:
+        return None
+    return filenames[j % len(filenames)]
+
+
+def do_delay(config, tracer=None):
+    from .tracing import span
+
     delay = config.get('delay', 0)
     if delay:
-        time.sleep(delay)
+        with span(tracer, 'delay', delay=delay):
+            time.sleep(delay)
 
 
-def APIcall(apiurl, config, stored_responses, verbose, echo=print):
+def APIcall(
+    apiurl,
+    config,
+    stored_responses,
+    verbose,
+    echo=print,
+    client=None,
+    any_response=False,
+):
+    from .api import api_client
+
     return api_client(
         apiurl=apiurl,
         config=config,
         stored_responses=stored_responses,
         verbose=verbose,
         echo=echo,
+        client=client,
+        any_response=any_response,
     )
 
 
-def kamailioXHTTP(config, verbose, echo=print):
-    do_delay(config)
-    if config.get('method', "POST") == 'POST':
-        uri = config.get('uri', "")
-        payload = config.get('payload', {})
-        response = requests.post(uri, json=payload)
-        echo("HTTP response code: %d" % response.status_code)
-        if response.status_code != 200:
-            echo("Payload: %s" % payload)
-            echo("Response: %s" % response.text)
-            raise RuntimeError()
-        if verbose:
-            echo("Payload: %s" % payload)
-            echo("Response: %s" % response.text)
+def echo_api_stats(client, echo=print):
+    stats = client.get_stats()
+    if stats['calls']:
+        echo(
+            "\nAPI calls: %d, errors = %d, total = %.3f ms, mean = %.3f ms, "
+            "p50 = %.3f ms, p95 = %.3f ms, max = %.3f ms"
+            % (
+                stats['calls'],
+                stats['errors'],
+                stats['total'],
+                stats['mean'],
+                stats['p50'],
+                stats['p95'],
+                stats['max'],
+            )
+        )
+
+
+def export_trace(tracer, trace=None, otlp_endpoint=None, echo=print):
+    if trace is not None:
+        tracer.write_chrome_trace(trace)
+        echo("Trace of %d spans written to %s" % (len(tracer.get_spans()), trace))
+    if otlp_endpoint is not None:
+        try:
+            tracer.export_otlp(otlp_endpoint)
+        except RuntimeError as e:
+            # the run is over, a collector down does not change its result
+            echo(str(e))
+        else:
+            echo("Trace %s exported to %s" % (tracer.trace_id, otlp_endpoint))
 
 
-def do_check(config_data, apiurl, stored_responses, verbose, echo=print):
+def do_setup(
+    config_data,
+    apiurl,
+    stored_responses,
+    verbose,
+    parallelism=1,
+    echo=print,
+    client=None,
+    metrics=None,
+    directory=None,
+    tracer=None,
+):
+    from .bulk import is_bulk_step, run_bulk_step
+    from .steps import resolve_hosts, run_steps
+
+    setup = config_data.get('setup', None) or []
+    hosts = resolve_hosts(setup, apiurl)
+    if directory is None:
+        directory = tempfile.mkdtemp()
+
+    def setup_step(i, setup_config):
+        if setup_config.get('type', 'api') == 'api':
+            store_response = setup_config.get('store_response', None)
+            if is_bulk_step(setup_config):
+                response = run_bulk_step(
+                    lambda config, values: APIcall(
+                        hosts[i], config, values, verbose, client=client
+                    ),
+                    setup_config,
+                    stored_responses,
+                    filename=os.path.join(
+                        directory, 'bulk-%s.csv' % (store_response or i)
+                    ),
+                    concurrency=int(setup_config.get('concurrency', 10)),
+                )
+                echo(
+                    "Provisioned %d items in bulk with %s"
+                    % (response['count'], setup_config.get('uri'))
+                )
+            else:
+                response = APIcall(
+                    hosts[i], setup_config, stored_responses, verbose, client=client
+                )
+            if store_response:
+                stored_responses[store_response] = response
+
+    run_steps(
+        setup, setup_step, parallelism, metrics=metrics, phase='setup', tracer=tracer
+    )
+    return hosts[-1] if hosts else apiurl
+
+
+def do_check(
+    config_data,
+    apiurl,
+    stored_responses,
+    verbose,
+    parallelism=1,
+    echo=print,
+    client=None,
+    metrics=None,
+    tracer=None,
+):
+    from .checks import poll_check
+    from .steps import resolve_hosts, run_steps
+
     check = config_data.get('check', None)
     if check is not None:
         echo("Starting check process...")
-        for _, check_config in enumerate(check):
-            do_delay(check_config)
+        hosts = resolve_hosts(check, apiurl)
+
+        def check_step(i, check_config):
+            do_delay(check_config, tracer)
             if check_config.get('type', 'api') == 'api':
                 store_response = check_config.get('store_response', None)
-                apiurl = check_config.get('host', apiurl)
-                response = APIcall(
-                    apiurl, check_config, stored_responses, verbose, echo=echo
+                polling = check_config.get('timeout', None) is not None
+                # the response is compared by poll_check
+                call_config = dict(check_config, expected_response=None)
+                response, elapsed, attempts = poll_check(
+                    lambda: APIcall(
+                        hosts[i],
+                        call_config,
+                        stored_responses,
+                        verbose,
+                        echo=echo if verbose or not polling else lambda _: None,
+                        client=client,
+                        any_response=True,
+                    ),
+                    check_config,
+                    log=echo,
+                )
+                echo(
+                    "OK: check %d (%s) converged in %.3f s after %d attempts"
+                    % (i, check_config.get('uri'), elapsed, attempts)
                 )
+                if metrics is not None:
+                    metrics.observe(
+                        'canyantester_check_convergence_seconds',
+                        {'step': str(i)},
+                        elapsed,
+                    )
                 if store_response:
                     stored_responses[store_response] = response
 
+        run_steps(
+            check,
+            check_step,
+            parallelism,
+            metrics=metrics,
+            phase='check',
+            tracer=tracer,
+        )
+
 
 def do_teardown(
-    config_data, no_teardown, apiurl, stored_responses, verbose, echo=print
+    config_data,
+    no_teardown,
+    apiurl,
+    stored_responses,
+    verbose,
+    parallelism=1,
+    echo=print,
+    client=None,
+    metrics=None,
+    keep=None,
+    tracer=None,
 ):
+    from .bulk import is_bulk_step, run_bulk_step
+    from .fixtures import is_fixture_step
+    from .kamailio import kamailioXHTTP, wait_until_ready
+    from .steps import build_teardown_dependencies, resolve_hosts, run_steps
+
     echo("Starting teardown process...")
     teardown = config_data.get('teardown', None)
     if not no_teardown and teardown is not None:
-        for _, teardown_config in enumerate(teardown):
-            if teardown_config.get('type', 'api') == 'api':
+        hosts = resolve_hosts(teardown, apiurl)
+
+        def teardown_step(i, teardown_config):
+            if keep and is_fixture_step(teardown_config, keep):
+                if verbose:
+                    echo("Keeping cached fixtures: %s" % teardown_config.get('uri'))
+                return
+            if teardown_config.get('type', 'api') == 'api' and is_bulk_step(
+                teardown_config
+            ):
+                run_bulk_step(
+                    lambda config, values: APIcall(
+                        hosts[i], config, values, verbose, client=client
+                    ),
+                    teardown_config,
+                    stored_responses,
+                    concurrency=int(teardown_config.get('concurrency', 10)),
+                )
+            elif teardown_config.get('type', 'api') == 'api':
                 store_response = teardown_config.get('store_response', None)
-                apiurl = teardown_config.get('host', apiurl)
-                response = APIcall(apiurl, teardown_config, stored_responses, verbose)
+                response = APIcall(
+                    hosts[i], teardown_config, stored_responses, verbose, client=client
+                )
                 if store_response:
                     stored_responses[store_response] = response
             elif teardown_config.get('type', None) == 'kamailio_xhttp':
-                kamailioXHTTP(teardown_config, verbose)
-                time.sleep(5)
+                do_delay(teardown_config, tracer)
+                kamailioXHTTP(teardown_config, verbose, client=client)
+                wait_until_ready(teardown_config, echo=echo, client=client)
+
+        run_steps(
+            teardown,
+            teardown_step,
+            parallelism,
+            metrics=metrics,
+            phase='teardown',
+            dependencies=build_teardown_dependencies(
+                teardown, config_data.get('setup', None)
+            ),
+            tracer=tracer,
+        )
 
     else:
         echo("Skipping teardown procedure...")
@@ -1,14 +1,41 @@
 import json
 import re
-import requests
-import socket
 
-from dotty_dict import dotty  # type: ignore
-from typing import Callable
+from typing import Callable, Optional
 from uuid import uuid4
 
+from .client import HTTPClient
+
 
 RE_VARIABLE = re.compile(r'\{([^}\.]+)\.([^}]+)\}').search
+RE_VARIABLES = re.compile(r'\{([^}\.]+)\.([^}]+)\}').finditer
+RE_VARIABLES_SUB = re.compile(r'\{([^}\.]+)\.([^}]+)\}').sub
+
+
+def get_stored_value(stored_responses: dict, name: str, field: str):
+    """
+    Return the value of a dotted field of a stored response, e.g. `domain.id`
+    """
+    value = stored_responses[name]
+    for key in field.split('.'):
+        if isinstance(value, (list, tuple)):
+            value = value[int(key)]
+        else:
+            value = value[key]
+    return value
+
+
+def resolve_variables(value: str, stored_responses: dict) -> str:
+    """
+    Replace all the `{name.field}` placeholders of a string with the values of
+    the stored responses
+    """
+    return RE_VARIABLES_SUB(
+        lambda match: str(
+            get_stored_value(stored_responses, match.group(1), match.group(2))
+        ),
+        value,
+    )
 
 
 def api_client(
@@ -17,35 +44,34 @@ def api_client(
     stored_responses: dict,
     verbose: bool = False,
     echo: Callable = print,
+    client: Optional[HTTPClient] = None,
+    any_response: bool = False,
 ):
+    """
+    Call the API of a step and return its parsed response. The responses of
+    POST requests other than JSON objects are only returned when compared or
+    with `any_response`, e.g. for the check steps comparing them afterwards.
+    """
+    if client is None:
+        client = HTTPClient()
     uri = config.get('uri', '/')
     method = config.get('method', 'POST')
     payload = config.get('payload', None)
     expected_response = config.get('expected_response', None)
-    stored_responses['random'] = {'uuid4': uuid4()}
-    ipaddr = socket.gethostbyname(socket.gethostname())
+    random = {'uuid4': uuid4()}
+    stored_responses['random'] = random
+    ipaddr = client.get_ipaddr()
     stored_responses['ipaddr'] = {'ip': ipaddr}
+    # steps may run concurrently, resolve the per-call values from a local copy
+    stored_responses = dict(stored_responses, random=random, ipaddr={'ip': ipaddr})
 
-    variable_match = RE_VARIABLE(uri)
-    if variable_match is not None:
-        stored_response = dotty(stored_responses[variable_match.group(1)])
-        uri = uri.replace(
-            variable_match.group(0), str(stored_response[variable_match.group(2)])
-        )
-
+    uri = resolve_variables(uri, stored_responses)
     if payload:
         for k, v in payload.items():
-            if not isinstance(v, str):
-                continue
-            variable_match = RE_VARIABLE(v)
-            if variable_match is None:
-                continue
-            stored_response = dotty(stored_responses[variable_match.group(1)])
-            payload[k] = v.replace(
-                variable_match.group(0), str(stored_response[variable_match.group(2)])
-            )
+            if isinstance(v, str):
+                payload[k] = resolve_variables(v, stored_responses)
     if method == 'POST':
-        response = requests.post("%s%s" % (apiurl, uri), json=payload)
+        response = client.post("%s%s" % (apiurl, uri), json=payload)
         if response.status_code != 200:
             echo("HTTP response code: %d" % response.status_code)
             echo("Payload: %s" % payload)
@@ -65,12 +91,19 @@ def api_client(
                     echo("Expected: %s" % expected_response)
                     echo("Response: %s" % data)
                 return data
-        elif isinstance(data, dict):
+        elif any_response or isinstance(data, dict):
             return data
         else:
             return None
+    elif method == 'GET':
+        response = client.request('GET', "%s%s" % (apiurl, uri))
+        if response.status_code != 200:
+            echo("HTTP response code: %d" % response.status_code)
+            echo("Response: %s" % response.text)
+            raise RuntimeError()
+        return json.loads(response.text)
     elif method == 'DELETE':
-        response = requests.delete("%s%s" % (apiurl, uri))
+        response = client.delete("%s%s" % (apiurl, uri))
         if response.status_code != 200:
             echo(response)
             raise RuntimeError()
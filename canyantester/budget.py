@@ -0,0 +1,83 @@
+import asyncio
+
+from .engine import RunAborted
+
+
+def get_budget_config(config_data):
+    """
+    Return the `failure_budget` section of a configuration, or None when the
+    run has no budget
+    """
+    budget = config_data.get('failure_budget')
+    if not budget:
+        return None
+    if (
+        budget.get('max_failed_runs') is None
+        and budget.get('max_failure_ratio') is None
+    ):
+        raise RuntimeError(
+            "The failure budget requires max_failed_runs or max_failure_ratio"
+        )
+    ratio = budget.get('max_failure_ratio')
+    if ratio is not None and not 0 <= float(ratio) <= 1:
+        raise RuntimeError("Invalid max_failure_ratio %s, expected 0..1" % ratio)
+    return budget
+
+
+def check_budget(workers, budget):
+    """
+    Return the reason why the workers exceeded the failure budget, or None.
+    The failed-call ratio is evaluated only after `min_calls` calls.
+    """
+    max_failed_runs = budget.get('max_failed_runs')
+    if max_failed_runs is not None:
+        failed_runs = sum(
+            len([code for code in worker.get_exit_codes() or [] if code != 0])
+            for worker in workers
+        )
+        if failed_runs > int(max_failed_runs):
+            return "%d failed runs (budget = %d)" % (failed_runs, int(max_failed_runs))
+    max_failure_ratio = budget.get('max_failure_ratio')
+    if max_failure_ratio is not None:
+        calls = failed = 0
+        for worker in workers:
+            stats = worker.get_stats()
+            if stats is None:
+                continue
+            counters = stats.get_counters()
+            calls += counters['TotalCallCreated']
+            failed += counters['FailedCall']
+        if calls and calls >= int(budget.get('min_calls', 100)):
+            ratio = float(failed) / calls
+            if ratio > float(max_failure_ratio):
+                return "%d failed calls out of %d (%.1f%%, budget = %.1f%%)" % (
+                    failed,
+                    calls,
+                    100 * ratio,
+                    100 * float(max_failure_ratio),
+                )
+    return None
+
+
+class FailureBudget(object):
+    """
+    Engine monitor checking the failure budget of the whole run every
+    `interval` seconds: when it is exceeded, the run is aborted, cancelling
+    the pending repeats and terminating the running sipp processes.
+    """
+
+    def __init__(self, budget, log=print):
+        self._budget = budget
+        self._interval = float(budget.get('interval', 1))
+        self._log = log
+
+    async def __call__(self, workers, timeline):
+        while True:
+            await asyncio.sleep(self._interval)
+            reason = check_budget(workers, self._budget)
+            if reason is not None:
+                self._log(
+                    "\nFailure budget exceeded at %.3f s: %s"
+                    % (timeline.elapsed() / 1000.0, reason)
+                )
+                raise RunAborted(reason)
@@ -0,0 +1,129 @@
+import copy
+import csv
+import itertools
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import resolve_variables
+
+INJECTION_ORDERS = ('SEQUENTIAL', 'RANDOM', 'USER')
+
+
+def is_bulk_step(config):
+    return 'count' in config or 'foreach' in config
+
+
+def get_bulk_concurrency(steps, default=10):
+    """
+    Return the highest number of concurrent calls of the bulk steps
+    """
+    return max(
+        [default]
+        + [
+            int(config.get('concurrency', 10))
+            for config in steps
+            if is_bulk_step(config)
+        ]
+    )
+
+
+def iter_rows(filename):
+    with open(filename, newline='') as f:
+        for row in csv.reader(f, delimiter=';'):
+            yield row
+
+
+def iter_items(config, stored_responses):
+    """
+    Yield the items of a bulk step: `{item.index}` and `{item.value}` for a
+    `count` or a `foreach` list, plus `{item.<column>}` for the rows of the
+    file of a previous bulk step named by `foreach`.
+    """
+    foreach = config.get('foreach')
+    if isinstance(foreach, str):
+        filename = stored_responses[foreach].get('filename')
+        if filename is None:
+            raise RuntimeError("Bulk step %s has no fields to iterate on" % foreach)
+        for index, row in enumerate(iter_rows(filename)):
+            item = dict((str(column), value) for column, value in enumerate(row))
+            item.update({'index': index, 'value': row[0] if row else None})
+            yield item
+    elif foreach is not None:
+        for index, value in enumerate(foreach):
+            yield {'index': index, 'value': value}
+    else:
+        for index in range(int(config['count'])):
+            yield {'index': index, 'value': index}
+
+
+def run_bulk_step(call, config, stored_responses, filename=None, concurrency=10):
+    """
+    Run `call(config, stored_responses)` once per item of a bulk step, up to
+    `concurrency` calls at a time and `batch_size` items in memory, and stream
+    its `fields`, resolved against the item and its response, to a CSV file.
+
+    Return the value stored for the step: the number of items and the file.
+    """
+    name = config.get('store_response', None)
+    fields = config.get('fields', None)
+    batch_size = int(config.get('batch_size', 100))
+
+    def run_item(item):
+        values = dict(stored_responses, item=item)
+        step = dict(config, payload=copy.deepcopy(config.get('payload', None)))
+        response = call(step, values)
+        if fields:
+            if name:
+                values[name] = response
+            return [resolve_variables(str(field), values) for field in fields]
+        return None
+
+    if not fields:
+        filename = None
+    count = 0
+    items = iter_items(config, stored_responses)
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        f = open(filename, 'w', newline='') if filename else None
+        try:
+            writer = csv.writer(f, delimiter=';', lineterminator='\n') if f else None
+            while True:
+                batch = list(itertools.islice(items, batch_size))
+                if not batch:
+                    break
+                for row in executor.map(run_item, batch):
+                    if writer is not None:
+                        writer.writerow(row)
+                    count += 1
+        finally:
+            if f is not None:
+                f.close()
+    return {'count': count, 'filename': filename}
+
+
+def shard_injection_file(filename, shards, order='SEQUENTIAL'):
+    """
+    Split the rows of a bulk step file in contiguous blocks into one sipp
+    injection file per worker instance, so that each instance uses distinct
+    rows, with at most one file per row. Return the shard filenames.
+    """
+    if order not in INJECTION_ORDERS:
+        raise RuntimeError(
+            "Unknown injection order %s, expected one of: %s"
+            % (order, ', '.join(INJECTION_ORDERS))
+        )
+    with open(filename) as f:
+        rows = sum(1 for _ in f)
+    if not rows:
+        raise RuntimeError("No rows to inject in %s" % filename)
+    shards = min(shards, rows)
+    base, extension = os.path.splitext(filename)
+    filenames = ['%s-%06d%s' % (base, j, extension) for j in range(shards)]
+    with open(filename) as f:
+        # the first rows % shards files get one more row
+        for j, shard in enumerate(filenames):
+            size = rows // shards + (1 if j < rows % shards else 0)
+            with open(shard, 'w') as out:
+                out.write(order + '\n')
+                out.writelines(itertools.islice(f, size))
+    return filenames
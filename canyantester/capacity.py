@@ -0,0 +1,167 @@
+import copy
+
+PARAMETERS = ('call_rate', 'call_limit')
+PERCENTILES = (50, 90, 95, 99)
+
+
+def get_capacity_config(config_data):
+    """
+    Return the `capacity` section of a configuration, with its defaults
+    """
+    capacity = dict(config_data.get('capacity') or {})
+    capacity.setdefault('worker', 0)
+    capacity.setdefault('parameter', 'call_rate')
+    capacity.setdefault('start', 10)
+    capacity.setdefault('max', 10000)
+    capacity.setdefault('factor', 2)
+    capacity.setdefault('precision', 1)
+    capacity.setdefault('window', 30)
+    capacity.setdefault('slo', {})
+    if capacity['parameter'] not in PARAMETERS:
+        raise RuntimeError(
+            "Unknown capacity parameter %s, expected one of: %s"
+            % (capacity['parameter'], ', '.join(PARAMETERS))
+        )
+    if capacity['start'] < 1 or capacity['max'] < capacity['start']:
+        raise RuntimeError("The capacity search needs 1 <= start <= max")
+    if capacity['factor'] <= 1 or capacity['precision'] < 1:
+        raise RuntimeError("The capacity search needs factor > 1 and precision >= 1")
+    response_time = capacity['slo'].get('max_response_time')
+    if response_time and response_time.get('percentile', 95) not in PERCENTILES:
+        raise RuntimeError(
+            "Unsupported response time percentile %s, expected one of: %s"
+            % (response_time['percentile'], ', '.join(map(str, PERCENTILES)))
+        )
+    return capacity
+
+
+def check_slo(summary, slo):
+    """
+    Check the summary of a measurement window against the service level
+    objectives, return the violation or None when they are met
+    """
+    if not summary['calls']:
+        return "no calls"
+    failure_rate = float(summary['failed']) / summary['calls']
+    max_failure_rate = slo.get('max_failure_rate', 0.0)
+    if failure_rate > max_failure_rate:
+        return "failure rate %.4f > %.4f" % (failure_rate, max_failure_rate)
+    response_time = slo.get('max_response_time')
+    if response_time:
+        percentile = response_time.get('percentile', 95)
+        value = summary['response_time'].get('p%d' % percentile)
+        if value is None:
+            return "no response times"
+        if value > response_time['value']:
+            return "p%d response time %.3f ms > %.3f ms" % (
+                percentile,
+                value,
+                response_time['value'],
+            )
+    return None
+
+
+def build_window_config(worker_config, parameter, value, window):
+    """
+    Return a copy of the configuration of a sipp worker running a single
+    measurement window of `window` seconds at the given rate or concurrency
+    """
+    config = copy.deepcopy(worker_config)
+    config.pop('load_profile', None)
+    config['repeat'] = 1
+    config['stats'] = True
+    config[parameter] = value
+    if parameter == 'call_rate':
+        config['call_number'] = value * window
+        config.setdefault('call_rate_period', 1000)
+        if 'call_limit' not in config:
+            config['call_limit'] = value * window
+    else:
+        # fixed concurrency: sipp stops on its own at the end of the window
+        extra_args = config.get('extra_args') or []
+        if isinstance(extra_args, str):
+            extra_args = extra_args.split()
+        config['call_number'] = 2**31 - 1
+        config['extra_args'] = list(extra_args) + ['-timeout', '%ds' % window]
+    return config
+
+
+def get_point(value, summary, slo):
+    reason = check_slo(summary, slo)
+    response_time = summary['response_time']
+    return {
+        'value': value,
+        'passed': reason is None,
+        'reason': reason,
+        'calls': summary['calls'],
+        'failed': summary['failed'],
+        'failure_rate': (
+            float(summary['failed']) / summary['calls'] if summary['calls'] else None
+        ),
+        'throughput': summary['throughput'],
+        'p50': response_time.get('p50'),
+        'p95': response_time.get('p95'),
+        'p99': response_time.get('p99'),
+    }
+
+
+def search_capacity(measure, start, maximum, factor=2, precision=1, log=print):
+    """
+    Search the highest value meeting the objectives: the value is multiplied
+    by `factor` until a window fails or `maximum` is reached, then a binary
+    search narrows the last range down to `precision`. The value grows by one
+    at least at each step.
+
+    `measure(value)` runs a measurement window and returns its point. Return
+    the highest passing value, None when even `start` fails, and the points
+    sorted by value.
+    """
+    points = []
+
+    def run(value):
+        point = measure(value)
+        points.append(point)
+        log(
+            "Window at %s: %s"
+            % (value, 'OK' if point['passed'] else 'FAILED (%s)' % point['reason'])
+        )
+        return point['passed']
+
+    best = None
+    value = start
+    while run(value):
+        best = value
+        if value >= maximum:
+            break
+        # a small value times a small factor is still rounded up
+        value = min(max(value + 1, int(value * factor)), maximum)
+    else:
+        if best is not None:
+            low, high = best, value
+            while high - low > precision:
+                value = (low + high) // 2
+                if run(value):
+                    low = value
+                else:
+                    high = value
+            best = low
+    return best, sorted(points, key=lambda point: point['value'])
+
+
+def format_point(point):
+    def ms(value):
+        return '-' if value is None else '%.3f' % value
+
+    return (
+        "%8s %-6s calls = %d, failed = %d, throughput = %.3f cps, "
+        "p50 = %s ms, p95 = %s ms, p99 = %s ms"
+    ) % (
+        point['value'],
+        'OK' if point['passed'] else 'FAILED',
+        point['calls'],
+        point['failed'],
+        point['throughput'],
+        ms(point['p50']),
+        ms(point['p95']),
+        ms(point['p99']),
+    )
@@ -0,0 +1,105 @@
+import json
+import time
+
+from .api import get_stored_value
+
+
+MATCH_TYPES = ('exact', 'subset')
+MISSING = object()
+
+
+def match_subset(expected, actual):
+    """
+    Whether all the keys of the expected dicts are in the actual ones with
+    matching values; lists match item by item and must have the same length
+    """
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and all(
+            key in actual and match_subset(value, actual[key])
+            for key, value in expected.items()
+        )
+    if isinstance(expected, list):
+        return (
+            isinstance(actual, list)
+            and len(expected) == len(actual)
+            and all(match_subset(e, a) for e, a in zip(expected, actual))
+        )
+    return expected == actual
+
+
+def get_path_value(data, path):
+    try:
+        return get_stored_value({'response': data}, 'response', path)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return MISSING
+
+
+def compare_response(config, data):
+    """
+    Compare a response with the `expected_response` of a check step, exactly
+    or as a subset depending on `match`, and with its `expected_paths`, a map
+    of dotted paths to their expected values. Return the mismatch or None.
+    """
+    expected_response = config.get('expected_response', None)
+    if expected_response:
+        expected = json.loads(expected_response)
+        if config.get('match', 'exact') == 'subset':
+            if not match_subset(expected, data):
+                return "response is not a superset of the expected one"
+        elif data != expected:
+            return "response differs from the expected one"
+    for path, expected in (config.get('expected_paths', None) or {}).items():
+        value = get_path_value(data, str(path))
+        if value is MISSING:
+            return "%s is missing" % path
+        if value != expected:
+            return "%s is %r, expected %r" % (path, value, expected)
+    return None
+
+
+def poll_check(call, config, log=print, sleep=time.sleep):
+    """
+    Call the API of a check step until its response matches or its `timeout`
+    in seconds is over, waiting `poll_interval` seconds after the first
+    attempt, multiplied by `backoff` after each one up to `max_interval`.
+    Without a `timeout` the API is called once.
+
+    Return the response, the time it took to converge in seconds and the
+    number of attempts, or raise RuntimeError.
+    """
+    if config.get('match', 'exact') not in MATCH_TYPES:
+        raise RuntimeError(
+            "Unknown match %s, expected one of: %s"
+            % (config['match'], ', '.join(MATCH_TYPES))
+        )
+    timeout = config.get('timeout', None)
+    interval = float(config.get('poll_interval', 0.5))
+    backoff = float(config.get('backoff', 2))
+    max_interval = float(config.get('max_interval', 10))
+    started_at = time.monotonic()
+    deadline = None if timeout is None else started_at + float(timeout)
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            data = call()
+        except RuntimeError as e:
+            data, reason = None, str(e) or "API call failed"
+        else:
+            reason = compare_response(config, data)
+        elapsed = time.monotonic() - started_at
+        if reason is None:
+            return data, elapsed, attempts
+        if deadline is None or time.monotonic() + interval > deadline:
+            log("NO Match! exiting...")
+            if config.get('expected_response', None):
+                log("Expected: %s" % config['expected_response'])
+            if config.get('expected_paths', None):
+                log("Expected paths: %s" % config['expected_paths'])
+            log("Response: %s" % data)
+            raise RuntimeError(
+                "Check %s failed after %d attempts in %.3f s: %s"
+                % (config.get('uri'), attempts, elapsed, reason)
+            )
+        sleep(interval)
+        interval = min(interval * backoff, max_interval)
@@ -0,0 +1,162 @@
+import socket
+import threading
+import time
+
+from urllib.parse import urlparse
+
+from .utils import percentile
+
+
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+def new_session(pool_maxsize=10):
+    """
+    Return a requests session keeping up to `pool_maxsize` connections alive
+    for each host, requests being imported only when the API is called
+    """
+    import requests
+
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class HTTPClient(object):
+    """
+    Run-scoped HTTP client shared by the API steps and the kamailio_xhttp workers.
+
+    It keeps a pool of keep-alive connections for each host, retries with an
+    exponential backoff the requests failing with a 5xx status code or with a
+    connection error and records the latency of every call, and its span
+    when the run is traced. A `session` kept
+    by a warm process is reused across its runs and not closed.
+    """
+
+    def __init__(
+        self,
+        timeout=60.0,
+        retries=3,
+        backoff_factor=0.5,
+        pool_maxsize=10,
+        metrics=None,
+        session=None,
+        tracer=None,
+    ):
+        self._timeout = timeout
+        self._metrics = metrics
+        self._tracer = tracer
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._owns_session = session is None
+        self._session = new_session(pool_maxsize) if session is None else session
+        self._ipaddr = None
+        self._lock = threading.Lock()
+        self._calls = []
+
+    def get_ipaddr(self):
+        """
+        IP address of the host running the tester, resolved once per run
+        """
+        if self._ipaddr is None:
+            self._ipaddr = socket.gethostbyname(socket.gethostname())
+        return self._ipaddr
+
+    def request(self, method, url, **kwargs):
+        import requests
+
+        kwargs.setdefault('timeout', self._timeout)
+        attempt = 0
+        while True:
+            started_at = time.monotonic()
+            try:
+                response = self._session.request(method, url, **kwargs)
+            except requests.ConnectionError:
+                self._record(method, url, None, started_at, attempt)
+                if attempt >= self._retries:
+                    raise
+            else:
+                self._record(method, url, response.status_code, started_at, attempt)
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or attempt >= self._retries
+                ):
+                    return response
+            time.sleep(self._backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def _record(self, method, url, status_code, started_at, attempt):
+        ended_at = time.monotonic()
+        call = {
+            'method': method,
+            'url': url,
+            'status_code': status_code,
+            'attempt': attempt,
+            'elapsed': (ended_at - started_at) * 1000.0,
+        }
+        with self._lock:
+            self._calls.append(call)
+        if self._metrics is not None:
+            self._metrics.observe(
+                'canyantester_api_request_duration_seconds',
+                {
+                    'method': method,
+                    'host': urlparse(url).netloc,
+                    'status': status_code or 'error',
+                },
+                call['elapsed'] / 1000.0,
+            )
+        if self._tracer is not None:
+            self._tracer.add(
+                '%s %s' % (method, urlparse(url).path or '/'),
+                started_at,
+                ended_at,
+                {
+                    'method': method,
+                    'url': url,
+                    'status_code': status_code,
+                    'attempt': attempt,
+                },
+                error=status_code is None or status_code >= 400,
+            )
+
+    def get_calls(self):
+        with self._lock:
+            return list(self._calls)
+
+    def get_stats(self):
+        """
+        Number of calls, errors and latency in milliseconds of all the calls
+        """
+        elapsed = sorted(call['elapsed'] for call in self.get_calls())
+        if not elapsed:
+            return {'calls': 0, 'errors': 0, 'total': 0.0}
+        return {
+            'calls': len(elapsed),
+            'errors': len(
+                [
+                    call
+                    for call in self.get_calls()
+                    if call['status_code'] is None or call['status_code'] >= 400
+                ]
+            ),
+            'total': sum(elapsed),
+            'mean': sum(elapsed) / len(elapsed),
+            'p50': percentile(elapsed, 50),
+            'p95': percentile(elapsed, 95),
+            'max': elapsed[-1],
+        }
+
+    def close(self):
+        if self._owns_session:
+            self._session.close()
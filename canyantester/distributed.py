@@ -0,0 +1,528 @@
+import asyncio
+import hmac
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from uuid import uuid4
+
+from .client import HTTPClient
+from .engine import RunAborted, run_workers
+from .metrics import get_worker_group
+from .ports import MEDIA_PORTS, SIGNALLING_PORTS, PortAllocator
+from .profiles import get_profile_monitors
+from .saturation import SaturationMonitor, format_saturation
+from .sipp import SippWorker
+from .stats import SippStats
+from .templates import ScenarioCache
+from .worker import Worker, get_exit_status
+
+
+POLL_INTERVAL = 0.1
+
+
+class CoordinatorHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Coordinator(object):
+    """
+    HTTP endpoint the agents register with. Each agent receives its share of
+    the workers, together with the stored responses of the setup and the start
+    time of the run, and streams back the statistics and exit codes of its
+    workers. An aborted run is notified to the agents in the replies to their
+    progress reports. The agents authenticate with a token shared with the
+    coordinator, sent as a bearer token.
+    """
+
+    def __init__(
+        self,
+        token,
+        address='127.0.0.1',
+        port=8765,
+        log=print,
+        metrics=None,
+        agent_timeout=60,
+    ):
+        if not token:
+            raise RuntimeError("The coordinator needs a token shared with the agents")
+        self._token = token
+        self._log = log
+        self._metrics = metrics
+        self._agent_timeout = agent_timeout
+        self._lock = threading.Lock()
+        self._registered = threading.Condition(self._lock)
+        self._agents = {}
+        self._results = {}
+        self._stats = {}
+        self._aborted = None
+        self._server = CoordinatorHTTPServer((address, port), self._get_handler())
+        self._thread = None
+
+    def get_port(self):
+        return self._server.server_port
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def wait_for_agents(self, number, timeout=None):
+        """
+        Wait for the given number of agents to register and return their ids
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._registered:
+            while len(self._agents) < number:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise RuntimeError(
+                        "Only %d agents of %d registered" % (len(self._agents), number)
+                    )
+                self._registered.wait(remaining)
+            return sorted(self._agents)[:number]
+
+    def assign(self, agent_id, assignment):
+        with self._lock:
+            self._agents[agent_id]['assignment'] = assignment
+
+    def is_alive(self, agent_id):
+        with self._lock:
+            last_seen = self._agents[agent_id]['last_seen']
+        return time.monotonic() - last_seen < self._agent_timeout
+
+    def abort(self, reason):
+        """
+        Ask the agents to stop their workers
+        """
+        with self._lock:
+            self._aborted = reason
+
+    def wait_for_results(self, worker_ids, timeout):
+        """
+        Wait for the agents to report the results of the given workers, return
+        whether all of them did
+        """
+        deadline = time.monotonic() + timeout
+        while any(self.get_result(worker_id) is None for worker_id in worker_ids):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+        return True
+
+    def get_result(self, worker_id):
+        with self._lock:
+            return self._results.get(worker_id)
+
+    def get_stats(self, worker_id):
+        with self._lock:
+            return self._stats.get(worker_id)
+
+    def _seen(self, agent_id):
+        agent = self._agents.get(agent_id)
+        if agent is None:
+            return None
+        agent['last_seen'] = time.monotonic()
+        return agent
+
+    def _register(self, agent_id, data):
+        agent_id = uuid4().hex
+        with self._registered:
+            self._agents[agent_id] = {
+                'hostname': (data or {}).get('hostname'),
+                'assignment': None,
+                'last_seen': time.monotonic(),
+            }
+            self._registered.notify_all()
+        self._log(
+            "Agent %s registered from %s" % (agent_id, (data or {}).get('hostname'))
+        )
+        return 200, {'agent_id': agent_id}
+
+    def _get_assignment(self, agent_id, _data):
+        with self._lock:
+            agent = self._seen(agent_id)
+            if agent is None:
+                return 404, {}
+            if agent['assignment'] is None:
+                return 204, None
+            return 200, agent['assignment']
+
+    def _update_stats(self, workers):
+        stats = {}
+        for worker_id, data in workers.items():
+            if data.get('stats') is not None:
+                stats[worker_id] = SippStats.from_dict(data['stats'])
+        with self._lock:
+            self._stats.update(stats)
+        if self._metrics is not None:
+            for worker_id, worker_stats in stats.items():
+                self._metrics.set_worker_stats(worker_id, worker_stats)
+
+    def _progress(self, agent_id, data):
+        with self._lock:
+            if self._seen(agent_id) is None:
+                return 404, {}
+        self._update_stats(data['workers'])
+        with self._lock:
+            if self._aborted is not None:
+                return 200, {'abort': self._aborted}
+        return 200, {}
+
+    def _finish(self, agent_id, data):
+        with self._lock:
+            if self._seen(agent_id) is None:
+                return 404, {}
+        self._update_stats(data['workers'])
+        with self._lock:
+            for worker_id, result in data['workers'].items():
+                self._results[worker_id] = {
+                    'exit_codes': result['exit_codes'],
+                    'durations': result.get('durations'),
+                }
+        return 200, {}
+
+    def _is_authorized(self, authorization):
+        return hmac.compare_digest(
+            (authorization or '').encode('utf-8'),
+            ('Bearer %s' % self._token).encode('utf-8'),
+        )
+
+    def _get_handler(self):
+        coordinator = self
+        routes = {
+            ('POST', 'register'): coordinator._register,
+            ('GET', 'assignment'): coordinator._get_assignment,
+            ('POST', 'progress'): coordinator._progress,
+            ('POST', 'results'): coordinator._finish,
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self):
+                # /agents for the registration, /agents/<id>/<action> otherwise
+                parts = self.path.strip('/').split('/')
+                if parts == ['agents']:
+                    agent_id, action = None, 'register'
+                elif len(parts) == 3 and parts[0] == 'agents':
+                    agent_id, action = parts[1], parts[2]
+                else:
+                    agent_id, action = None, None
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                route = routes.get((self.command, action))
+                if not coordinator._is_authorized(self.headers.get('Authorization')):
+                    status_code, data = 401, {}
+                elif route is None:
+                    status_code, data = 404, {}
+                else:
+                    status_code, data = route(
+                        agent_id, json.loads(body.decode('utf-8')) if body else None
+                    )
+                response = b''
+                if data is not None:
+                    response = json.dumps(data, default=str).encode('utf-8')
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class RemoteWorker(Worker):
+    """
+    Worker run by an agent: it completes when the agent reports its exit
+    codes, or fails when the agent stops reporting.
+    """
+
+    def __init__(self, worker_id, config, agent_id, coordinator, log=print):
+        super(RemoteWorker, self).__init__(worker_id)
+        self._config = config
+        self._agent_id = agent_id
+        self._coordinator = coordinator
+        self._log = log
+
+    async def arunner(self):
+        try:
+            await self._wait_for_result()
+        except asyncio.CancelledError:
+            # the agent stops the worker when told the run is aborted
+            self._exit_codes = [-1]
+            raise
+
+    async def _wait_for_result(self):
+        while True:
+            result = self._coordinator.get_result(self._worker_id)
+            if result is not None:
+                self._exit_codes = result['exit_codes']
+                self._durations = result['durations']
+                return
+            if not self._coordinator.is_alive(self._agent_id):
+                self._log(
+                    "[%s] agent %s stopped reporting"
+                    % (self._worker_id, self._agent_id)
+                )
+                self._exit_codes = [-1]
+                return
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def runner(self):
+        run_workers([self])
+
+    def get_stats(self):
+        return self._coordinator.get_stats(self._worker_id) or SippStats()
+
+    def debug(self):
+        non_zero_exit_codes = [code for code in self._exit_codes if code != 0]
+        self._exit_status = get_exit_status(
+            self._exit_codes, self._config.get('max_errors', 0)
+        )
+        self._log(
+            "[%s] runs = %s, errors = %s, exit codes = %s, agent = %s"
+            % (
+                self._worker_id,
+                len(self._exit_codes),
+                len(non_zero_exit_codes),
+                ', '.join(map(str, self._exit_codes)),
+                self._agent_id,
+            )
+        )
+
+
+def shard_workers(instances, agent_ids):
+    """
+    Spread the worker instances across the agents, round robin
+    """
+    shards = dict((agent_id, []) for agent_id in agent_ids)
+    for i, instance in enumerate(instances):
+        shards[agent_ids[i % len(agent_ids)]].append(instance)
+    return shards
+
+
+def read_scenarios(configs, basedir):
+    scenarios = {}
+    for config in configs:
+        scenario = config.get('scenario')
+        if scenario and scenario not in scenarios:
+            with open(os.path.join(basedir, scenario)) as f:
+                scenarios[scenario] = f.read()
+    return scenarios
+
+
+def distribute_workers(
+    coordinator,
+    instances,
+    agents,
+    target,
+    stored_responses,
+    basedir,
+    stats=False,
+    agents_timeout=None,
+    start_delay=5.0,
+    log=print,
+):
+    """
+    Wait for the agents, send each one its share of the `(worker_id, config,
+    seed)` instances and return the synchronized start time, as a UNIX
+    timestamp, and the remote workers.
+    """
+    log("Waiting for %d agents..." % agents)
+    agent_ids = coordinator.wait_for_agents(agents, agents_timeout)
+    shards = shard_workers(instances, agent_ids)
+    group_sizes = {}
+    for worker_id, _, _ in instances:
+        group = get_worker_group(worker_id)
+        group_sizes[group] = group_sizes.get(group, 0) + 1
+    scenarios = read_scenarios([config for _, config, _ in instances], basedir)
+    start_at = time.time() + start_delay
+    workers = []
+    for k, agent_id in enumerate(agent_ids):
+        coordinator.assign(
+            agent_id,
+            {
+                'target': target,
+                'stats': stats,
+                # the agents sharing a host hand out different ports
+                'agent_index': k,
+                'agents': len(agent_ids),
+                'start_at': start_at,
+                'stored_responses': stored_responses,
+                'scenarios': scenarios,
+                'group_sizes': group_sizes,
+                # the instances draw their values from the seeds of the plan
+                'workers': [
+                    {'worker_id': worker_id, 'config': config, 'seed': seed}
+                    for worker_id, config, seed in shards[agent_id]
+                ],
+            },
+        )
+        log("Assigned %d workers to agent %s" % (len(shards[agent_id]), agent_id))
+        for worker_id, config, _ in shards[agent_id]:
+            workers.append(
+                RemoteWorker(
+                    worker_id=worker_id,
+                    config=config,
+                    agent_id=agent_id,
+                    coordinator=coordinator,
+                    log=log,
+                )
+            )
+    return start_at, workers
+
+
+def wait_until(timestamp):
+    delay = timestamp - time.time()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def run_agent(
+    url,
+    token,
+    executable='sipp',
+    directory=None,
+    progress_interval=1.0,
+    control_port_base=8888,
+    signalling_ports=SIGNALLING_PORTS,
+    media_ports=MEDIA_PORTS,
+    source_ips=(),
+    saturation_interval=0.0,
+    verbose=False,
+    log=print,
+):
+    """
+    Register with the coordinator, run the workers assigned to this agent at
+    the synchronized start time and report their statistics and exit codes.
+    The requests to the coordinator carry the token shared with it.
+    """
+    if not token:
+        raise RuntimeError("The agent needs the token of the coordinator")
+    url = url.rstrip('/')
+    headers = {'Authorization': 'Bearer %s' % token}
+    allocator = PortAllocator(
+        signalling_ports, media_ports, control_port_base, source_ips
+    )
+    client = HTTPClient()
+    try:
+        response = client.post(
+            '%s/agents' % url, json={'hostname': socket.gethostname()}, headers=headers
+        )
+        if response.status_code == 401:
+            raise RuntimeError("The coordinator rejected the token of the agent")
+        agent_id = response.json()['agent_id']
+        log("Registered as agent %s" % agent_id)
+
+        while True:
+            response = client.request(
+                'GET', '%s/agents/%s/assignment' % (url, agent_id), headers=headers
+            )
+            if response.status_code == 200:
+                assignment = response.json()
+                break
+            if response.status_code != 204:
+                raise RuntimeError("Agent %s is not registered" % agent_id)
+            time.sleep(POLL_INTERVAL * 5)
+
+        allocator.shard(assignment['agent_index'], assignment['agents'])
+        if directory is None:
+            directory = tempfile.mkdtemp()
+        basedir = os.path.join(directory, 'scenarios')
+        for scenario, content in assignment['scenarios'].items():
+            filename = os.path.join(basedir, scenario)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, 'w') as f:
+                f.write(content)
+
+        scenarios = ScenarioCache(directory, basedir)
+        workers = []
+        for worker in assignment['workers']:
+            random.seed(worker['seed'])
+            tester = SippWorker(
+                worker_id=worker['worker_id'],
+                config=worker['config'],
+                target=assignment['target'],
+                executable=executable,
+                directory=directory,
+                basedir=basedir,
+                log=log,
+                stored_responses=assignment['stored_responses'],
+                verbose=verbose,
+                scenarios=scenarios,
+                stats=assignment['stats'],
+                ports=allocator.allocate(
+                    media_ports=worker['config'].get('media_ports', 0),
+                    control=worker['config'].get('load_profile') is not None,
+                ),
+            )
+            tester.setup()
+            workers.append(tester)
+        log("Running %d workers in directory %s" % (len(workers), directory))
+
+        def report(action, with_exit_codes=False):
+            data = {}
+            for worker in workers:
+                data[worker.get_worker_id()] = {
+                    'stats': worker.get_stats().to_dict()
+                }
+                if with_exit_codes:
+                    exit_codes = worker.get_exit_codes()
+                    data[worker.get_worker_id()]['exit_codes'] = (
+                        [-1] if exit_codes is None else exit_codes
+                    )
+                    data[worker.get_worker_id()]['durations'] = worker.get_durations()
+            return client.post(
+                '%s/agents/%s/%s' % (url, agent_id, action),
+                json={'workers': data},
+                headers=headers,
+            )
+
+        async def progress(_workers, _timeline):
+            loop = asyncio.get_event_loop()
+            while True:
+                await asyncio.sleep(progress_interval)
+                response = await loop.run_in_executor(None, report, 'progress')
+                reason = (response.json() or {}).get('abort')
+                if reason is not None:
+                    log("Run aborted by the coordinator: %s" % reason)
+                    raise RunAborted(reason)
+
+        saturation = None
+        if saturation_interval:
+            saturation = SaturationMonitor(saturation_interval, log=log)
+        wait_until(assignment['start_at'])
+        try:
+            monitors = get_profile_monitors(
+                workers, assignment['group_sizes'], log=log
+            )
+            if saturation is not None:
+                monitors.append(saturation)
+            run_workers(workers, monitors=[progress] + monitors)
+        except RunAborted:
+            pass
+        finally:
+            report('results', with_exit_codes=True)
+        if saturation is not None and saturation.is_available():
+            for line in format_saturation(saturation.get_report()):
+                log(line)
+        log("Done!")
+    finally:
+        client.close()
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+
+class RunAborted(RuntimeError):
+    """
+    Raised by a monitor to stop the run: the workers still running are
+    cancelled and `run_workers` raises it again.
+    """
+
+
+class Timeline(object):
+    """
+    Single monotonic clock shared by all the workers of a run, recording when
+    each action has been planned and when it has actually been fired.
+    All the offsets are expressed in milliseconds from the start of the run.
+    """
+
+    def __init__(self):
+        self._started_at = None
+        self._events = []
+
+    def start(self):
+        self._started_at = time.monotonic()
+        self._events = []
+
+    def elapsed(self):
+        return (time.monotonic() - self._started_at) * 1000.0
+
+    async def sleep_until(self, offset):
+        delay = offset / 1000.0 - (time.monotonic() - self._started_at)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def record(self, worker_id, action, planned):
+        fired = self.elapsed()
+        self._events.append(
+            {
+                'worker_id': worker_id,
+                'action': action,
+                'planned': planned,
+                'fired': fired,
+                'lag': fired - planned,
+            }
+        )
+
+    def get_events(self):
+        return self._events
+
+
+async def run_worker(worker, timeline):
+    await timeline.sleep_until(worker.get_delay())
+    timeline.record(worker.get_worker_id(), 'start', worker.get_delay())
+    await worker.arunner()
+
+
+async def run_workers_async(workers, timeline, monitors=()):
+    timeline.start()
+    tasks = [asyncio.ensure_future(monitor(workers, timeline)) for monitor in monitors]
+    worker_tasks = [
+        asyncio.ensure_future(run_worker(worker, timeline)) for worker in workers
+    ]
+    run = asyncio.gather(*worker_tasks)
+    try:
+        # a monitor completes early only when it aborts the run
+        while not run.done():
+            await asyncio.wait([run] + tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception():
+                    run.cancel()
+                    await asyncio.gather(run, *worker_tasks, return_exceptions=True)
+                    raise task.exception()
+            tasks = [task for task in tasks if not task.done()]
+        await run
+    finally:
+        # the gathering is done as soon as one of the workers is cancelled or
+        # fails, the other ones are waited for while they terminate sipp
+        run.cancel()
+        await asyncio.gather(run, *worker_tasks, return_exceptions=True)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_workers(workers, timeline=None, monitors=()):
+    """
+    Run all the workers concurrently from a single asyncio event loop, each one
+    at its start offset, and wait for all of them to complete.
+
+    Monitors are coroutine functions called with the workers and the timeline,
+    running alongside the workers and cancelled when all of them are done. A
+    monitor raising RunAborted cancels the workers still running.
+    """
+    if timeline is None:
+        timeline = Timeline()
+    asyncio.run(run_workers_async(workers, timeline, monitors))
+    return timeline
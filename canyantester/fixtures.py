@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from .api import resolve_variables
+from .steps import get_referenced_names, resolve_hosts
+
+# values regenerated by every API call, never cached
+TRANSIENT_NAMES = ('random', 'ipaddr')
+
+
+def get_setup_key(setup, apiurl):
+    """
+    Return the key of the fixtures created by a setup section against an API,
+    to be computed before running the setup, which resolves its payloads
+    """
+    data = json.dumps({'apiurl': apiurl, 'setup': setup}, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def get_fixture_checks(setup, apiurl, stored_responses):
+    """
+    Return the URLs to GET to check that the entities created by the setup
+    still exist: the `exists_uri` of a step if any, otherwise the `uri` of the
+    step followed by the `id` of its stored response.
+    """
+    checks = []
+    for host, config in zip(resolve_hosts(setup, apiurl), setup):
+        name = config.get('store_response', None)
+        response = stored_responses.get(name) if name else None
+        if config.get('exists_uri'):
+            uri = resolve_variables(config['exists_uri'], stored_responses)
+        elif isinstance(response, dict) and 'id' in response:
+            uri = resolve_variables(
+                '%s/%s' % (config.get('uri', '/').rstrip('/'), response['id']),
+                stored_responses,
+            )
+        else:
+            continue
+        checks.append('%s%s' % (host, uri))
+    return checks
+
+
+def get_fixture_names(setup):
+    return set(
+        config['store_response'] for config in setup if config.get('store_response')
+    )
+
+
+def is_fixture_step(config, names):
+    """
+    Whether a teardown step removes one of the cached fixtures, i.e. it
+    references one of their stored responses
+    """
+    return bool(get_referenced_names(config) & names)
+
+
+class FixtureCache(object):
+    """
+    On-disk cache of the stored responses of a setup section, so that the
+    entities it creates are provisioned once and reused by the following runs
+    as long as they still exist.
+    """
+
+    def __init__(self, directory, client, parallelism=10, log=print):
+        self._directory = directory
+        self._client = client
+        self._parallelism = parallelism
+        self._log = log
+
+    def _get_filename(self, key):
+        return os.path.join(self._directory, 'fixtures-%s.json' % key)
+
+    def load(self, key, setup, apiurl):
+        """
+        Return the cached stored responses of a setup section, or None if
+        there are none or any of their entities is gone
+        """
+        filename = self._get_filename(key)
+        if not os.path.exists(filename):
+            return None
+        with open(filename) as f:
+            stored_responses = json.load(f)
+        checks = get_fixture_checks(setup, apiurl, stored_responses)
+        with ThreadPoolExecutor(max_workers=max(self._parallelism, 1)) as executor:
+            statuses = list(executor.map(self._check, checks))
+        missing = [url for url, ok in zip(checks, statuses) if not ok]
+        if missing:
+            self._log(
+                "Cached fixtures %s are stale (%s missing), provisioning again..."
+                % (filename, ', '.join(missing))
+            )
+            os.unlink(filename)
+            return None
+        stored_responses['random'] = {'uuid4': uuid4()}
+        stored_responses['ipaddr'] = {'ip': self._client.get_ipaddr()}
+        self._log("Reusing cached fixtures %s (%d checked)" % (filename, len(checks)))
+        return stored_responses
+
+    def _check(self, url):
+        return self._client.request('GET', url).status_code == 200
+
+    def save(self, key, stored_responses):
+        os.makedirs(self._directory, exist_ok=True)
+        filename = self._get_filename(key)
+        data = dict(
+            (name, value)
+            for name, value in stored_responses.items()
+            if name not in TRANSIENT_NAMES
+        )
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(data, f, default=str)
+        os.replace(filename + '.tmp', filename)
+        self._log("Cached fixtures in %s" % filename)
@@ -0,0 +1,118 @@
+import time
+
+from .checks import poll_check
+from .client import HTTPClient
+from .metrics import get_worker_group
+from .tracing import span
+from .worker import Worker
+
+
+def kamailioXHTTP(config, verbose, echo=print, client=None):
+    if client is None:
+        client = HTTPClient()
+    if config.get('method', "POST") == 'POST':
+        uri = config.get('uri', "")
+        payload = config.get('payload', {})
+        response = client.post(uri, json=payload)
+        echo("HTTP response code: %d" % response.status_code)
+        if response.status_code != 200:
+            echo("Payload: %s" % payload)
+            echo("Response: %s" % response.text)
+            raise RuntimeError()
+        if verbose:
+            echo("Payload: %s" % payload)
+            echo("Response: %s" % response.text)
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+
+def wait_until_ready(config, echo=print, client=None):
+    """
+    Poll the `ready` probe of a kamailio_xhttp step, by default a request to
+    the same uri, until it succeeds and matches its `expected_paths`. Return
+    the number of seconds it took, None without a probe.
+    """
+    ready = config.get('ready', None)
+    if not ready:
+        return None
+    probe = dict(ready)
+    probe.setdefault('uri', config.get('uri', ""))
+    probe.setdefault('timeout', 10)
+    probe.setdefault('poll_interval', 0.2)
+    _, elapsed, attempts = poll_check(
+        lambda: kamailioXHTTP(probe, False, echo=lambda _: None, client=client),
+        probe,
+        log=echo,
+    )
+    echo("%s ready in %.3f s after %d attempts" % (probe['uri'], elapsed, attempts))
+    return elapsed
+
+
+class KamailioXHTTPWorker(Worker):
+    def __init__(
+        self,
+        worker_id,
+        config,
+        log=print,
+        verbose=False,
+        client=None,
+        metrics=None,
+        tracer=None,
+    ):
+        super(KamailioXHTTPWorker, self).__init__(worker_id)
+        self._config = config
+        self._log = log
+        self._verbose = verbose
+        self._client = client
+        self._metrics = metrics
+        self._tracer = tracer
+        # delay is expressed in seconds, fractional values are allowed
+        self._delay = int(float(self._config.get('delay', 0)) * 1000)
+
+    def runner(self):
+        import requests
+
+        self._log(
+            "[%s] %s %s (delay = %s)"
+            % (
+                self._worker_id,
+                self._config.get('method', "POST"),
+                self._config.get('uri', ""),
+                self._delay,
+            )
+        )
+        started_at = time.monotonic()
+        with span(
+            self._tracer,
+            'kamailio_xhttp',
+            worker_id=self._worker_id,
+            uri=self._config.get('uri', ""),
+        ) as attributes:
+            try:
+                kamailioXHTTP(
+                    self._config, self._verbose, echo=self._log, client=self._client
+                )
+            except (RuntimeError, requests.RequestException) as e:
+                self._log("[%s] error: %s" % (self._worker_id, e))
+                self._exit_codes = [1]
+            else:
+                self._exit_codes = [0]
+            attributes['exit_code'] = self._exit_codes[0]
+        self._durations = [time.monotonic() - started_at]
+        if self._metrics is not None:
+            self._metrics.inc(
+                'canyantester_worker_runs_total',
+                {
+                    'group': get_worker_group(self._worker_id),
+                    'result': 'success' if self._exit_codes == [0] else 'error',
+                },
+            )
+
+    def debug(self):
+        self._exit_status = self._exit_codes[0] if self._exit_codes else 0
+        self._log(
+            "[%s] uri = %s, exit code = %s"
+            % (self._worker_id, self._config.get('uri', ""), self._exit_status)
+        )
@@ -0,0 +1,253 @@
+import collections
+import functools
+import os
+import queue
+import sys
+import threading
+
+
+# messages waiting to be echoed, the following ones are dropped
+SINK_SIZE = 100000
+# fast compression, the logs are written while sipp runs
+COMPRESS_LEVEL = 1
+
+
+class LogSink(object):
+    """
+    Non-blocking replacement of an `echo` callable: the messages are queued
+    and echoed in order by a background thread, so that a slow terminal or
+    client never stalls the workers. When the queue is full the messages are
+    dropped and counted, `close` echoes the pending ones and the count. The
+    messages failing to be echoed are counted and reported on stderr.
+    """
+
+    def __init__(self, echo=print, size=SINK_SIZE):
+        self._echo = echo
+        self._queue = queue.Queue(size)
+        self._dropped = 0
+        self._failed = 0
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __call__(self, message=''):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self._dropped += 1
+
+    def _run(self):
+        while True:
+            message = self._queue.get()
+            if message is StopIteration:
+                return
+            try:
+                self._echo(message)
+            except Exception as e:
+                # the messages keep being consumed, e.g. after a client left
+                self._failed += 1
+                self._error = e
+
+    def close(self):
+        self._queue.put(StopIteration)
+        self._thread.join()
+        if self._dropped:
+            self._report("%d log messages dropped" % self._dropped)
+        if self._failed:
+            sys.stderr.write(
+                "%d log messages failed to be echoed: %s: %s\n"
+                % (self._failed, type(self._error).__name__, self._error)
+            )
+
+    def _report(self, message):
+        try:
+            self._echo(message)
+        except Exception:
+            self._failed += 1
+
+
+def with_log_sink(func):
+    """
+    Decorate a function taking an `echo` keyword argument to echo through a
+    LogSink, flushed when the function returns or raises
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        sink = LogSink(kwargs.get('echo', print))
+        kwargs['echo'] = sink
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sink.close()
+
+    return wrapper
+
+
+class RingBuffer(object):
+    """
+    Keep the last `size` bytes written
+    """
+
+    def __init__(self, size=16384):
+        self._size = size
+        self._chunks = collections.deque()
+        self._length = 0
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._length += len(data)
+        while self._length > self._size:
+            extra = self._length - self._size
+            if len(self._chunks[0]) <= extra:
+                self._length -= len(self._chunks.popleft())
+            else:
+                self._chunks[0] = self._chunks[0][extra:]
+                self._length -= extra
+
+    def __len__(self):
+        return self._length
+
+    def getvalue(self):
+        return b''.join(self._chunks)
+
+    def get_lines(self):
+        """
+        Return the complete lines kept, the first one being cut when the
+        buffer is full
+        """
+        lines = self.getvalue().decode('utf-8', 'replace').splitlines()
+        if self._length >= self._size and lines:
+            lines = lines[1:]
+        return lines
+
+
+def open_gzip(filename):
+    # imported by the runs writing logs only, not by the other commands
+    import gzip
+
+    return gzip.open(filename, 'wb', COMPRESS_LEVEL)
+
+
+class RotatingLog(object):
+    """
+    Gzip compressed log written to `<filename>.gz` and rotated every
+    `max_bytes` of output to `<filename>.1.gz`, `<filename>.2.gz` and so on,
+    keeping `backups` rotated files.
+    """
+
+    def __init__(self, filename, max_bytes=10485760, backups=3):
+        self._filename = filename
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._file = None
+        self._written = 0
+
+    def _get_filename(self, index=0):
+        if index:
+            return '%s.%d.gz' % (self._filename, index)
+        return '%s.gz' % self._filename
+
+    def get_filenames(self):
+        """
+        Existing log files, the most recent first
+        """
+        return [
+            self._get_filename(i)
+            for i in range(self._backups + 1)
+            if os.path.exists(self._get_filename(i))
+        ]
+
+    def open(self):
+        self.remove()
+        self._file = open_gzip(self._get_filename())
+        self._written = 0
+        return self
+
+    def write(self, data):
+        if self._written >= self._max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._written += len(data)
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self._backups, 0, -1):
+            if os.path.exists(self._get_filename(i - 1)):
+                os.replace(self._get_filename(i - 1), self._get_filename(i))
+        if not self._backups:
+            os.unlink(self._get_filename())
+        self._file = open_gzip(self._get_filename())
+        self._written = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        for filename in self.get_filenames():
+            os.unlink(filename)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class OutputLog(object):
+    """
+    Output of a process: its last `buffer_size` bytes are kept in memory and
+    it is only written to a RotatingLog once it outgrows them, or when it is
+    saved, so that the processes with little output hold no compressor.
+    """
+
+    def __init__(self, filename, buffer_size=16384, max_bytes=10485760, backups=3):
+        self.buffer = RingBuffer(buffer_size)
+        self._buffer_size = buffer_size
+        self._log = RotatingLog(filename, max_bytes, backups)
+        self._spilled = False
+
+    def open(self):
+        # the logs of a previous run are not reported
+        self._log.remove()
+        self._spilled = False
+        return self
+
+    def write(self, data):
+        if not self._spilled and len(self.buffer) + len(data) > self._buffer_size:
+            self._spill()
+        if self._spilled:
+            self._log.write(data)
+        self.buffer.write(data)
+
+    def _spill(self):
+        self._log.open()
+        self._log.write(self.buffer.getvalue())
+        self._spilled = True
+
+    def save(self):
+        """
+        Write the whole output to the log, kept in memory so far when short
+        """
+        if not self._spilled:
+            self._spill()
+        self._log.close()
+
+    def close(self):
+        self._log.close()
+
+    def remove(self):
+        self._log.remove()
+
+    def get_filenames(self):
+        return self._log.get_filenames()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,150 @@
+import copy
+import csv
+import itertools
+
+from collections import OrderedDict
+
+
+WORKER_TYPES = ('sipp', 'uac')
+# worker keys that are not parameters of the calls
+RESERVED = ('type', 'values', 'load_profile')
+VALUES_PREFIX = 'values.'
+COLUMNS = (
+    'calls',
+    'successful',
+    'failed',
+    'throughput',
+    'p50',
+    'p95',
+    'p99',
+    'exit_status',
+)
+
+
+def get_matrix_config(config_data):
+    """
+    Return the `matrix` section of a configuration, with its defaults
+    """
+    matrix = dict(config_data.get('matrix') or {})
+    matrix.setdefault('worker', 0)
+    matrix.setdefault('parallel', 1)
+    matrix.setdefault('max_instances', None)
+    parameters = matrix.get('parameters') or {}
+    if not parameters:
+        raise RuntimeError("The matrix needs at least one parameter")
+    for name, values in parameters.items():
+        if name in RESERVED or name == VALUES_PREFIX:
+            raise RuntimeError("The matrix cannot sweep %s" % name)
+        if not isinstance(values, list) or not values:
+            raise RuntimeError("The matrix parameter %s needs a list of values" % name)
+    # the cells follow the declaration order of the parameters
+    matrix['parameters'] = OrderedDict(parameters)
+    workers = config_data.get('workers') or []
+    i = matrix['worker']
+    if i >= len(workers) or workers[i].get('type', 'sipp') not in WORKER_TYPES:
+        raise RuntimeError("The matrix needs a sipp or uac worker, got %s" % i)
+    if matrix['parallel'] < 1:
+        raise RuntimeError("The matrix needs parallel >= 1")
+    if matrix['max_instances'] is not None and matrix['max_instances'] < 1:
+        raise RuntimeError("The matrix needs max_instances >= 1")
+    return matrix
+
+
+def get_cells(parameters):
+    """
+    Return the cells of the cartesian product of the parameter values, as
+    ordered dicts by parameter name
+    """
+    names = list(parameters)
+    return [
+        OrderedDict(zip(names, values))
+        for values in itertools.product(*[parameters[name] for name in names])
+    ]
+
+
+def build_cell_config(worker_config, cell):
+    """
+    Return a copy of the configuration of a worker with the values of a cell,
+    `values.<key>` parameters setting the `values` entries of the scenario
+    """
+    config = copy.deepcopy(worker_config)
+    config.pop('load_profile', None)
+    config['stats'] = True
+    start = len(VALUES_PREFIX)
+    for name, value in cell.items():
+        if name.startswith(VALUES_PREFIX):
+            config.setdefault('values', {})[name[start:]] = value
+        else:
+            config[name] = value
+    return config
+
+
+def schedule_cells(sizes, parallel=1, max_instances=None):
+    """
+    Group the cells, given their number of instances, in batches run one
+    after the other: up to `parallel` cells and `max_instances` instances
+    run concurrently, a cell larger than the budget running alone
+    """
+    batches = []
+    batch, instances = [], 0
+    for i, size in enumerate(sizes):
+        if batch and (
+            len(batch) >= parallel
+            or (max_instances is not None and instances + size > max_instances)
+        ):
+            batches.append(batch)
+            batch, instances = [], 0
+        batch.append(i)
+        instances += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def get_row(cell, summary, exit_status=0):
+    response_time = summary['response_time']
+    row = OrderedDict(cell)
+    row.update(
+        [
+            ('calls', summary['calls']),
+            ('successful', summary['successful']),
+            ('failed', summary['failed']),
+            ('throughput', summary['throughput']),
+            ('p50', response_time.get('p50')),
+            ('p95', response_time.get('p95')),
+            ('p99', response_time.get('p99')),
+            ('exit_status', exit_status),
+        ]
+    )
+    return row
+
+
+def format_table(names, rows):
+    """
+    Return the lines of the table of the cells, a column per parameter and
+    per result
+    """
+
+    def cell(value):
+        if value is None:
+            return '-'
+        if isinstance(value, float):
+            return '%.3f' % value
+        return str(value)
+
+    header = list(names) + list(COLUMNS)
+    table = [header] + [[cell(row[name]) for name in header] for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(header))]
+    return [
+        '  '.join(value.rjust(width) for value, width in zip(line, widths))
+        for line in table
+    ]
+
+
+def write_csv(filename, names, rows):
+    header = list(names) + list(COLUMNS)
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(['' if row[name] is None else row[name] for name in header])
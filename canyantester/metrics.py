@@ -0,0 +1,224 @@
+import threading
+
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS = {
+    'canyantester_sipp_processes': ('gauge', 'Number of running sipp processes'),
+    'canyantester_worker_runs_total': (
+        'counter',
+        'Number of completed worker runs by worker group and result',
+    ),
+    'canyantester_calls_total': (
+        'counter',
+        'Number of calls by worker group and result, from the sipp statistics',
+    ),
+    'canyantester_call_failures_total': (
+        'counter',
+        'Number of failed calls by worker group and reason',
+    ),
+    'canyantester_call_rate': (
+        'gauge',
+        'Calls per second of the last sipp statistics period by worker group',
+    ),
+    'canyantester_step_duration_seconds': (
+        'histogram',
+        'Duration of the setup, check and teardown steps',
+    ),
+    'canyantester_check_convergence_seconds': (
+        'histogram',
+        'Time until the response of a check step matched the expected one',
+    ),
+    'canyantester_api_request_duration_seconds': (
+        'histogram',
+        'Duration of the HTTP requests to the API and kamailio nodes',
+    ),
+}
+
+
+def get_worker_group(worker_id):
+    return worker_id.split('_', 1)[0]
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels
+    )
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics(object):
+    """
+    Registry of the metrics of a run. Updates and scrapes only hold a lock for
+    the time needed to update or copy the values, so that scraping never
+    slows down the workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(dict)
+        self._histograms = defaultdict(dict)
+        self._worker_stats = {}
+
+    def inc(self, name, labels=None, value=1):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            self._values[name][key] = self._values[name].get(key, 0) + value
+
+    def set(self, name, labels=None, value=0):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            self._values[name][key] = value
+
+    def observe(self, name, labels=None, value=0.0):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                # cumulative bucket counts, followed by the count and the sum
+                histogram = [0] * (len(BUCKETS) + 1) + [0.0]
+                self._histograms[name][key] = histogram
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += value
+
+    def set_worker_stats(self, worker_id, stats):
+        """
+        Publish a snapshot of the statistics of a sipp worker, aggregated by
+        worker group when the metrics are rendered
+        """
+        counters = stats.get_counters()
+        snapshot = {
+            'created': counters['TotalCallCreated'],
+            'successful': counters['SuccessfulCall'],
+            'failed': counters['FailedCall'],
+            'failures': stats.get_failures(),
+            'call_rate': stats.call_rate,
+        }
+        with self._lock:
+            self._worker_stats[worker_id] = snapshot
+
+    def get_value(self, name, labels=None):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            return self._values[name].get(key)
+
+    def _collect_worker_stats(self, values, worker_stats):
+        for worker_id, snapshot in worker_stats.items():
+            group = get_worker_group(worker_id)
+            for result in ('created', 'successful', 'failed'):
+                key = (('group', group), ('result', result))
+                calls = values['canyantester_calls_total']
+                calls[key] = calls.get(key, 0) + snapshot[result]
+            for reason, count in snapshot['failures'].items():
+                key = (('group', group), ('reason', reason))
+                failures = values['canyantester_call_failures_total']
+                failures[key] = failures.get(key, 0) + count
+            key = (('group', group),)
+            rates = values['canyantester_call_rate']
+            rates[key] = rates.get(key, 0.0) + snapshot['call_rate']
+
+    def render(self):
+        with self._lock:
+            values = defaultdict(
+                dict, ((name, dict(v)) for name, v in self._values.items())
+            )
+            histograms = dict(
+                (name, dict((k, list(h)) for k, h in v.items()))
+                for name, v in self._histograms.items()
+            )
+            worker_stats = dict(self._worker_stats)
+        self._collect_worker_stats(values, worker_stats)
+
+        lines = []
+        for name, (metric_type, description) in METRICS.items():
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            if metric_type == 'histogram':
+                for key, histogram in sorted(histograms.get(name, {}).items()):
+                    for bound, count in zip(BUCKETS + (float('inf'),), histogram):
+                        lines.append(
+                            '%s_bucket%s %s'
+                            % (
+                                name,
+                                format_labels(key + (('le', format_value(bound)),)),
+                                count,
+                            )
+                        )
+                    lines.append(
+                        '%s_count%s %s' % (name, format_labels(key), histogram[-2])
+                    )
+                    lines.append(
+                        '%s_sum%s %s'
+                        % (name, format_labels(key), format_value(histogram[-1]))
+                    )
+            else:
+                for key, value in sorted(values.get(name, {}).items()):
+                    lines.append(
+                        '%s%s %s' % (name, format_labels(key), format_value(value))
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    """
+    HTTP server exposing the metrics of a run on `/metrics`, in the Prometheus
+    text exposition format, from a background thread
+    """
+
+    def __init__(self, metrics, address='0.0.0.0', port=9100):
+        self._metrics = metrics
+        self._server = MetricsHTTPServer((address, port), self._get_handler())
+        self._thread = None
+
+    def get_port(self):
+        return self._server.server_port
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _get_handler(self):
+        metrics = self._metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header(
+                    'Content-Type', 'text/plain; version=0.0.4; charset=utf-8'
+                )
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
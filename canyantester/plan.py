@@ -0,0 +1,258 @@
+import copy
+import hashlib
+import json
+import os
+import random
+
+from .api import RE_VARIABLES
+from .ports import Ports
+from .profiles import validate_profile
+from .sipp import SippWorker
+from .steps import build_dependencies, build_teardown_dependencies, resolve_hosts
+from .utils import get_int_from_config
+
+
+PLAN_VERSION = 2
+WORKER_TYPES = ('sipp', 'uac', 'kamailio_xhttp')
+# parameters of the sipp and uac workers drawn for each instance
+RANDOM_KEYS = (
+    'delay',
+    'call_limit',
+    'call_rate',
+    'call_rate_period',
+    'call_number',
+    'repeat',
+)
+
+
+def is_plan(config_data):
+    return isinstance(config_data, dict) and 'plan_version' in config_data
+
+
+def get_placeholders(values):
+    """
+    Return the sorted `{name.field}` placeholders of the strings of a list or
+    of the values of a dict
+    """
+    if isinstance(values, dict):
+        values = list(values.values())
+    placeholders = set()
+    for value in values:
+        if isinstance(value, str):
+            placeholders.update(
+                '{%s.%s}' % match.groups() for match in RE_VARIABLES(value)
+            )
+    return sorted(placeholders)
+
+
+def get_instance_seed(seed, worker_id):
+    """
+    Seed of the random machine of a sipp or uac instance, derived from the
+    seed of the run without drawing from it
+    """
+    digest = hashlib.sha1(('%s:%s' % (seed, worker_id)).encode('utf-8')).hexdigest()
+    return int(digest[:8], 16)
+
+
+def freeze_worker_config(worker_config):
+    """
+    Return a copy of the configuration of a sipp or uac worker with the
+    random parameters and `values` of an instance drawn
+    """
+    config = copy.deepcopy(worker_config)
+    for key in RANDOM_KEYS:
+        if key in config:
+            config[key] = get_int_from_config(config, key)
+    values = config.get('values') or {}
+    for key, value in values.items():
+        # the strings are resolved and the lists picked from by position
+        if not isinstance(value, (str, list, tuple)):
+            values[key] = get_int_from_config(values, key)
+    return config
+
+
+def get_step_placeholders(step):
+    values = [step.get('uri', '')]
+    if isinstance(step.get('payload'), dict):
+        values.extend(step['payload'].values())
+    return get_placeholders(values)
+
+
+def get_steps_plan(steps, dependencies, apiurl):
+    hosts = resolve_hosts(steps, apiurl)
+    return [
+        {
+            'index': i,
+            'type': step.get('type', 'api'),
+            'method': step.get('method', 'POST'),
+            'uri': step.get('uri'),
+            'host': hosts[i],
+            'store_response': step.get('store_response'),
+            'depends_on': sorted(dependencies[i]),
+            'placeholders': get_step_placeholders(step),
+        }
+        for i, step in enumerate(steps)
+    ]
+
+
+def compile_plan(
+    config_data,
+    seed,
+    target,
+    executable,
+    directory,
+    allocator,
+    scenarios,
+    apiurl=None,
+    agents=0,
+):
+    """
+    Compile a configuration and a seed into the execution plan of a run.
+
+    The number of instances of each worker and the random parameters of each
+    instance are drawn, the ports allocated and the scenarios rendered, so
+    that the configuration errors are found before the setup runs. The values
+    waiting on the setup are left as placeholders, resolved at run time.
+    """
+    random.seed(seed)
+    basedir = config_data.get('basedir')
+    if basedir is not None:
+        # the plan can be replayed from another working directory
+        basedir = os.path.abspath(basedir)
+        config_data = dict(config_data, basedir=basedir)
+    setup = config_data.get('setup') or []
+    check = config_data.get('check') or []
+    teardown = config_data.get('teardown') or []
+    workers = []
+    for i, worker_config in enumerate(config_data.get('workers') or []):
+        worker_type = worker_config.get('type', 'sipp')
+        if worker_type not in WORKER_TYPES:
+            raise RuntimeError(
+                "Unknown type %s of worker %d, expected one of: %s"
+                % (worker_type, i, ', '.join(WORKER_TYPES))
+            )
+        load_profile = worker_config.get('load_profile')
+        if load_profile is not None:
+            validate_profile(load_profile)
+        if worker_type == 'sipp':
+            # a missing scenario fails before the setup
+            scenarios.get_template(worker_config.get('scenario'))
+        for j in range(get_int_from_config(worker_config, 'number', 1)):
+            worker_id = "%06d_%06d" % (i, j)
+            instance = {
+                'worker_id': worker_id,
+                'group': i,
+                'type': worker_type,
+                'remote': worker_type == 'sipp' and bool(agents),
+                'config': worker_config,
+                'start_offset': 0,
+                'ports': None,
+                'args': None,
+                'scenario_hash': None,
+                'pending': [],
+                'seed': None,
+            }
+            if worker_type == 'kamailio_xhttp':
+                # delay is expressed in seconds
+                instance['start_offset'] = int(
+                    float(worker_config.get('delay', 0)) * 1000
+                )
+                instance['pending'] = get_placeholders([worker_config.get('uri', '')])
+                workers.append(instance)
+                continue
+            config = freeze_worker_config(worker_config)
+            instance['config'] = config
+            instance['seed'] = get_instance_seed(seed, worker_id)
+            instance['start_offset'] = config.get('delay', 0)
+            instance['pending'] = get_placeholders(config.get('values') or {})
+            if instance['remote']:
+                # the agents allocate the ports and render the scenarios
+                workers.append(instance)
+                continue
+            ports = allocator.allocate(
+                media_ports=config.get('media_ports', 0),
+                control=worker_type == 'sipp' and load_profile is not None,
+            )
+            instance['ports'] = list(ports)
+            if worker_type == 'sipp' and not instance['pending']:
+                tester = SippWorker(
+                    worker_id=worker_id,
+                    config=config,
+                    target=target,
+                    executable=executable,
+                    directory=directory,
+                    basedir=basedir,
+                    log=lambda _: None,
+                    stored_responses={},
+                    scenarios=scenarios,
+                    ports=ports,
+                )
+                tester.setup()
+                # the plans of different runs are compared without their directory
+                instance['args'] = [
+                    arg.replace(directory, '{directory}') for arg in tester.get_args()
+                ]
+                instance['scenario_hash'] = tester.get_scenario_hash()
+            workers.append(instance)
+    return {
+        'plan_version': PLAN_VERSION,
+        'seed': seed,
+        'target': target,
+        'agents': agents,
+        'config_hash': hashlib.sha1(
+            json.dumps(config_data, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest(),
+        'config': config_data,
+        'steps': {
+            'setup': get_steps_plan(setup, build_dependencies(setup), apiurl),
+            'check': get_steps_plan(check, build_dependencies(check), apiurl),
+            'teardown': get_steps_plan(
+                teardown, build_teardown_dependencies(teardown, setup), apiurl
+            ),
+        },
+        'workers': workers,
+    }
+
+
+def get_instance_ports(instance):
+    return Ports(*instance['ports']) if instance['ports'] is not None else None
+
+
+def format_plan(plan):
+    """
+    Return the lines summarizing a plan: the steps with the ones they depend
+    on and the worker instances with their start offset
+    """
+    lines = []
+    for phase in ('setup', 'check', 'teardown'):
+        for step in plan['steps'][phase]:
+            lines.append(
+                "%s %d: %s %s%s"
+                % (
+                    phase,
+                    step['index'],
+                    step['method'],
+                    step['uri'],
+                    (
+                        ' (after %s)' % ', '.join(map(str, step['depends_on']))
+                        if step['depends_on']
+                        else ''
+                    ),
+                )
+            )
+    for instance in plan['workers']:
+        lines.append(
+            "[%s] %s at %d ms%s: %s"
+            % (
+                instance['worker_id'],
+                instance['type'],
+                instance['start_offset'],
+                (
+                    ', waiting on %s' % ' '.join(instance['pending'])
+                    if instance['pending']
+                    else ''
+                ),
+                ' '.join(instance['args'] or []) or '-',
+            )
+        )
+    return lines
@@ -0,0 +1,184 @@
+import errno
+import socket
+
+from collections import namedtuple
+
+
+# without a range of signalling ports sipp picks its own free port
+SIGNALLING_PORTS = None
+MEDIA_PORTS = '10000-59999'
+# control ports start from --control-port-base
+CONTROL_PORTS = 1000
+# sipp uses the media port and the following three ones for RTP and RTCP
+MEDIA_PORT_BLOCK = 4
+
+
+Ports = namedtuple('Ports', ['address', 'signalling', 'media', 'media_size', 'control'])
+
+# protocols each kind of port is bound with by sipp
+PROTOCOLS = {
+    'signalling': (socket.SOCK_DGRAM, socket.SOCK_STREAM),
+    'media': (socket.SOCK_DGRAM,),
+    'control': (socket.SOCK_DGRAM,),
+}
+
+
+def is_port_free(address, port, protocols=(socket.SOCK_DGRAM,)):
+    """
+    Probe a local port by binding it, a port that cannot be bound for another
+    reason than being in use, e.g. on an address of another host, is deemed
+    free
+    """
+    for protocol in protocols:
+        sock = socket.socket(socket.AF_INET, protocol)
+        try:
+            sock.bind((address or '', port))
+        except OSError as e:
+            if e.errno in (errno.EADDRINUSE, errno.EACCES):
+                return False
+        finally:
+            sock.close()
+    return True
+
+
+def check_ports(ports):
+    """
+    Raise a RuntimeError when a port pinned for a sipp instance is in use
+    """
+    pinned = [
+        ('signalling', ports.signalling, 1),
+        ('media', ports.media, ports.media_size),
+        ('control', ports.control, 1),
+    ]
+    for kind, first, size in pinned:
+        if first is None:
+            continue
+        for port in range(first, first + size):
+            if not is_port_free(ports.address, port, PROTOCOLS[kind]):
+                raise RuntimeError("The %s port %d is in use" % (kind, port))
+
+
+def parse_port_range(value):
+    """
+    Parse a `first-last` port range, both included
+    """
+    if isinstance(value, (tuple, list)):
+        first, last = value
+    else:
+        first, _, last = str(value).partition('-')
+        last = last or first
+    try:
+        first, last = int(first), int(last)
+    except ValueError as e:
+        raise RuntimeError("Invalid port range %s" % (value,)) from e
+    if not 1 <= first <= last <= 65535:
+        raise RuntimeError("Invalid port range %s" % (value,))
+    return first, last
+
+
+class PortAllocator(object):
+    """
+    Hands each sipp instance its own signalling port, when a range is given,
+    block of media ports and remote control port, so that thousands of
+    instances can run on one host. Each port is probed with a bind before
+    being handed out, the ports in use by other processes are skipped. The
+    instances are spread round robin across the source addresses, each one
+    with its own signalling and media ranges; control ports are shared by all
+    the addresses.
+    """
+
+    def __init__(
+        self,
+        signalling=SIGNALLING_PORTS,
+        media=MEDIA_PORTS,
+        control_base=8888,
+        addresses=None,
+        probe=True,
+    ):
+        self._ranges = {
+            'media': parse_port_range(media or MEDIA_PORTS),
+            'control': parse_port_range(
+                (control_base, min(control_base + CONTROL_PORTS - 1, 65535))
+            ),
+        }
+        if signalling:
+            self._ranges['signalling'] = parse_port_range(signalling)
+        self._probe = probe
+        names = sorted(self._ranges)
+        for i, a in enumerate(names, 1):
+            for b in names[i:]:
+                if (
+                    self._ranges[a][0] <= self._ranges[b][1]
+                    and self._ranges[b][0] <= self._ranges[a][1]
+                ):
+                    raise RuntimeError(
+                        "The %s ports %d-%d overlap the %s ports %d-%d"
+                        % ((a,) + self._ranges[a] + (b,) + self._ranges[b])
+                    )
+        self._addresses = list(addresses or []) or [None]
+        self._next = {}
+        self._instances = 0
+
+    def shard(self, index, count):
+        """
+        Restrict the ranges to the `index`-th of `count` slices, so that the
+        agents sharing a host hand out different ports
+        """
+        for kind, (first, last) in self._ranges.items():
+            size = (last - first + 1) // count
+            if not size:
+                raise RuntimeError(
+                    "The %s ports %d-%d cannot be shared by %d agents"
+                    % (kind, first, last, count)
+                )
+            self._ranges[kind] = (first + index * size, first + (index + 1) * size - 1)
+
+    def _is_free(self, kind, address, port, size):
+        if not self._probe:
+            return True
+        return all(
+            is_port_free(address, p, PROTOCOLS[kind]) for p in range(port, port + size)
+        )
+
+    def _take(self, kind, address, size=1):
+        first, last = self._ranges[kind]
+        port = self._next.get((kind, address), first)
+        # the ports in use by other processes are skipped
+        while port + size - 1 <= last and not self._is_free(kind, address, port, size):
+            port += 1
+        if port + size - 1 > last:
+            raise RuntimeError(
+                "The %s ports %d-%d%s are exhausted after %d sipp instances, "
+                "widen the range or add source addresses"
+                % (
+                    kind,
+                    first,
+                    last,
+                    ' of %s' % address if address else '',
+                    self._instances,
+                )
+            )
+        self._next[(kind, address)] = port + size
+        return port
+
+    def allocate(self, media_ports=0, control=False):
+        """
+        Return the ports of a new sipp instance: `media_ports` media ports, at
+        least 4 when any, and a control port when `control` is set
+        """
+        if media_ports:
+            media_ports = max(int(media_ports), MEDIA_PORT_BLOCK)
+        address = self._addresses[self._instances % len(self._addresses)]
+        ports = Ports(
+            address=address,
+            signalling=(
+                self._take('signalling', address)
+                if 'signalling' in self._ranges
+                else None
+            ),
+            media=self._take('media', address, media_ports) if media_ports else None,
+            media_size=media_ports,
+            control=self._take('control', None) if control else None,
+        )
+        self._instances += 1
+        return ports
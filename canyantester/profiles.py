@@ -0,0 +1,117 @@
+import asyncio
+import math
+import socket
+
+from collections import OrderedDict
+
+from .metrics import get_worker_group
+
+
+PROFILE_TYPES = ('ramp', 'step', 'spike', 'sine')
+
+
+def validate_profile(profile):
+    profile_type = profile.get('type')
+    if profile_type not in PROFILE_TYPES:
+        raise RuntimeError(
+            "Unknown load profile type %s, expected one of: %s"
+            % (profile_type, ', '.join(PROFILE_TYPES))
+        )
+    if profile_type == 'step' and not profile.get('steps'):
+        raise RuntimeError("The step load profile requires a list of steps")
+
+
+def get_profile_rate(profile, elapsed):
+    """
+    Return the call rate of a whole worker group, in calls per second, the given
+    number of seconds after the start of the run
+    """
+    profile_type = profile.get('type')
+    duration = float(profile.get('duration', 0))
+    if profile_type == 'ramp':
+        start, end = float(profile.get('from', 0)), float(profile.get('to', 0))
+        if not duration:
+            return end
+        return start + (end - start) * min(max(elapsed / duration, 0.0), 1.0)
+    elif profile_type == 'step':
+        rate = 0.0
+        for step in sorted(profile['steps'], key=lambda step: step['at']):
+            if step['at'] > elapsed:
+                break
+            rate = float(step['rate'])
+        return rate
+    elif profile_type == 'spike':
+        at = float(profile.get('at', 0))
+        if at <= elapsed < at + float(profile.get('length', 0)):
+            return float(profile.get('peak', 0))
+        return float(profile.get('base', 0))
+    elif profile_type == 'sine':
+        low, high = float(profile.get('min', 0)), float(profile.get('max', 0))
+        period = float(profile.get('period', 60))
+        return low + (high - low) * (1 - math.cos(2 * math.pi * elapsed / period)) / 2
+    raise RuntimeError("Unknown load profile type %s" % profile_type)
+
+
+class LoadProfileController(object):
+    """
+    Engine monitor applying the load profile of a worker group: the rate of the
+    group is spread across its instances and sent to each running sipp process
+    through its remote control UDP port. When the profile is over, the sipp
+    processes are asked to quit once their calls are completed.
+    """
+
+    def __init__(self, profile, workers, group_size=None, log=print):
+        self._profile = profile
+        self._workers = workers
+        self._group_size = group_size or len(workers)
+        self._log = log
+        self._interval = float(profile.get('interval', 1))
+        self._duration = profile.get('duration')
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def _send(self, command):
+        for worker in self._workers:
+            port = worker.get_control_port()
+            if port is None or not worker.is_running():
+                continue
+            try:
+                self._socket.sendto(
+                    command.encode('utf-8'), (worker.get_control_host(), port)
+                )
+            except OSError as e:
+                self._log("[%s] control error: %s" % (worker.get_worker_id(), e))
+
+    async def __call__(self, workers, timeline):
+        try:
+            while True:
+                elapsed = timeline.elapsed() / 1000.0
+                if self._duration is not None and elapsed >= float(self._duration):
+                    self._send('q')
+                else:
+                    rate = get_profile_rate(self._profile, elapsed) / self._group_size
+                    self._send('cset rate %.3f' % rate)
+                await asyncio.sleep(self._interval)
+        finally:
+            self._socket.close()
+
+
+def get_profile_monitors(workers, group_sizes=None, log=print):
+    """
+    Return a LoadProfileController for each worker group with a load profile
+    """
+    groups = OrderedDict()
+    for worker in workers:
+        if worker.get_load_profile():
+            groups.setdefault(get_worker_group(worker.get_worker_id()), []).append(
+                worker
+            )
+    return [
+        LoadProfileController(
+            group_workers[0].get_load_profile(),
+            group_workers,
+            (group_sizes or {}).get(group),
+            log=log,
+        )
+        for group, group_workers in groups.items()
+    ]
@@ -0,0 +1,272 @@
+import datetime
+import json
+import os
+import sqlite3
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from uuid import uuid4
+
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+# name: (path in the record, whether higher values are better)
+METRICS = OrderedDict(
+    [
+        ('throughput', (('stats', 'throughput'), True)),
+        ('failure_rate', (('stats', 'failure_rate'), False)),
+        ('response_time.p50', (('stats', 'response_time', 'p50'), False)),
+        ('response_time.p95', (('stats', 'response_time', 'p95'), False)),
+        ('response_time.p99', (('stats', 'response_time', 'p99'), False)),
+        ('api.p50', (('api', 'p50'), False)),
+        ('api.p95', (('api', 'p95'), False)),
+        ('phases.setup', (('phases', 'setup'), False)),
+        ('phases.workers', (('phases', 'workers'), False)),
+        ('phases.check', (('phases', 'check'), False)),
+        ('phases.teardown', (('phases', 'teardown'), False)),
+    ]
+)
+# always compared, the durations of the phases depend too much on the host
+DEFAULT_METRICS = (
+    'throughput',
+    'failure_rate',
+    'response_time.p50',
+    'response_time.p95',
+    'response_time.p99',
+    'api.p95',
+)
+
+
+class RunRecorder(object):
+    """
+    Collect the structured record of a run: its seed and configuration, the
+    duration of its phases, the exit codes and run durations of each worker,
+    the API latencies and the sipp statistics.
+    """
+
+    def __init__(self, seed, target, config_data, tag=None):
+        self.record = {
+            'id': uuid4().hex,
+            'tag': tag,
+            'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'seed': seed,
+            'target': target,
+            'config': config_data,
+            'status': 'error',
+            'error': None,
+            'phases': {},
+            'workers': {},
+            'stats': None,
+            'api': None,
+            'saturation': None,
+        }
+
+    @contextmanager
+    def phase(self, name):
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record['phases'][name] = time.monotonic() - started_at
+
+    def add_worker(self, worker):
+        stats = worker.get_stats()
+        self.record['workers'][worker.get_worker_id()] = {
+            'exit_codes': worker.get_exit_codes(),
+            'exit_status': worker.get_exit_status(),
+            'durations': worker.get_durations(),
+            'stats': (
+                stats.summary() if stats is not None and stats.get_counters() else None
+            ),
+        }
+
+    def set_stats(self, summary):
+        if summary['calls']:
+            self.record['stats'] = dict(
+                summary, failure_rate=float(summary['failed']) / summary['calls']
+            )
+
+    def set_api(self, api_stats):
+        if api_stats['calls']:
+            self.record['api'] = api_stats
+
+    def set_saturation(self, report):
+        self.record['saturation'] = report
+
+    def set_status(self, status):
+        self.record['status'] = status
+
+    def fail(self, error):
+        """
+        Record the error ending the run, also when its workers passed and its
+        check or teardown failed
+        """
+        if self.record['status'] == 'passed':
+            self.record['status'] = 'error'
+        self.record['error'] = error
+
+
+class JSONLStore(object):
+    """
+    Append-only store of run records, one JSON object per line
+    """
+
+    def __init__(self, filename):
+        self._filename = filename
+
+    def append(self, record):
+        with open(self._filename, 'a') as f:
+            f.write(json.dumps(record, default=str, sort_keys=True) + '\n')
+
+    def get_records(self):
+        if not os.path.exists(self._filename):
+            return []
+        with open(self._filename) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class SQLiteStore(object):
+    """
+    Append-only store of run records in an SQLite database
+    """
+
+    def __init__(self, filename):
+        self._filename = filename
+
+    def _connect(self):
+        connection = sqlite3.connect(self._filename)
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY, tag TEXT, '
+            'started_at TEXT, status TEXT, record TEXT NOT NULL)'
+        )
+        return connection
+
+    def append(self, record):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    'INSERT INTO runs VALUES (?, ?, ?, ?, ?)',
+                    (
+                        record['id'],
+                        record.get('tag'),
+                        record['started_at'],
+                        record['status'],
+                        json.dumps(record, default=str, sort_keys=True),
+                    ),
+                )
+        finally:
+            connection.close()
+
+    def get_records(self):
+        if not os.path.exists(self._filename):
+            return []
+        connection = self._connect()
+        try:
+            rows = connection.execute('SELECT record FROM runs ORDER BY rowid')
+            return [json.loads(row[0]) for row in rows]
+        finally:
+            connection.close()
+
+
+def open_store(filename):
+    """
+    Return the SQLite store of a .db, .sqlite or .sqlite3 file, otherwise
+    the JSON lines one
+    """
+    if os.path.splitext(filename)[1].lower() in SQLITE_EXTENSIONS:
+        return SQLiteStore(filename)
+    return JSONLStore(filename)
+
+
+def find_record(records, selector):
+    """
+    Return the record selected by `last`, `previous`, an id, an id prefix or
+    the latest one with the given tag
+    """
+    if selector == 'last' and records:
+        return records[-1]
+    if selector == 'previous' and len(records) > 1:
+        return records[-2]
+    for record in reversed(records):
+        if record['id'].startswith(selector) or record.get('tag') == selector:
+            return record
+    raise RuntimeError("No run %s in the results" % selector)
+
+
+def parse_tolerance(value):
+    """
+    Parse a relative tolerance such as `10%`, or an absolute one in the unit
+    of the metric, and return it as (value, relative)
+    """
+    value = str(value).strip()
+    try:
+        if value.endswith('%'):
+            return float(value[:-1]) / 100.0, True
+        return float(value), False
+    except ValueError as e:
+        raise RuntimeError("Invalid tolerance %s" % value) from e
+
+
+def get_metrics(record):
+    metrics = {}
+    for name, (path, _) in METRICS.items():
+        value = record
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is not None:
+            metrics[name] = value
+    return metrics
+
+
+def compare_records(current, baseline, tolerances=None, default_tolerance='10%'):
+    """
+    Compare the metrics of a run with the ones of a baseline, within the
+    tolerances by metric name, and return a row per metric with whether it
+    regressed. The default metrics, and the ones with a tolerance, are
+    compared, with the default tolerance unless given.
+    """
+    tolerances = dict(tolerances or {})
+    for name in tolerances:
+        if name not in METRICS:
+            raise RuntimeError(
+                "Unknown metric %s, expected one of: %s" % (name, ', '.join(METRICS))
+            )
+    names = [name for name in METRICS if name in DEFAULT_METRICS or name in tolerances]
+    current_metrics, baseline_metrics = get_metrics(current), get_metrics(baseline)
+    rows = []
+    for name in names:
+        if name not in current_metrics or name not in baseline_metrics:
+            continue
+        tolerance, relative = parse_tolerance(tolerances.get(name, default_tolerance))
+        higher_is_better = METRICS[name][1]
+        base, value = baseline_metrics[name], current_metrics[name]
+        margin = abs(base) * tolerance if relative else tolerance
+        limit = base - margin if higher_is_better else base + margin
+        rows.append(
+            {
+                'metric': name,
+                'baseline': base,
+                'current': value,
+                'limit': limit,
+                'regression': value < limit if higher_is_better else value > limit,
+            }
+        )
+    return rows
+
+
+def format_comparison(rows):
+    lines = ["%-20s %12s %12s %12s" % ('metric', 'baseline', 'current', 'limit')]
+    for row in rows:
+        lines.append(
+            "%-20s %12.3f %12.3f %12.3f%s"
+            % (
+                row['metric'],
+                row['baseline'],
+                row['current'],
+                row['limit'],
+                '  REGRESSION' if row['regression'] else '',
+            )
+        )
+    return lines
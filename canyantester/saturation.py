@@ -0,0 +1,306 @@
+import asyncio
+import os
+import time
+
+from collections import namedtuple
+
+
+PROC = '/proc'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+# share of one core above which a generator process is CPU-bound
+CPU_THRESHOLD = 0.9
+# share of all the cores above which the host is saturated
+HOST_CPU_THRESHOLD = 0.9
+UDP_ERRORS = ('InErrors', 'RcvbufErrors', 'SndbufErrors')
+
+ProcessSample = namedtuple(
+    'ProcessSample', ['cpu', 'rss', 'voluntary', 'involuntary', 'sockets']
+)
+HostSample = namedtuple('HostSample', ['busy', 'total', 'udp_errors'])
+
+
+def read_process(pid, proc=PROC):
+    """
+    Sample the CPU time in seconds, the resident memory in bytes, the context
+    switches and the socket inodes of a process, None when it is gone
+    """
+    base = os.path.join(proc, str(pid))
+    try:
+        with open(os.path.join(base, 'stat')) as f:
+            # utime and stime are the 14th and 15th fields, after the command
+            fields = f.read().rsplit(')', 1)[1].split()
+        status = {}
+        with open(os.path.join(base, 'status')) as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                status[name] = value.split()
+        sockets = set()
+        start = len('socket:[')
+        for fd in os.listdir(os.path.join(base, 'fd')):
+            try:
+                link = os.readlink(os.path.join(base, 'fd', fd))
+            except OSError:
+                continue
+            if link.startswith('socket:['):
+                sockets.add(int(link[start:-1]))
+        return ProcessSample(
+            cpu=(int(fields[11]) + int(fields[12])) / float(CLOCK_TICKS),
+            rss=int(status.get('VmRSS', [0])[0]) * 1024,
+            voluntary=int(status.get('voluntary_ctxt_switches', [0])[0]),
+            involuntary=int(status.get('nonvoluntary_ctxt_switches', [0])[0]),
+            sockets=sockets,
+        )
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def read_udp_drops(proc=PROC):
+    """
+    Return the number of datagrams dropped by each UDP socket, by inode
+    """
+    drops = {}
+    for name in ('udp', 'udp6'):
+        try:
+            with open(os.path.join(proc, 'net', name)) as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            try:
+                drops[int(fields[9])] = int(fields[-1])
+            except (IndexError, ValueError):
+                continue
+    return drops
+
+
+def read_host(proc=PROC):
+    """
+    Sample the busy and total CPU time of the host, in clock ticks, and its
+    UDP error counters
+    """
+    with open(os.path.join(proc, 'stat')) as f:
+        values = [int(value) for value in f.readline().split()[1:9]]
+    # idle and iowait
+    busy, total = sum(values) - values[3] - values[4], sum(values)
+    udp_errors = dict((name, 0) for name in UDP_ERRORS)
+    try:
+        with open(os.path.join(proc, 'net', 'snmp')) as f:
+            lines = [line.split() for line in f if line.startswith('Udp:')]
+        udp_errors.update(
+            (name, int(value))
+            for name, value in zip(lines[0][1:], lines[1][1:])
+            if name in UDP_ERRORS
+        )
+    except (OSError, IndexError, ValueError):
+        pass
+    return HostSample(busy, total, udp_errors)
+
+
+class ProcessUsage(object):
+    """
+    Usage of the processes run by a worker over the run, a new process
+    replacing the previous one at each repeat
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.busy_samples = 0
+        self.cpu = 0.0
+        self.peak_cpu = 0.0
+        self.peak_rss = 0
+        self.involuntary = 0
+        self.drops = 0
+        self.elapsed = 0.0
+        self._previous = None
+
+    def add(self, pid, sample, drops, now, threshold):
+        previous = self._previous
+        self._previous = (pid, sample, drops, now)
+        self.peak_rss = max(self.peak_rss, sample.rss)
+        if previous is None or previous[0] != pid:
+            # a new process, its counters start from zero
+            self.drops += drops
+            return
+        _, last, last_drops, last_time = previous
+        elapsed = now - last_time
+        if elapsed <= 0:
+            return
+        cpu = (sample.cpu - last.cpu) / elapsed
+        self.samples += 1
+        self.busy_samples += cpu >= threshold
+        self.cpu += sample.cpu - last.cpu
+        self.elapsed += elapsed
+        self.peak_cpu = max(self.peak_cpu, cpu)
+        self.involuntary += sample.involuntary - last.involuntary
+        self.drops += max(drops - last_drops, 0)
+
+    def to_dict(self):
+        flags = []
+        if self.samples and self.busy_samples * 2 >= self.samples:
+            flags.append('cpu-bound')
+        if self.drops:
+            flags.append('dropping')
+        return {
+            'cpu': self.cpu / self.elapsed if self.elapsed else None,
+            'peak_cpu': self.peak_cpu,
+            'peak_rss': self.peak_rss,
+            'involuntary_switches': self.involuntary,
+            'drops': self.drops,
+            'flags': flags,
+        }
+
+
+class SaturationMonitor(object):
+    """
+    Engine monitor sampling from /proc, every `interval` seconds, the CPU,
+    memory, context switches and UDP drops of the sipp processes, of
+    canyantester itself and of the host, to tell a saturated load generator
+    from a failing system under test.
+    """
+
+    def __init__(
+        self,
+        interval=1.0,
+        cpu_threshold=CPU_THRESHOLD,
+        host_cpu_threshold=HOST_CPU_THRESHOLD,
+        proc=PROC,
+        log=print,
+    ):
+        self._interval = interval
+        self._cpu_threshold = cpu_threshold
+        self._host_cpu_threshold = host_cpu_threshold
+        self._proc = proc
+        self._log = log
+        self._usage = {}
+        self._host_first = None
+        self._host_last = None
+        self._host_peak = 0.0
+
+    def is_available(self):
+        return os.path.exists(os.path.join(self._proc, 'stat'))
+
+    async def __call__(self, workers, timeline):
+        if not self.is_available():
+            self._log("No %s, the load generator is not monitored" % self._proc)
+            return
+        loop = asyncio.get_event_loop()
+        while True:
+            targets = [('canyantester', os.getpid())]
+            for worker in workers:
+                pid = worker.get_pid()
+                if pid is not None:
+                    targets.append((worker.get_worker_id(), pid))
+            await loop.run_in_executor(None, self.sample, targets)
+            await asyncio.sleep(self._interval)
+
+    def sample(self, targets):
+        """
+        Sample the host and the (name, pid) processes
+        """
+        now = time.monotonic()
+        drops = read_udp_drops(self._proc)
+        for name, pid in targets:
+            sample = read_process(pid, self._proc)
+            if sample is None:
+                continue
+            self._usage.setdefault(name, ProcessUsage()).add(
+                pid,
+                sample,
+                sum(drops.get(inode, 0) for inode in sample.sockets),
+                now,
+                self._cpu_threshold,
+            )
+        host = read_host(self._proc)
+        if self._host_last is not None and host.total > self._host_last.total:
+            self._host_peak = max(
+                self._host_peak,
+                float(host.busy - self._host_last.busy)
+                / (host.total - self._host_last.total),
+            )
+        if self._host_first is None:
+            self._host_first = host
+        self._host_last = host
+
+    def get_report(self):
+        """
+        Return the usage of the host and of each process, flagged when it is
+        CPU-bound or dropping packets, and the saturation verdict
+        """
+        host = {'cpu': None, 'peak_cpu': self._host_peak, 'udp_errors': {}, 'flags': []}
+        first, last = self._host_first, self._host_last
+        if first is not None and last.total > first.total:
+            host['cpu'] = float(last.busy - first.busy) / (last.total - first.total)
+            if host['cpu'] >= self._host_cpu_threshold:
+                host['flags'].append('cpu-bound')
+        if first is not None:
+            host['udp_errors'] = dict(
+                (name, last.udp_errors[name] - first.udp_errors[name])
+                for name in UDP_ERRORS
+            )
+            if any(host['udp_errors'].values()):
+                host['flags'].append('dropping')
+        processes = dict((name, usage.to_dict()) for name, usage in self._usage.items())
+        reasons = ['host %s' % ', '.join(host['flags'])] if host['flags'] else []
+        reasons.extend(
+            '%s %s' % (name, ', '.join(process['flags']))
+            for name, process in sorted(processes.items())
+            if process['flags']
+        )
+        return {
+            'saturated': bool(reasons),
+            'reasons': reasons,
+            'host': host,
+            'processes': processes,
+        }
+
+
+def format_percent(value):
+    return 'n/a' if value is None else '%.0f%%' % (100 * value)
+
+
+def format_saturation(report):
+    """
+    Return the lines reporting the usage of the host, the processes flagged as
+    CPU-bound or dropping packets and the verdict
+    """
+    host = report['host']
+    lines = [
+        "host: cpu = %s, peak = %s, udp errors = %s"
+        % (
+            format_percent(host['cpu']),
+            format_percent(host['peak_cpu']),
+            ', '.join('%s: %d' % item for item in sorted(host['udp_errors'].items()))
+            or 'n/a',
+        )
+    ]
+    flagged = [
+        (name, process)
+        for name, process in sorted(report['processes'].items())
+        if process['flags']
+    ]
+    lines.append(
+        "%d processes sampled, %d flagged" % (len(report['processes']), len(flagged))
+    )
+    for name, process in flagged:
+        lines.append(
+            "[%s] cpu = %s, peak = %s, peak rss = %.1f MB, "
+            "involuntary switches = %d, drops = %d (%s)"
+            % (
+                name,
+                format_percent(process['cpu']),
+                format_percent(process['peak_cpu']),
+                process['peak_rss'] / 1048576.0,
+                process['involuntary_switches'],
+                process['drops'],
+                ', '.join(process['flags']),
+            )
+        )
+    if report['saturated']:
+        lines.append(
+            "Verdict: the load generator is saturated (%s), the results are not "
+            "reliable" % '; '.join(report['reasons'])
+        )
+    else:
+        lines.append("Verdict: the load generator is not saturated")
+    return lines
@@ -0,0 +1,267 @@
+import copy
+import hmac
+import json
+import os
+import threading
+import traceback
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+from .client import new_session
+from .utils import load_yaml
+
+
+# options of run_tester accepted from the clients, the sipp executable and the
+# files written by the runs being set by the server
+RUN_OPTIONS = (
+    'target',
+    'seed',
+    'apiurl',
+    'no_setup',
+    'no_teardown',
+    'parallelism',
+    'api_timeout',
+    'api_retries',
+    'metrics_port',
+    'metrics_address',
+    'agents',
+    'listen',
+    'token',
+    'agents_timeout',
+    'start_delay',
+    'control_port_base',
+    'signalling_ports',
+    'media_ports',
+    'source_ips',
+    'teardown_timeout',
+    'saturation_interval',
+    'stats',
+    'tag',
+    'otlp_endpoint',
+    'verbose',
+)
+
+
+class WarmCache(object):
+    """
+    State kept by a warm process across its runs: the parsed configurations,
+    the parsed scenario templates and a pooled HTTP session.
+    """
+
+    def __init__(self, pool_maxsize=50):
+        self.templates = {}
+        self._pool_maxsize = pool_maxsize
+        self._configs = {}
+        self._session = None
+        self._lock = threading.Lock()
+
+    def load_config(self, config):
+        """
+        Return a copy of the parsed configuration of an open file, parsed
+        again only when the file changes
+        """
+        name = getattr(config, 'name', None)
+        if not isinstance(name, str) or not os.path.isfile(name):
+            return load_yaml(config)
+        stat = os.stat(name)
+        key = (os.path.abspath(name), stat.st_mtime, stat.st_size)
+        with self._lock:
+            if key not in self._configs:
+                self._configs[key] = load_yaml(config)
+            # the runs add their defaults to the configuration
+            return copy.deepcopy(self._configs[key])
+
+    def get_session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = new_session(self._pool_maxsize)
+            return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+class RunHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class RunServer(object):
+    """
+    HTTP server accepting runs on `POST /run`, with a JSON body holding the
+    path of the configuration and the options of the run, and streaming their
+    output back as JSON lines, the last one with the exit status of the run.
+    The requests are authenticated by the token shared with the clients.
+
+    The runs are executed one at a time, by `runner(config, echo, **options)`.
+    """
+
+    def __init__(self, runner, token, address='127.0.0.1', port=8790, log=print):
+        if not token:
+            raise RuntimeError("A token shared with the clients is required")
+        self._runner = runner
+        self._token = token
+        self._log = log
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._server = RunHTTPServer((address, port), self._get_handler())
+        self._thread = None
+
+    def get_port(self):
+        return self._server.server_port
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def run(self, request, write):
+        """
+        Run the requested configuration, writing its output, and return its
+        exit status and error
+        """
+        lock = threading.Lock()
+
+        def echo(message=''):
+            with lock:
+                write({'output': str(message)})
+
+        with self._lock:
+            self._runs += 1
+            run_number = self._runs
+            self._log("Run %d: %s" % (run_number, request.get('config')))
+            try:
+                with open(request['config'], 'rb') as config:
+                    self._runner(config, echo, **(request.get('options') or {}))
+            except (RuntimeError, OSError) as e:
+                error = str(e).strip() or type(e).__name__
+            except Exception as e:
+                # the server outlives the runs failing unexpectedly
+                self._log(traceback.format_exc())
+                error = '%s: %s' % (type(e).__name__, e)
+            else:
+                error = None
+            self._log("Run %d: %s" % (run_number, error or 'passed'))
+        return (1 if error else 0), error
+
+    def _is_authorized(self, authorization):
+        return hmac.compare_digest(
+            (authorization or '').encode('utf-8'),
+            ('Bearer %s' % self._token).encode('utf-8'),
+        )
+
+    def _get_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/health':
+                    self.send_error(404)
+                    return
+                body = json.dumps({'runs': server._runs}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if self.path != '/run':
+                    self.send_error(404)
+                    return
+                if not server._is_authorized(self.headers.get('Authorization')):
+                    self.send_error(401)
+                    return
+                # no simple cross-origin request from a browser
+                content_type = self.headers.get('Content-Type') or ''
+                if content_type.split(';')[0].strip() != 'application/json':
+                    self.send_error(415)
+                    return
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    request = json.loads(self.rfile.read(length).decode('utf-8'))
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict) or 'config' not in request:
+                    self.send_error(400)
+                    return
+                options = request.get('options') or {}
+                if not isinstance(options, dict) or set(options) - set(RUN_OPTIONS):
+                    self.send_error(400, 'Options not accepted by the server')
+                    return
+                # no Content-Length, the end of the output closes the connection
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+
+                def write(line):
+                    try:
+                        self.wfile.write(json.dumps(line).encode('utf-8') + b'\n')
+                        self.wfile.flush()
+                    except OSError:
+                        # the client went away, the run goes on
+                        pass
+
+                exit_status, error = server.run(request, write)
+                write({'exit_status': exit_status, 'error': error})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def submit_run(url, config, options=None, token=None, echo=print, timeout=None):
+    """
+    Submit a run to a warm server, echoing its output as it is streamed, and
+    raise a RuntimeError when the run fails. The options not accepted by the
+    server must be left unset.
+    """
+    options = dict(options or {})
+    rejected = sorted(
+        name
+        for name, value in options.items()
+        if name not in RUN_OPTIONS and value is not None
+    )
+    if rejected:
+        raise RuntimeError(
+            "Options set by the server, not by its clients: %s" % ', '.join(rejected)
+        )
+    options = dict(
+        (name, value) for name, value in options.items() if name in RUN_OPTIONS
+    )
+    body = json.dumps({'config': os.path.abspath(config), 'options': options})
+    request = Request(
+        url.rstrip('/') + '/run',
+        data=body.encode('utf-8'),
+        headers={
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer %s' % (token or ''),
+        },
+    )
+    try:
+        response = urlopen(request, timeout=timeout)
+    except (URLError, OSError) as e:
+        raise RuntimeError("Cannot submit the run to %s: %s" % (url, e)) from e
+    result = None
+    with response:
+        for line in response:
+            message = json.loads(line.decode('utf-8'))
+            if 'output' in message:
+                echo(message['output'])
+            else:
+                result = message
+    if result is None:
+        raise RuntimeError("The server %s closed the run before its end" % url)
+    if result['exit_status']:
+        raise RuntimeError(result['error'] or "The run failed")
@@ -1,19 +1,44 @@
+import asyncio
 import os
-import re
-import subprocess
 import time
 
-from dotty_dict import dotty  # type: ignore
-
+from .api import resolve_variables
 from .defaults import TEMPLATE_XML as DEFAULT_TEMPLATE_XML
+from .engine import run_workers
+from .logs import OutputLog
+from .metrics import get_worker_group
+from .ports import MEDIA_PORT_BLOCK
+from .stats import SippStats, SippStatsReader, format_summary
+from .templates import ScenarioCache, get_scenario_hash
+from .tracing import span
 from .utils import get_int_from_config
-from .worker import Worker
+from .worker import Worker, get_exit_status
+
+
+def get_worker_values(values, worker_id, stored_responses):
+    """
+    Resolve the `values` of a worker instance: the placeholders of strings are
+    replaced with the stored responses, lists are picked from by the position
+    of the instance and numbers can be random
+    """
+    result = {}
+    for key, value in values.items():
+        if isinstance(value, str):
+            result[key] = resolve_variables(value, stored_responses)
+        elif isinstance(value, (list, tuple)):
+            worker_positional_id = int(worker_id.split('_', 1)[1])
+            result[key] = value[worker_positional_id % len(value)]
+        else:
+            result[key] = get_int_from_config(values, key, None)
+    return result
 
 
 class SippWorker(Worker):
 
     TEMPLATE_XML = DEFAULT_TEMPLATE_XML
-    RE_VARIABLE = re.compile(r'\{([^}\.]+)\.([^}]+)\}').search
+    TERMINATE_TIMEOUT = 5
+    DRAIN_TIMEOUT = 1
+    READ_SIZE = 65536
 
     def __init__(
         self,
@@ -26,9 +51,15 @@ class SippWorker(Worker):
         log=print,
         stored_responses=None,
         verbose=False,
+        scenarios=None,
+        metrics=None,
+        control_port=None,
+        injection_file=None,
+        ports=None,
+        tracer=None,
+        stats=False,
     ):
-        super(SippWorker, self).__init__()
-        self._worker_id = worker_id
+        super(SippWorker, self).__init__(worker_id)
         self._config = config
         self._directory = directory
         self._basedir = basedir
@@ -39,44 +70,41 @@ class SippWorker(Worker):
         self._stored_responses = stored_responses
         self._verbose = verbose
         self._values = self._config.get('values', {})
-        self._filename_xml = os.path.join(
-            self._directory, 'sipp-%s.xml' % self._worker_id
+        self._scenarios = scenarios or ScenarioCache(directory, basedir)
+        self._filename_xml = None
+        self._filename_log = os.path.join(
+            self._directory, 'sipp-%s.log' % self._worker_id
+        )
+        self._output_log = OutputLog(
+            self._filename_log,
+            buffer_size=self._config.get('output_buffer', 16384),
+            max_bytes=self._config.get('log_max_bytes', 10485760),
+            backups=self._config.get('log_backups', 3),
         )
         self._delay = get_int_from_config(self._config, 'delay', 0)
+        self._stats = SippStats()
+        # traced when asked for, or when the run exposes or watches them
+        self._stats_enabled = self._config.get('stats', stats)
+        self._stats_interval = self._config.get('stats_interval', 1)
+        self._metrics = metrics
+        self._tracer = tracer
+        self._ports = ports
+        if ports is not None and ports.control is not None:
+            control_port = ports.control
+        self._control_port = control_port
+        self._injection_file = injection_file
+        self._process = None
         self._output = None
         self._args = []
 
     def setup(self):
-        for k, v in self._values.items():
-            if not isinstance(v, str):
-                continue
-            variable_match = self.RE_VARIABLE(v)
-            if variable_match is None:
-                continue
-            stored_response = dotty(self._stored_responses[variable_match.group(1)])
-            self._values[k] = v.replace(
-                variable_match.group(0), str(stored_response[variable_match.group(2)])
-            )
         values = {'basedir': self._basedir, 'target': self._target}
-        for key in self._values.keys():
-            if isinstance(self._values[key], str):
-                values[key] = self._values[key]
-            elif isinstance(self._values[key], (list, tuple)):
-                worker_positional_id = int(self._worker_id.split('_', 1)[1])
-                values[key] = self._values[key][
-                    worker_positional_id % len(self._values[key])
-                ]
-            else:
-                values[key] = get_int_from_config(self._values, key, None)
-        if self._config.get('scenario'):
-            template_xml = (
-                open(os.path.join(self._basedir, self._config.get('scenario'))).read()
-                % values
-            )
-        else:
-            template_xml = self.TEMPLATE_XML % values
-        with open(self._filename_xml, 'wb') as f:
-            f.write(template_xml.encode('utf-8'))
+        values.update(
+            get_worker_values(self._values, self._worker_id, self._stored_responses)
+        )
+        self._filename_xml = self._scenarios.render(
+            self._config.get('scenario'), values, default=self.TEMPLATE_XML
+        )
         self._args = [
             self._executable,
             self._target,
@@ -88,51 +116,233 @@ class SippWorker(Worker):
             str(get_int_from_config(self._config, 'call_rate', 1)),
             '-rp',
             str(get_int_from_config(self._config, 'call_rate_period', 1000)),
-            '-m',
-            str(get_int_from_config(self._config, 'call_number', 1)),
         ]
-        extra_args = self._config.get('extra_args')
-        if isinstance(extra_args, (tuple, list)):
-            self._args.extend(extra_args)
-        elif isinstance(extra_args, str):
-            self._args.extend(extra_args.split())
+        if self.get_load_profile() is None or 'call_number' in self._config:
+            # with a load profile, sipp runs until the end of the profile
+            self._args.extend(
+                ['-m', str(get_int_from_config(self._config, 'call_number', 1))]
+            )
+        extra_args = self._config.get('extra_args') or []
+        if isinstance(extra_args, str):
+            extra_args = extra_args.split()
+        if self._control_port is not None:
+            self._args.extend(['-cp', str(self._control_port)])
+        if self._ports is not None:
+            self._args.extend(self._get_ports_args(extra_args))
+        if self._injection_file is not None:
+            self._args.extend(['-inf', self._injection_file])
+        self._args.extend(extra_args)
         self._output = None
 
+    def get_args(self):
+        """
+        Command line of the sipp processes of the worker, once set up
+        """
+        return list(self._args)
+
+    def get_scenario_hash(self):
+        return get_scenario_hash(self._filename_xml)
+
+    def _get_ports_args(self, extra_args):
+        # ports set explicitly through extra_args take precedence
+        ports = self._ports
+        args = []
+        if ports.address is not None and '-i' not in extra_args:
+            args.extend(['-i', ports.address])
+        if ports.signalling is not None and '-p' not in extra_args:
+            args.extend(['-p', str(ports.signalling)])
+        if ports.media is not None and '-mp' not in extra_args:
+            args.extend(['-mp', str(ports.media)])
+            if ports.media_size > MEDIA_PORT_BLOCK:
+                args.extend(
+                    [
+                        '-min_rtp_port',
+                        str(ports.media + MEDIA_PORT_BLOCK),
+                        '-max_rtp_port',
+                        str(ports.media + ports.media_size - 1),
+                    ]
+                )
+        return args
+
     def runner(self):
-        if os.path.exists(self._filename_xml.replace('.xml', '.log')):
-            os.unlink(self._filename_xml.replace('.xml', '.log'))
-        exit_codes = []
-        with open(self._filename_xml.replace('.xml', '.log'), 'ab') as log:
-            if self._delay:
-                time.sleep(self._delay / 1000.0)
-            for _ in range(get_int_from_config(self._config, 'repeat', 1)):
+        run_workers([self])
+
+    async def arunner(self):
+        # filled run after run, for the failure budget to watch
+        self._exit_codes = []
+        self._durations = []
+        with self._output_log as log:
+            for repeat in range(get_int_from_config(self._config, 'repeat', 1)):
                 self._log(
                     "[%s] %s (delay = %s)"
                     % (self._worker_id, " ".join(self._args), self._delay)
                 )
-                try:
-                    p = subprocess.run(
-                        args=self._args,
-                        check=True,
-                        stdout=log,
-                        stderr=log,
-                        timeout=self._config.get('timeout', None),
-                    )
-                except subprocess.CalledProcessError as e:
-                    exit_codes.append(e.returncode)
-                except subprocess.TimeoutExpired:
-                    exit_codes.append(-1)
-                else:
-                    exit_codes.append(p.returncode)
-        self._exit_codes = exit_codes
+                started_at = time.monotonic()
+                with span(
+                    self._tracer, 'sipp', worker_id=self._worker_id, repeat=repeat
+                ) as attributes:
+                    try:
+                        exit_code = await self._run_process(log, repeat)
+                    except asyncio.CancelledError:
+                        self._exit_codes.append(-1)
+                        raise
+                    finally:
+                        self._durations.append(time.monotonic() - started_at)
+                    attributes['exit_code'] = exit_code
+                self._exit_codes.append(exit_code)
+
+    def _get_stat_filename(self, repeat):
+        return os.path.join(
+            self._directory, 'sipp-%s-%d_stat.csv' % (self._worker_id, repeat)
+        )
+
+    def _get_rtt_filenames(self, pid):
+        # sipp names the response times file after the scenario and its pid
+        basename = '%s_%d_rtt.csv' % (
+            os.path.splitext(os.path.basename(self._filename_xml))[0],
+            pid,
+        )
+        return [
+            os.path.join(self._directory, basename),
+            os.path.join(os.getcwd(), basename),
+        ]
+
+    async def _read_stats(self, reader):
+        while True:
+            await asyncio.sleep(self._stats_interval)
+            self._update_stats(reader)
+
+    def _update_stats(self, reader):
+        reader.read()
+        if self._metrics is not None:
+            self._metrics.set_worker_stats(self._worker_id, self._stats)
+
+    async def _read_output(self, stream, log):
+        while True:
+            data = await stream.read(self.READ_SIZE)
+            if not data:
+                return
+            log.write(data)
+
+    async def _drain_output(self, task):
+        # sipp is gone, its last output is still in the pipe
+        try:
+            await asyncio.wait_for(task, timeout=self.DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run_process(self, log, repeat=0):
+        args = list(self._args)
+        if self._stats_enabled:
+            # a previous run of the worker may have left its statistics behind
+            if os.path.exists(self._get_stat_filename(repeat)):
+                os.unlink(self._get_stat_filename(repeat))
+            args.extend(
+                [
+                    '-trace_stat',
+                    '-stf',
+                    self._get_stat_filename(repeat),
+                    '-fd',
+                    str(self._stats_interval),
+                    '-trace_rtt',
+                ]
+            )
+        process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+        )
+        self._process = process
+        output = asyncio.ensure_future(self._read_output(process.stdout, log))
+        if self._metrics is not None:
+            self._metrics.inc('canyantester_sipp_processes')
+        reader = None
+        task = None
+        if self._stats_enabled:
+            self._stats.start_process()
+            reader = SippStatsReader(
+                self._stats,
+                self._get_stat_filename(repeat),
+                self._get_rtt_filenames(process.pid),
+            )
+            task = asyncio.ensure_future(self._read_stats(reader))
+        try:
+            return await asyncio.wait_for(
+                process.wait(), timeout=self._config.get('timeout', None)
+            )
+        except asyncio.TimeoutError:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+            return -1
+        except asyncio.CancelledError:
+            await self._terminate(process)
+            raise
+        finally:
+            if task is not None:
+                task.cancel()
+                self._update_stats(reader)
+                if not self._config.get('keep_logs', False):
+                    reader.remove()
+            await self._drain_output(output)
+            if self._metrics is not None:
+                self._metrics.inc('canyantester_sipp_processes', value=-1)
+                self._metrics.inc(
+                    'canyantester_worker_runs_total',
+                    {
+                        'group': get_worker_group(self._worker_id),
+                        'result': 'success' if process.returncode == 0 else 'error',
+                    },
+                )
+
+    async def _terminate(self, process):
+        # the run has been interrupted: ask sipp to quit, then kill it. The
+        # task may be cancelled again while waiting, the signal is sent first
+        try:
+            process.terminate()
+        except ProcessLookupError:
+            return
+        self._log("[%s] terminated" % self._worker_id)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=self.TERMINATE_TIMEOUT)
+        except asyncio.TimeoutError:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    def get_stats(self):
+        return self._stats
+
+    def get_load_profile(self):
+        return self._config.get('load_profile')
+
+    def get_control_port(self):
+        return self._control_port
+
+    def get_control_host(self):
+        return self._config.get('control_host', '127.0.0.1')
+
+    def is_running(self):
+        return self._process is not None and self._process.returncode is None
+
+    def get_pid(self):
+        return self._process.pid if self.is_running() else None
 
     def debug(self):
+        if self._exit_codes is None:
+            # cancelled before its start
+            self._exit_codes = []
         non_zero_exit_codes = list(filter(lambda x: x != 0, self._exit_codes))
-        self._exit_status = (
-            non_zero_exit_codes[0]
-            if len(non_zero_exit_codes) > self._config.get('max_errors', 0)
-            else 0
+        self._exit_status = get_exit_status(
+            self._exit_codes, self._config.get('max_errors', 0)
         )
+        if self._exit_status != 0 or self._config.get('keep_logs', False):
+            self._output_log.save()
+        else:
+            # the full output is kept for the workers failing only
+            self._output_log.remove()
         self._log(
             "[%s] runs = %s, errors = %s, exit codes = %s, input = %s, output = %s"
             % (
@@ -141,6 +351,13 @@ class SippWorker(Worker):
                 len(non_zero_exit_codes),
                 ', '.join(map(str, self._exit_codes)),
                 self._filename_xml,
-                self._filename_xml.replace('.xml', '.log'),
+                ', '.join(self._output_log.get_filenames()) or '-',
             )
         )
+        if self._exit_status != 0:
+            for line in self._output_log.buffer.get_lines():
+                self._log("[%s] | %s" % (self._worker_id, line))
+        if self._stats_enabled and self._stats.get_counters():
+            self._log(
+                "[%s] %s" % (self._worker_id, format_summary(self._stats.summary()))
+            )
@@ -0,0 +1,327 @@
+import math
+import os
+
+from collections import Counter
+
+
+COUNTERS = (
+    'TotalCallCreated',
+    'SuccessfulCall(C)',
+    'FailedCall(C)',
+    'Retransmissions(C)',
+)
+
+
+def parse_duration(value):
+    """
+    Parse a sipp duration, formatted as `HH:MM:SS:ffffff` or `HH:MM:SS:mmm`,
+    and return it in seconds
+    """
+    hours, minutes, seconds, fraction = value.strip().split(':')
+    return (
+        int(hours) * 3600
+        + int(minutes) * 60
+        + int(seconds)
+        + float('0.%s' % fraction)
+    )
+
+
+class Histogram(object):
+    """
+    Memory bounded histogram with logarithmic buckets, each one covering a 2%
+    range of values, used to estimate the percentiles of response times.
+    """
+
+    RATIO = 1.02
+
+    def __init__(self):
+        self._buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value, count=1):
+        bucket = int(math.log(value) / math.log(self.RATIO)) if value > 0 else None
+        self._buckets[bucket] += count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        self._buckets.update(other._buckets)
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            'buckets': [[bucket, count] for bucket, count in self._buckets.items()],
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        for bucket, count in data['buckets']:
+            histogram._buckets[bucket] += count
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        if p >= 100:
+            return self.max
+        rank = self.count * p / 100.0
+        seen = 0
+        for bucket in sorted(self._buckets, key=lambda b: -1e9 if b is None else b):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                if bucket is None:
+                    return 0.0
+                value = self.RATIO ** (bucket + 0.5)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+class FileTail(object):
+    """
+    Incrementally read the complete lines appended to a file; when a list of
+    candidate file names is given, the first one to exist is tailed.
+    """
+
+    def __init__(self, filenames):
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        self._filenames = filenames
+        self._filename = None
+        self._offset = 0
+        self._partial = b''
+
+    def read_lines(self):
+        if self._filename is None:
+            for filename in self._filenames:
+                if os.path.exists(filename):
+                    self._filename = filename
+                    break
+            else:
+                return []
+        with open(self._filename, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        self._offset += len(data)
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        return [line.decode('utf-8', 'replace').strip() for line in lines]
+
+    def remove(self):
+        for filename in self._filenames:
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+
+class SippStats(object):
+    """
+    Statistics of a sipp worker, fed incrementally with the rows of the sipp
+    statistics file (`-trace_stat`) and of the response times file
+    (`-trace_rtt`) of each run.
+    """
+
+    def __init__(self):
+        self._totals = Counter()
+        self._current = Counter()
+        self._elapsed = 0.0
+        self._current_elapsed = 0.0
+        self.call_rate = 0.0
+        self.response_times = Histogram()
+
+    def start_process(self):
+        self._totals.update(self._current)
+        self._elapsed += self._current_elapsed
+        self._current = Counter()
+        self._current_elapsed = 0.0
+        self.call_rate = 0.0
+
+    def add_stat_row(self, row):
+        """
+        Update the statistics with a row of the statistics file, its counters
+        are cumulative since the start of the process
+        """
+        current = Counter()
+        for key, value in row.items():
+            if key in COUNTERS or (
+                key.startswith('Failed') and not key.endswith('(P)')
+            ):
+                try:
+                    current[key.replace('(C)', '')] = int(value)
+                except ValueError:
+                    continue
+        self._current = current
+        try:
+            self._current_elapsed = parse_duration(row['ElapsedTime(C)'])
+        except (KeyError, ValueError):
+            pass
+        try:
+            self.call_rate = float(row['CallRate(P)'])
+        except (KeyError, ValueError):
+            pass
+
+    def set_current(self, counters, elapsed, call_rate=0.0):
+        """
+        Set the cumulative counters of the current process, for the workers
+        counting their calls themselves
+        """
+        self._current = Counter(counters)
+        self._current_elapsed = elapsed
+        self.call_rate = call_rate
+
+    def add_response_time(self, value):
+        self.response_times.add(value)
+
+    def get_counters(self):
+        counters = Counter(self._totals)
+        counters.update(self._current)
+        return counters
+
+    def get_elapsed(self):
+        return self._elapsed + self._current_elapsed
+
+    def get_failures(self):
+        """
+        Number of failed calls by reason
+        """
+        return dict(
+            (key[len('Failed'):], value)
+            for key, value in self.get_counters().items()
+            if key.startswith('Failed') and key != 'FailedCall' and value
+        )
+
+    def to_dict(self):
+        return {
+            'counters': dict(self.get_counters()),
+            'elapsed': self.get_elapsed(),
+            'call_rate': self.call_rate,
+            'response_times': self.response_times.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats._totals.update(data['counters'])
+        stats._elapsed = data['elapsed']
+        stats.call_rate = data['call_rate']
+        stats.response_times = Histogram.from_dict(data['response_times'])
+        return stats
+
+    def merge(self, other):
+        self._totals.update(other.get_counters())
+        self._elapsed = max(self._elapsed, other.get_elapsed())
+        self.call_rate += other.call_rate
+        self.response_times.merge(other.response_times)
+
+    def summary(self, elapsed=None):
+        counters = self.get_counters()
+        if elapsed is None:
+            elapsed = self.get_elapsed()
+        summary = {
+            'calls': counters['TotalCallCreated'],
+            'successful': counters['SuccessfulCall'],
+            'failed': counters['FailedCall'],
+            'retransmissions': counters['Retransmissions'],
+            'failures': self.get_failures(),
+            'elapsed': elapsed,
+            'throughput': counters['SuccessfulCall'] / elapsed if elapsed else 0.0,
+            'response_time': {
+                'count': self.response_times.count,
+                'mean': self.response_times.mean(),
+                'min': self.response_times.min,
+                'max': self.response_times.max,
+            },
+        }
+        for p in (50, 90, 95, 99):
+            summary['response_time']['p%d' % p] = self.response_times.percentile(p)
+        return summary
+
+
+def format_summary(summary):
+    response_time = summary['response_time']
+    message = "calls = %d, successful = %d, failed = %d, throughput = %.2f cps" % (
+        summary['calls'],
+        summary['successful'],
+        summary['failed'],
+        summary['throughput'],
+    )
+    if response_time['count']:
+        message += (
+            ", response time p50 = %.3f ms, p95 = %.3f ms, p99 = %.3f ms, max = %.3f ms"
+            % (
+                response_time['p50'],
+                response_time['p95'],
+                response_time['p99'],
+                response_time['max'],
+            )
+        )
+    if summary['failures']:
+        message += ", failures = %s" % ', '.join(
+            '%s: %d' % item for item in sorted(summary['failures'].items())
+        )
+    return message
+
+
+def merge_stats(stats):
+    merged = SippStats()
+    for s in stats:
+        merged.merge(s)
+    return merged
+
+
+class SippStatsReader(object):
+    """
+    Tail the statistics and response times files of a sipp process and feed
+    their rows into a SippStats instance
+    """
+
+    def __init__(self, stats, stat_filename, rtt_filenames):
+        self._stats = stats
+        self._stat = FileTail(stat_filename)
+        self._rtt = FileTail(rtt_filenames)
+        self._header = None
+
+    def read(self):
+        for line in self._stat.read_lines():
+            if not line:
+                continue
+            fields = line.rstrip(';').split(';')
+            if self._header is None or fields[0] == 'StartTime':
+                self._header = fields
+                continue
+            self._stats.add_stat_row(dict(zip(self._header, fields)))
+        for line in self._rtt.read_lines():
+            fields = line.split(';')
+            if len(fields) < 2:
+                continue
+            try:
+                self._stats.add_response_time(float(fields[1]))
+            except ValueError:
+                continue
+
+    def remove(self):
+        """
+        Remove the files, once read for the last time
+        """
+        self._stat.remove()
+        self._rtt.remove()
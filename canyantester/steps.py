@@ -0,0 +1,210 @@
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .api import RE_VARIABLES
+from .tracing import current_span
+
+
+def get_referenced_names(config):
+    """
+    Return the names of the stored responses referenced by the placeholders of
+    the uri and of the payload of a step, by its `depends_on` list and by the
+    `foreach` of a bulk step.
+    """
+    values = [config.get('uri', '')]
+    payload = config.get('payload', None)
+    if isinstance(payload, dict):
+        values.extend(payload.values())
+    names = set()
+    for value in values:
+        if isinstance(value, str):
+            names.update(match.group(1) for match in RE_VARIABLES(value))
+    depends_on = config.get('depends_on', [])
+    if isinstance(depends_on, str):
+        depends_on = [depends_on]
+    names.update(depends_on)
+    if isinstance(config.get('foreach', None), str):
+        names.add(config['foreach'])
+    return names
+
+
+def build_dependencies(steps):
+    """
+    Build the dependency graph of a list of steps: each step depends on the
+    latest previous step storing a response it references, either through a
+    `{name.field}` placeholder or through the `depends_on` list.
+    """
+    dependencies = []
+    producers = {}
+    for i, config in enumerate(steps):
+        dependencies.append(
+            set(
+                producers[name]
+                for name in get_referenced_names(config)
+                if name in producers
+            )
+        )
+        store_response = config.get('store_response', None)
+        if store_response:
+            producers[store_response] = i
+    return dependencies
+
+
+def get_setup_closure(setup):
+    """
+    Return, for each response stored by the setup, the names of the stored
+    responses it depends on, directly or through other ones
+    """
+    closure = {}
+    for config in setup:
+        store_response = config.get('store_response', None)
+        if not store_response:
+            continue
+        names = set()
+        for name in get_referenced_names(config):
+            if name in closure:
+                names.add(name)
+                names.update(closure[name])
+        closure[store_response] = names
+    return closure
+
+
+def build_teardown_dependencies(teardown, setup=None):
+    """
+    Build the dependency graph of the teardown steps: on top of the
+    dependencies of `build_dependencies`, a step waits for the previous steps
+    referencing the same entities of the setup or entities depending on them,
+    e.g. the removal of a tenant waits for the removal of its domains.
+    """
+    dependencies = build_dependencies(teardown)
+    closure = get_setup_closure(setup or [])
+    names = [get_referenced_names(config) & set(closure) for config in teardown]
+    for i in range(len(teardown)):
+        for j in range(i):
+            dependants = set(names[j])
+            for name in names[j]:
+                dependants.update(closure[name])
+            if names[i] & dependants:
+                dependencies[i].add(j)
+    return dependencies
+
+
+def resolve_hosts(steps, apiurl):
+    """
+    Return the API URL of each step: a `host` key overrides the API URL for
+    the step and for the following ones.
+    """
+    hosts = []
+    for config in steps:
+        apiurl = config.get('host', apiurl)
+        hosts.append(apiurl)
+    return hosts
+
+
+def timed_step(func, metrics, phase):
+    def wrapper(i, config):
+        started_at = time.monotonic()
+        try:
+            return func(i, config)
+        finally:
+            metrics.observe(
+                'canyantester_step_duration_seconds',
+                {'phase': phase, 'type': config.get('type', 'api')},
+                time.monotonic() - started_at,
+            )
+
+    return wrapper
+
+
+def traced_step(func, tracer, phase):
+    # the steps may run in other threads, nested in the span of their phase
+    parent = current_span()
+
+    def wrapper(i, config):
+        with tracer.span(
+            '%s %d' % (phase, i),
+            parent=parent,
+            step=i,
+            type=config.get('type', 'api'),
+            uri=config.get('uri'),
+        ):
+            return func(i, config)
+
+    return wrapper
+
+
+def run_steps(
+    steps,
+    func,
+    parallelism=1,
+    metrics=None,
+    phase=None,
+    dependencies=None,
+    tracer=None,
+):
+    """
+    Call `func(index, config)` for each step; with a parallelism greater than
+    one, independent steps run concurrently in a pool of threads as soon as the
+    steps they depend on are done, by default as given by `build_dependencies`.
+    """
+    if metrics is not None:
+        func = timed_step(func, metrics, phase)
+    if tracer is not None:
+        func = traced_step(func, tracer, phase)
+    if parallelism <= 1:
+        for i, config in enumerate(steps):
+            func(i, config)
+        return
+
+    if dependencies is None:
+        dependencies = build_dependencies(steps)
+    pending = list(range(len(steps)))
+    done = set()
+    running = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        while pending or running:
+            if error is None:
+                for i in list(pending):
+                    if len(running) >= parallelism:
+                        break
+                    if dependencies[i] <= done:
+                        pending.remove(i)
+                        running[executor.submit(func, i, steps[i])] = i
+            if not running:
+                break
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                i = running.pop(future)
+                if future.exception() is not None:
+                    if error is None:
+                        error = future.exception()
+                else:
+                    done.add(i)
+    if error is not None:
+        raise error
+
+
+def run_bounded(func, timeout=None):
+    """
+    Call `func()` in a separate thread and wait at most `timeout` seconds for
+    it, raising RuntimeError when it is still running
+    """
+    errors = []
+
+    def target():
+        try:
+            func()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise RuntimeError("Not completed within %s seconds" % timeout)
+    if errors:
+        raise errors[0]
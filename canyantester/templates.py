@@ -0,0 +1,94 @@
+import hashlib
+import os
+import re
+
+from .defaults import TEMPLATE_XML as DEFAULT_TEMPLATE_XML
+
+
+RE_TEMPLATE_KEYS = re.compile(r'%(?:%|\(([^)]+)\))').finditer
+
+
+def get_scenario_hash(filename):
+    """
+    Return the hash of the content of a rendered scenario, from its file name
+    """
+    start, end = len('sipp-'), -len('.xml')
+    return os.path.basename(filename)[start:end]
+
+
+class ScenarioTemplate(object):
+    """
+    Scenario loaded and parsed once: the keys referenced by the template are
+    extracted so that only the relevant values identify a rendered scenario.
+    """
+
+    def __init__(self, template):
+        self._template = template
+        self._keys = tuple(
+            sorted(
+                set(
+                    match.group(1)
+                    for match in RE_TEMPLATE_KEYS(template)
+                    if match.group(1) is not None
+                )
+            )
+        )
+
+    def get_keys(self):
+        return self._keys
+
+    def render(self, values):
+        return self._template % values
+
+
+class ScenarioCache(object):
+    """
+    Cache of the scenario templates of a run, writing one XML file for each
+    distinct set of values rendered into a scenario, shared by all the workers
+    using it.
+
+    The parsed `templates` can be shared by the runs of a warm process, each
+    scenario being parsed again only when its file changes.
+    """
+
+    def __init__(self, directory, basedir=None, templates=None):
+        self._directory = directory
+        self._basedir = basedir
+        self._templates = {} if templates is None else templates
+        self._filenames = {}
+
+    def get_template(self, scenario=None, default=DEFAULT_TEMPLATE_XML):
+        """
+        Return the parsed template of a scenario, relative to the base directory,
+        or the default template when no scenario is given.
+        """
+        if scenario:
+            filename = os.path.join(self._basedir, scenario)
+            key = (os.path.abspath(filename), os.path.getmtime(filename))
+        else:
+            key = default
+        if key not in self._templates:
+            if scenario:
+                with open(filename) as f:
+                    template = f.read()
+            else:
+                template = default
+            self._templates[key] = ScenarioTemplate(template)
+        return self._templates[key]
+
+    def render(self, scenario, values, default=DEFAULT_TEMPLATE_XML):
+        """
+        Render the scenario with the given values and return the path of the
+        XML file containing it.
+        """
+        template = self.get_template(scenario, default)
+        key = (scenario or default,) + tuple(values[k] for k in template.get_keys())
+        if key not in self._filenames:
+            content = template.render(values).encode('utf-8')
+            filename = os.path.join(
+                self._directory, 'sipp-%s.xml' % hashlib.sha1(content).hexdigest()
+            )
+            with open(filename, 'wb') as f:
+                f.write(content)
+            self._filenames[key] = filename
+        return self._filenames[key]
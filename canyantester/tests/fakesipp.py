@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the sipp executable, accepting the sipp options used by
+canyantester plus the following ones:
+
+    -fake_sleep <seconds>   time spent running (defaults to 0)
+    -fake_exit <code>       exit code (defaults to 1 when calls failed, like
+                            sipp, 0 otherwise)
+    -fake_failed <number>   number of failed calls (defaults to 0)
+    -fake_rtt <ms>          response time of the calls (defaults to 10)
+    -fake_capacity <rate>   highest call rate `-r` without failures, the calls
+                            above it fail
+
+The number of calls is taken from `-m`. When `-trace_stat` is given the
+statistics file is written every `-fd` seconds, and when `-trace_rtt` is given
+a response time per call is written to `<scenario>_<pid>_rtt.csv`.
+"""
+
+import os
+import sys
+import time
+
+HEADER = [
+    'StartTime',
+    'LastResetTime',
+    'CurrentTime',
+    'ElapsedTime(P)',
+    'ElapsedTime(C)',
+    'TargetRate',
+    'CallRate(P)',
+    'CallRate(C)',
+    'TotalCallCreated',
+    'CurrentCall',
+    'SuccessfulCall(P)',
+    'SuccessfulCall(C)',
+    'FailedCall(P)',
+    'FailedCall(C)',
+    'FailedMaxUDPRetrans(P)',
+    'FailedMaxUDPRetrans(C)',
+    'FailedUnexpectedMessage(P)',
+    'FailedUnexpectedMessage(C)',
+    'Retransmissions(P)',
+    'Retransmissions(C)',
+]
+
+
+def parse_args(argv):
+    options = {}
+    flags = set()
+    i = 1
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ('-trace_stat', '-trace_rtt'):
+            flags.add(arg)
+        elif arg.startswith('-') and i + 1 < len(argv):
+            options[arg] = argv[i + 1]
+            i += 1
+        i += 1
+    return options, flags
+
+
+def format_duration(seconds):
+    return '%02d:%02d:%02d:%06d' % (
+        seconds // 3600,
+        seconds % 3600 // 60,
+        seconds % 60,
+        (seconds % 1) * 1000000,
+    )
+
+
+def stat_row(elapsed, calls, failed):
+    rate = calls / elapsed if elapsed else 0
+    row = dict((key, '0') for key in HEADER)
+    row.update(
+        {
+            'ElapsedTime(C)': format_duration(elapsed),
+            'ElapsedTime(P)': format_duration(elapsed),
+            'CallRate(P)': '%.3f' % rate,
+            'CallRate(C)': '%.3f' % rate,
+            'TotalCallCreated': str(calls),
+            'SuccessfulCall(C)': str(calls - failed),
+            'FailedCall(C)': str(failed),
+            'FailedMaxUDPRetrans(C)': str(failed),
+        }
+    )
+    return ';'.join(row[key] for key in HEADER) + ';\n'
+
+
+def main(argv):
+    options, flags = parse_args(argv)
+    sleep = float(options.get('-fake_sleep', 0))
+    calls = int(options.get('-m', 1))
+    failed = min(calls, int(options.get('-fake_failed', 0)))
+    if '-fake_capacity' in options:
+        rate = float(options.get('-r', 1))
+        capacity = float(options['-fake_capacity'])
+        if rate > capacity:
+            failed = max(failed, int(round(calls * (rate - capacity) / rate)))
+    interval = float(options.get('-fd', 60))
+
+    stat_file = None
+    if '-trace_stat' in flags and '-stf' in options:
+        stat_file = open(options['-stf'], 'w')
+        stat_file.write(';'.join(HEADER) + ';\n')
+        stat_file.flush()
+
+    for i in range(int(options.get('-fake_output', 0))):
+        print('fake output line %d' % i)
+    sys.stdout.flush()
+
+    started_at = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - started_at
+        remaining = sleep - elapsed
+        if remaining <= 0:
+            break
+        time.sleep(min(interval, remaining))
+        if stat_file is not None and remaining > interval:
+            elapsed = time.monotonic() - started_at
+            done = int(calls * elapsed / sleep)
+            stat_file.write(stat_row(elapsed, done, int(failed * elapsed / sleep)))
+            stat_file.flush()
+
+    if stat_file is not None:
+        stat_file.write(stat_row(max(sleep, 0.001), calls, failed))
+        stat_file.close()
+
+    if '-trace_rtt' in flags and '-sf' in options:
+        filename = '%s_%d_rtt.csv' % (os.path.splitext(options['-sf'])[0], os.getpid())
+        rtt = float(options.get('-fake_rtt', 10))
+        with open(filename, 'w') as f:
+            f.write('Date_ms;response_time_ms;rtd_no\n')
+            for i in range(calls - failed):
+                f.write('%.3f;%.3f;1\n' % (time.time() * 1000, rtt))
+
+    return int(options.get('-fake_exit', 1 if failed else 0))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,23 @@
+import os
+import yaml
+
+
+FAKESIPP = os.path.join(os.path.dirname(__file__), 'fakesipp.py')
+
+SCENARIO = '<pause milliseconds="%(call_duration)d" />'
+
+
+def write_config(directory, scenario=SCENARIO, sections=None, **options):
+    """
+    Write `scenario.xml` and a `config.yaml` running one sipp worker with the
+    given options, plus the other top level `sections`. Return the config
+    filename.
+    """
+    with open(os.path.join(directory, 'scenario.xml'), 'w') as f:
+        f.write(scenario)
+    worker = {'scenario': 'scenario.xml', 'values': {'call_duration': 1000}}
+    worker.update(options)
+    filename = os.path.join(directory, 'config.yaml')
+    with open(filename, 'w') as f:
+        yaml.dump(dict(sections or {}, workers=[worker]), f)
+    return filename
@@ -0,0 +1,92 @@
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from uuid import uuid4
+
+
+class StubHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubServer(object):
+    """
+    Local HTTP server answering like the rating REST API and the kamailio xhttp
+    RPC endpoint: POST requests are answered with the JSON payload and a new
+    `id`, DELETE requests with `true`.
+
+    Responses can be overridden per path with `responses[path]`, a list of
+    `(status_code, body)` tuples consumed in order, the last one being reused.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.connections = set()
+        self.responses = {}
+        self._lock = threading.Lock()
+        self._server = StubHTTPServer(('127.0.0.1', 0), self._get_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self._server.server_port
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _get_response(self, method, path, payload):
+        with self._lock:
+            self.requests.append((method, path, payload))
+            responses = self.responses.get(path)
+            if responses:
+                return responses.pop(0) if len(responses) > 1 else responses[0]
+        if method == 'DELETE':
+            return 200, True
+        data = dict(payload) if isinstance(payload, dict) else {}
+        data.setdefault('id', str(uuid4()))
+        return 200, data
+
+    def _get_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                with stub._lock:
+                    stub.connections.add(self.client_address)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                payload = json.loads(body.decode('utf-8')) if body else None
+                status_code, data = stub._get_response(self.command, self.path, payload)
+                response = json.dumps(data).encode('utf-8')
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            do_POST = _handle
+            do_DELETE = _handle
+            do_GET = _handle
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
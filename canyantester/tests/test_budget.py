@@ -0,0 +1,84 @@
+import pytest  # type: ignore
+import time
+import yaml
+
+from canyantester import run_tester
+from canyantester.budget import get_budget_config
+from canyantester.tests.helpers import FAKESIPP
+from canyantester.tests.server import StubServer
+
+
+def run_with_budget(tmp_path, stub, worker, budget, messages):
+    config = tmp_path / 'config.yaml'
+    config.write_text(
+        yaml.dump(
+            {
+                'failure_budget': dict(budget, interval=0.1),
+                'setup': [{'uri': '/tenants/', 'store_response': 'tenant'}],
+                'workers': [dict(worker, values={'call_duration': 1000})],
+                'check': [{'uri': '/cdrs/', 'method': 'GET'}],
+                'teardown': [{'uri': '/tenants/{tenant.id}', 'method': 'DELETE'}],
+            }
+        )
+    )
+    started_at = time.monotonic()
+    with pytest.raises(RuntimeError) as e:
+        run_tester(
+            str(config),
+            executable=FAKESIPP,
+            directory=str(tmp_path),
+            apiurl=stub.url,
+            echo=messages.append,
+        )
+    assert 'Failure budget exceeded' in str(e.value)
+    assert time.monotonic() - started_at < 10
+    # the check and the teardown still run
+    assert [method for method, _, _ in stub.requests] == ['POST', 'GET', 'DELETE']
+
+
+def test_get_budget_config():
+    assert get_budget_config({}) is None
+    with pytest.raises(RuntimeError):
+        get_budget_config({'failure_budget': {'interval': 1}})
+    with pytest.raises(RuntimeError):
+        get_budget_config({'failure_budget': {'max_failure_ratio': 5}})
+
+
+def test_failed_runs_budget(tmp_path):
+    messages = []
+    with StubServer() as stub:
+        run_with_budget(
+            tmp_path,
+            stub,
+            {
+                'number': 2,
+                'repeat': 50,
+                'stats': False,
+                'extra_args': ['-fake_sleep', '0.2', '-fake_exit', '1'],
+            },
+            {'max_failed_runs': 2},
+            messages,
+        )
+    runs = [m for m in messages if 'runs = ' in m]
+    assert len(runs) == 2
+    # the pending repeats have been cancelled
+    assert all(int(m.split('runs = ')[1].split(',')[0]) < 10 for m in runs), runs
+
+
+def test_failure_ratio_budget(tmp_path):
+    messages = []
+    with StubServer() as stub:
+        run_with_budget(
+            tmp_path,
+            stub,
+            {
+                'number': 2,
+                'call_number': 1000,
+                'stats_interval': 0.2,
+                'extra_args': ['-fake_sleep', '30', '-fake_failed', '500'],
+            },
+            {'max_failure_ratio': 0.1, 'min_calls': 10},
+            messages,
+        )
+    assert any('failed calls out of' in m for m in messages), messages
+    assert len([m for m in messages if m.endswith("terminated")]) == 2, messages
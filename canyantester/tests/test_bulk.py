@@ -0,0 +1,121 @@
+import threading
+import yaml
+
+from canyantester import run_tester
+from canyantester.bulk import iter_rows, run_bulk_step, shard_injection_file
+from canyantester.steps import get_referenced_names
+from canyantester.tests.helpers import FAKESIPP
+from canyantester.tests.server import StubServer
+
+
+def test_run_bulk_step(tmp_path):
+    lock = threading.Lock()
+    calls = []
+
+    def call(config, values):
+        with lock:
+            calls.append(config['payload']['name'])
+        return {'id': 'id-%s' % values['item']['index']}
+
+    filename = str(tmp_path / 'bulk.csv')
+    config = {
+        'count': 250,
+        'batch_size': 100,
+        'store_response': 'account',
+        'payload': {'name': 'account_{item.index}'},
+        'fields': ['{account.id}', '{item.index}', '{tenant.id}'],
+    }
+    result = run_bulk_step(call, config, {'tenant': {'id': 't'}}, filename, 8)
+    assert result == {'count': 250, 'filename': filename}
+    # the payload of the step is never resolved in place
+    assert config['payload'] == {'name': 'account_{item.index}'}
+    assert len(calls) == 250
+    rows = list(iter_rows(filename))
+    assert rows[0] == ['id-0', '0', 't'] and rows[-1] == ['id-249', '249', 't']
+
+    deleted = []
+    run_bulk_step(
+        lambda config, values: deleted.append(values['item']['0']),
+        {'foreach': 'accounts'},
+        {'accounts': result},
+        concurrency=1,
+    )
+    assert deleted == ['id-%d' % i for i in range(250)]
+    assert get_referenced_names({'foreach': 'accounts'}) == {'accounts'}
+
+
+def test_shard_injection_file(tmp_path):
+    filename = str(tmp_path / 'bulk.csv')
+    with open(filename, 'w') as f:
+        f.write(''.join('%d;x\n' % i for i in range(5)))
+    shards = shard_injection_file(filename, 2)
+    with open(shards[0]) as f:
+        assert f.read() == 'SEQUENTIAL\n0;x\n1;x\n2;x\n'
+    with open(shards[1]) as f:
+        assert f.read() == 'SEQUENTIAL\n3;x\n4;x\n'
+    # no shard is left without rows
+    shards = shard_injection_file(filename, 8, 'RANDOM')
+    assert len(shards) == 5
+    with open(shards[4]) as f:
+        assert f.read() == 'RANDOM\n4;x\n'
+
+
+def test_bulk_provisioning(tmp_path):
+    with StubServer() as stub:
+        config = tmp_path / 'config.yaml'
+        config.write_text(
+            yaml.dump(
+                {
+                    'setup': [
+                        {'uri': '/tenants/', 'store_response': 'tenant'},
+                        {
+                            'uri': '/accounts/',
+                            'count': 10,
+                            'store_response': 'account',
+                            'payload': {
+                                'name': 'account_{item.index}',
+                                'tenant_id': '{tenant.id}',
+                            },
+                            'fields': ['{account.id}', '{account.name}'],
+                        },
+                    ],
+                    'workers': [
+                        {
+                            'number': 3,
+                            'injection': 'account',
+                            'values': {'call_duration': 1000},
+                        }
+                    ],
+                    'teardown': [
+                        {
+                            'uri': '/accounts/{item.0}',
+                            'method': 'DELETE',
+                            'foreach': 'account',
+                        }
+                    ],
+                }
+            )
+        )
+        messages = []
+        run_tester(
+            str(config),
+            executable=FAKESIPP,
+            directory=str(tmp_path),
+            apiurl=stub.url,
+            echo=messages.append,
+        )
+        posts = [r for r in stub.requests if r[:2] == ('POST', '/accounts/')]
+        assert sorted(r[2]['name'] for r in posts) == sorted(
+            'account_%d' % i for i in range(10)
+        )
+        deletes = [r[1] for r in stub.requests if r[0] == 'DELETE']
+        assert len(deletes) == 10 and len(set(deletes)) == 10
+
+    commands = [m for m in messages if ' -inf ' in m]
+    assert len(commands) == 3
+    rows = []
+    for j in range(3):
+        shard = str(tmp_path / ('bulk-account-%06d.csv' % j))
+        assert any(shard in command for command in commands)
+        rows.extend(list(iter_rows(shard))[1:])
+    assert sorted(row[1] for row in rows) == sorted('account_%d' % i for i in range(10))
@@ -0,0 +1,116 @@
+import json
+import pytest  # type: ignore
+import yaml
+
+from canyantester import run_capacity
+from canyantester.capacity import (
+    build_window_config,
+    check_slo,
+    get_capacity_config,
+    search_capacity,
+)
+from canyantester.tests.helpers import FAKESIPP
+
+
+def summary(calls, failed, p95=10.0):
+    return {
+        'calls': calls,
+        'failed': failed,
+        'throughput': calls,
+        'response_time': {'p50': p95, 'p95': p95, 'p99': p95},
+    }
+
+
+def test_check_slo():
+    slo = {
+        'max_failure_rate': 0.01,
+        'max_response_time': {'percentile': 95, 'value': 100},
+    }
+    assert check_slo(summary(100, 1), slo) is None
+    assert check_slo(summary(100, 2), slo).startswith('failure rate')
+    assert check_slo(summary(100, 0, p95=150.0), slo).startswith('p95')
+    assert check_slo(summary(0, 0), slo) == 'no calls'
+
+
+def test_get_capacity_config():
+    assert get_capacity_config({})['parameter'] == 'call_rate'
+    with pytest.raises(RuntimeError):
+        get_capacity_config({'capacity': {'parameter': 'call_number'}})
+    with pytest.raises(RuntimeError):
+        get_capacity_config(
+            {'capacity': {'slo': {'max_response_time': {'percentile': 42}}}}
+        )
+
+
+def test_build_window_config():
+    worker = {'call_rate': 1, 'call_number': 5, 'extra_args': '-trace_err'}
+    config = build_window_config(worker, 'call_rate', 20, 10)
+    assert config['call_rate'] == 20 and config['call_number'] == 200
+    assert worker['call_rate'] == 1
+    config = build_window_config(worker, 'call_limit', 50, 10)
+    assert config['call_limit'] == 50
+    assert config['extra_args'] == ['-trace_err', '-timeout', '10s']
+
+
+def test_search_capacity():
+    measured = []
+
+    def measure(value):
+        measured.append(value)
+        return {'value': value, 'passed': value <= 70, 'reason': 'too high'}
+
+    best, points = search_capacity(measure, 10, 1000, log=lambda _: None)
+    assert best == 70
+    assert measured[:4] == [10, 20, 40, 80]
+    assert [point['value'] for point in points] == sorted(measured)
+    assert search_capacity(measure, 100, 1000, log=lambda _: None)[0] is None
+    assert search_capacity(measure, 10, 50, log=lambda _: None)[0] == 50
+
+    # int(1 * 1.5) == 1, the value still grows
+    measured[:] = []
+    best, _ = search_capacity(measure, 1, 1000, factor=1.5, log=lambda _: None)
+    assert best == 70
+    assert measured[:5] == [1, 2, 3, 4, 6]
+
+
+def test_run_capacity(tmp_path):
+    config = tmp_path / 'capacity.yaml'
+    config.write_text(
+        yaml.dump(
+            {
+                'workers': [
+                    {
+                        'call_rate': 1,
+                        'stats_interval': 0.1,
+                        'extra_args': ['-fake_capacity', '35'],
+                        'values': {'call_duration': 1000},
+                    }
+                ],
+                'capacity': {
+                    'start': 5,
+                    'max': 100,
+                    'window': 1,
+                    'slo': {
+                        'max_failure_rate': 0.01,
+                        'max_response_time': {'percentile': 95, 'value': 50},
+                    },
+                },
+            }
+        )
+    )
+    output = str(tmp_path / 'capacity.json')
+    best = run_capacity(
+        str(config),
+        executable=FAKESIPP,
+        directory=str(tmp_path),
+        seed=1,
+        output=output,
+        echo=lambda _: None,
+    )
+    assert best == 35
+    with open(output) as f:
+        result = json.load(f)
+    assert result['max_sustainable'] == 35
+    values = [point['value'] for point in result['points']]
+    assert values == sorted(values) and 35 in values and 40 in values
+    assert all(point['passed'] == (point['value'] <= 35) for point in result['points'])
@@ -0,0 +1,131 @@
+import json
+import pytest  # type: ignore
+
+from canyantester import do_check
+from canyantester.checks import compare_response, match_subset, poll_check
+from canyantester.client import HTTPClient
+from canyantester.metrics import Metrics
+from canyantester.tests.server import StubServer
+
+
+def test_match_subset():
+    actual = {'id': 1, 'cdrs': [{'cost': 2, 'rated': True}], 'extra': 'x'}
+    assert match_subset({'cdrs': [{'rated': True}]}, actual)
+    assert not match_subset({'cdrs': [{'rated': False}]}, actual)
+    assert not match_subset({'cdrs': []}, actual)
+    assert not match_subset({'missing': None}, actual)
+
+
+def test_compare_response():
+    data = {'items': [{'cost': 2}], 'total': 1}
+    config = {'expected_response': json.dumps({'total': 1}), 'match': 'subset'}
+    assert compare_response(config, data) is None
+    assert compare_response(dict(config, match='exact'), data) is not None
+    paths = {'expected_paths': {'items.0.cost': 2, 'total': 1}}
+    assert compare_response(paths, data) is None
+    assert compare_response({'expected_paths': {'items.1.cost': 2}}, data) == (
+        'items.1.cost is missing'
+    )
+    assert 'expected 3' in compare_response({'expected_paths': {'total': 3}}, data)
+
+
+def test_poll_check():
+    responses = [{'rated': False}, {'rated': False}, {'rated': True}]
+    sleeps = []
+    config = {
+        'expected_paths': {'rated': True},
+        'timeout': 10,
+        'poll_interval': 0.5,
+        'max_interval': 1.5,
+        'backoff': 2,
+    }
+    data, elapsed, attempts = poll_check(
+        lambda: responses.pop(0), config, log=lambda _: None, sleep=sleeps.append
+    )
+    assert data == {'rated': True} and attempts == 3 and elapsed >= 0
+    assert sleeps == [0.5, 1.0]
+
+    # without a timeout the API is called once
+    with pytest.raises(RuntimeError):
+        poll_check(lambda: {'rated': False}, {'expected_paths': {'rated': True}})
+
+
+def test_poll_check_deadline():
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise RuntimeError()
+
+    config = {'expected_paths': {'rated': True}, 'timeout': 0.3, 'poll_interval': 0.1}
+    with pytest.raises(RuntimeError):
+        poll_check(call, config, log=lambda _: None)
+    assert 2 <= len(calls) <= 3
+
+
+def test_do_check_polls_until_converged():
+    with StubServer() as stub:
+        stub.responses['/cdrs/1'] = [
+            (404, {}),
+            (200, {'rated': False, 'cost': None}),
+            (200, {'rated': True, 'cost': 3, 'carrier': 'c'}),
+        ]
+        config_data = {
+            'check': [
+                {
+                    'uri': '/cdrs/1',
+                    'method': 'GET',
+                    'timeout': 5,
+                    'poll_interval': 0.05,
+                    'match': 'subset',
+                    'expected_response': '{"rated": true, "cost": 3}',
+                    'store_response': 'cdr',
+                }
+            ]
+        }
+        messages = []
+        stored_responses = {}
+        metrics = Metrics()
+        client = HTTPClient()
+        do_check(
+            config_data,
+            stub.url,
+            stored_responses,
+            False,
+            echo=messages.append,
+            client=client,
+            metrics=metrics,
+        )
+        client.close()
+    assert len(stub.requests) == 3
+    assert stored_responses['cdr']['carrier'] == 'c'
+    assert any('after 3 attempts' in message for message in messages)
+    assert (
+        'canyantester_check_convergence_seconds_count{step="0"} 1' in metrics.render()
+    )
+
+
+def test_do_check_list_response():
+    with StubServer() as stub:
+        stub.responses['/rates'] = [(200, [{'prefix': '39'}, {'prefix': '44'}])]
+        config_data = {
+            'check': [
+                {
+                    'uri': '/rates',
+                    'expected_response': '[{"prefix": "39"}, {"prefix": "44"}]',
+                    'store_response': 'rates',
+                }
+            ]
+        }
+        stored_responses = {}
+        client = HTTPClient()
+        do_check(
+            config_data,
+            stub.url,
+            stored_responses,
+            False,
+            echo=lambda _: None,
+            client=client,
+        )
+        client.close()
+    assert stored_responses['rates'][1] == {'prefix': '44'}
@@ -0,0 +1,91 @@
+import pytest  # type: ignore
+import requests
+
+from canyantester.api import api_client
+from canyantester.client import HTTPClient
+
+from .server import StubServer
+
+
+def test_keep_alive():
+    with StubServer() as server:
+        client = HTTPClient()
+        for _ in range(5):
+            response = client.post('%s/tenants/' % server.url, json={'name': 'a'})
+            assert response.status_code == 200
+        client.close()
+    assert len(server.requests) == 5
+    assert len(server.connections) == 1
+
+
+def test_retry_on_server_error():
+    with StubServer() as server:
+        server.responses['/tenants/'] = [(503, {}), (502, {}), (200, {'id': 1})]
+        client = HTTPClient(backoff_factor=0.01)
+        response = client.post('%s/tenants/' % server.url, json={})
+        assert response.status_code == 200
+        assert response.json() == {'id': 1}
+    assert [call['status_code'] for call in client.get_calls()] == [503, 502, 200]
+    stats = client.get_stats()
+    assert stats['calls'] == 3
+    assert stats['errors'] == 2
+    assert stats['max'] >= stats['p50'] > 0
+
+
+def test_retry_exhausted():
+    with StubServer() as server:
+        server.responses['/tenants/'] = [(500, {})]
+        client = HTTPClient(retries=2, backoff_factor=0.01)
+        response = client.post('%s/tenants/' % server.url, json={})
+    assert response.status_code == 500
+    assert len(server.requests) == 3
+
+
+def test_retry_on_connection_error():
+    with StubServer() as server:
+        url = server.url
+    client = HTTPClient(retries=1, backoff_factor=0.01, timeout=1)
+    with pytest.raises(requests.ConnectionError):
+        client.post('%s/tenants/' % url, json={})
+    assert [call['status_code'] for call in client.get_calls()] == [None, None]
+
+
+def test_api_client_shares_client(monkeypatch):
+    resolved = []
+
+    def gethostbyname(hostname):
+        resolved.append(hostname)
+        return '10.0.0.1'
+
+    monkeypatch.setattr('socket.gethostbyname', gethostbyname)
+    stored_responses = {}
+    with StubServer() as server:
+        client = HTTPClient()
+        stored_responses['tenant'] = api_client(
+            server.url,
+            {'uri': '/tenants/', 'payload': {'name': 'tenant_{random.uuid4}'}},
+            stored_responses,
+            client=client,
+        )
+        response = api_client(
+            server.url,
+            {
+                'uri': '/carrier_trunks/',
+                'payload': {
+                    'tenant_id': '{tenant.id}',
+                    'ip_address': '{ipaddr.ip}',
+                },
+            },
+            stored_responses,
+            client=client,
+        )
+        assert api_client(
+            server.url,
+            {'uri': '/tenants/{tenant.id}', 'method': 'DELETE'},
+            stored_responses,
+            client=client,
+        )
+    assert response['tenant_id'] == stored_responses['tenant']['id']
+    assert response['ip_address'] == '10.0.0.1'
+    assert len(resolved) == 1
+    assert len(server.connections) == 1
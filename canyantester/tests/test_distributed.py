@@ -0,0 +1,161 @@
+import os
+import pytest  # type: ignore
+import socket
+import subprocess
+import sys
+
+from canyantester import run_tester
+from canyantester.distributed import Coordinator, run_agent, shard_workers
+
+from .helpers import FAKESIPP, write_config
+
+
+TOKEN = 'secret'
+
+AGENT = (
+    "import sys; from canyantester import canyantester; "
+    "sys.argv[0] = 'canyantester'; canyantester()"
+)
+
+
+def get_free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_agents(number, port, directory):
+    agents = []
+    for i in range(number):
+        agent_directory = os.path.join(directory, 'agent%d' % i)
+        os.mkdir(agent_directory)
+        agents.append(
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    '-c',
+                    AGENT,
+                    'agent',
+                    'http://127.0.0.1:%d' % port,
+                    '-e',
+                    FAKESIPP,
+                    '-d',
+                    agent_directory,
+                ],
+                env=dict(os.environ, CANYANTESTER_TOKEN=TOKEN),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        )
+    return agents
+
+
+def write_agents_config(directory, failed=0, sleep=0.2, **sections):
+    return write_config(
+        directory,
+        scenario='<user>%(to_user)s</user>',
+        sections=sections,
+        number=5,
+        call_number=10,
+        stats_interval=0.1,
+        extra_args='-fake_sleep %s -fake_failed %d' % (sleep, failed),
+        values={'to_user': ['alice', 'bob']},
+    )
+
+
+def test_shard_workers():
+    shards = shard_workers(list(range(5)), ['a', 'b'])
+    assert shards == {'a': [0, 2, 4], 'b': [1, 3]}
+
+
+@pytest.mark.parametrize('failed', [0, 10])
+def test_agents(tmp_path, failed):
+    directory = str(tmp_path)
+    config = write_agents_config(directory, failed)
+    port = get_free_port()
+    agents = start_agents(2, port, directory)
+    output = []
+    try:
+        if failed:
+            with pytest.raises(RuntimeError):
+                run_tester(
+                    config=config,
+                    directory=directory,
+                    agents=2,
+                    listen='127.0.0.1:%d' % port,
+                    token=TOKEN,
+                    stats=True,
+                    agents_timeout=30,
+                    start_delay=0.5,
+                    echo=output.append,
+                )
+        else:
+            run_tester(
+                config=config,
+                directory=directory,
+                agents=2,
+                listen='127.0.0.1:%d' % port,
+                token=TOKEN,
+                stats=True,
+                agents_timeout=30,
+                start_delay=0.5,
+                echo=output.append,
+            )
+    finally:
+        for agent in agents:
+            agent.wait(timeout=30)
+    assert [agent.returncode for agent in agents] == [0, 0]
+    results = [line for line in output if 'agent = ' in line]
+    assert len(results) == 5
+    assert len(set(line.rsplit(' ', 1)[1] for line in results)) == 2
+    summary = [line for line in output if line.startswith('\nGlobal statistics')]
+    assert 'calls = 50, successful = %d' % (50 - failed * 5) in summary[0]
+
+
+def test_agents_failure_budget(tmp_path):
+    directory = str(tmp_path)
+    config = write_agents_config(
+        directory,
+        failed=10,
+        sleep=30,
+        failure_budget={'max_failure_ratio': 0.1, 'min_calls': 1},
+    )
+    port = get_free_port()
+    agents = start_agents(2, port, directory)
+    output = []
+    try:
+        with pytest.raises(RuntimeError) as e:
+            run_tester(
+                config=config,
+                directory=directory,
+                agents=2,
+                listen='127.0.0.1:%d' % port,
+                token=TOKEN,
+                agents_timeout=30,
+                start_delay=0.5,
+                echo=output.append,
+            )
+        assert 'Failure budget exceeded' in str(e.value)
+    finally:
+        for agent in agents:
+            agent.wait(timeout=15)
+    assert [agent.returncode for agent in agents] == [0, 0]
+    results = [line for line in output if 'agent = ' in line]
+    assert len(results) == 5
+    assert all('exit codes = -1' in line for line in results), results
+
+
+def test_agent_token(tmp_path):
+    with pytest.raises(RuntimeError):
+        Coordinator(None)
+    coordinator = Coordinator(TOKEN, port=0, log=lambda _: None)
+    coordinator.start()
+    try:
+        url = 'http://127.0.0.1:%d' % coordinator.get_port()
+        with pytest.raises(RuntimeError, match='rejected the token'):
+            run_agent(url, 'wrong', directory=str(tmp_path), log=lambda _: None)
+        assert coordinator.wait_for_agents(0) == []
+    finally:
+        coordinator.stop()
@@ -0,0 +1,87 @@
+import os
+import pytest  # type: ignore
+import stat
+
+from canyantester import run_tester
+from canyantester.engine import run_workers
+from canyantester.kamailio import KamailioXHTTPWorker
+from canyantester.sipp import SippWorker
+
+from .helpers import write_config
+from .server import StubServer
+
+
+def write_executable(directory, body):
+    filename = os.path.join(directory, 'fakesipp')
+    with open(filename, 'w') as f:
+        f.write('#!/bin/sh\n%s\n' % body)
+    os.chmod(filename, os.stat(filename).st_mode | stat.S_IEXEC)
+    return filename
+
+
+def test_run_tester_success(tmp_path):
+    config = write_config(str(tmp_path), number=3, repeat=2)
+    run_tester(config=config, executable='/bin/true', directory=str(tmp_path))
+
+
+def test_run_tester_failure(tmp_path):
+    config = write_config(str(tmp_path), number=2)
+    with pytest.raises(RuntimeError):
+        run_tester(config=config, executable='/bin/false', directory=str(tmp_path))
+
+
+def test_run_tester_max_errors(tmp_path):
+    config = write_config(str(tmp_path), repeat=2, max_errors=2)
+    run_tester(config=config, executable='/bin/false', directory=str(tmp_path))
+
+
+def test_sipp_worker_timeout(tmp_path):
+    directory = str(tmp_path)
+    write_config(directory)
+    worker = SippWorker(
+        worker_id='000000_000000',
+        config={
+            'scenario': 'scenario.xml',
+            'timeout': 0.2,
+            'repeat': 2,
+            'values': {'call_duration': 1000},
+        },
+        target='127.0.0.1:5060',
+        executable=write_executable(directory, 'exec sleep 10'),
+        directory=directory,
+        basedir=directory,
+        log=lambda *args: None,
+    )
+    worker.setup()
+    run_workers([worker])
+    assert worker.get_exit_codes() == [-1, -1]
+
+
+def test_workers_share_one_timeline(tmp_path):
+    directory = str(tmp_path)
+    write_config(directory)
+    with StubServer() as server:
+        sipp = SippWorker(
+            worker_id='000000_000000',
+            config={'scenario': 'scenario.xml', 'values': {'call_duration': 1000}},
+            target='127.0.0.1:5060',
+            executable=write_executable(directory, 'exec sleep 1'),
+            directory=directory,
+            basedir=directory,
+            log=lambda *args: None,
+        )
+        sipp.setup()
+        kamailio = KamailioXHTTPWorker(
+            worker_id='000001_000000',
+            config={'uri': '%s/rpc' % server.url, 'delay': 0.2},
+            log=lambda *args: None,
+        )
+        timeline = run_workers([sipp, kamailio])
+
+    assert kamailio.get_exit_codes() == [0]
+    assert len(server.requests) == 1
+    events = {event['worker_id']: event for event in timeline.get_events()}
+    assert events['000001_000000']['planned'] == 200
+    assert 0 <= events['000001_000000']['lag'] < 100
+    # the kamailio worker fired while sipp was still running
+    assert events['000001_000000']['fired'] < events['000000_000000']['fired'] + 900
@@ -0,0 +1,78 @@
+import yaml
+
+from canyantester import run_tester
+from canyantester.fixtures import get_fixture_checks, is_fixture_step
+from canyantester.tests.server import StubServer
+
+SETUP = [
+    {'uri': '/tenants/', 'store_response': 'tenant', 'payload': {'name': 't'}},
+    {
+        'uri': '/domains/',
+        'store_response': 'domain',
+        'payload': {'tenant_id': '{tenant.id}'},
+        'exists_uri': '/tenants/{tenant.id}/domains/{domain.id}',
+    },
+]
+TEARDOWN = [
+    {'uri': '/domains/{domain.id}', 'method': 'DELETE'},
+    {'uri': '/tenants/{tenant.id}', 'method': 'DELETE'},
+    {'uri': '/sessions/', 'method': 'DELETE'},
+]
+
+
+def test_get_fixture_checks():
+    stored_responses = {'tenant': {'id': 't1'}, 'domain': {'id': 'd1'}}
+    assert get_fixture_checks(SETUP, 'http://api', stored_responses) == [
+        'http://api/tenants/t1',
+        'http://api/tenants/t1/domains/d1',
+    ]
+    assert [is_fixture_step(step, {'tenant', 'domain'}) for step in TEARDOWN] == [
+        True,
+        True,
+        False,
+    ]
+
+
+def test_cached_fixtures(tmp_path):
+    with StubServer() as stub:
+        config = tmp_path / 'config.yaml'
+        config.write_text(
+            yaml.dump(
+                {
+                    'setup': SETUP,
+                    'workers': [{'type': 'kamailio_xhttp', 'uri': '%s/RPC' % stub.url}],
+                    'teardown': TEARDOWN,
+                }
+            )
+        )
+        cache = str(tmp_path / 'cache')
+
+        def run():
+            del stub.requests[:]
+            run_tester(
+                str(config),
+                directory=str(tmp_path),
+                apiurl=stub.url,
+                cache_accounts=cache,
+                echo=lambda _: None,
+            )
+            return [(method, path) for method, path, _ in stub.requests]
+
+        # provisioned once, only the teardown of the other entities runs
+        assert run() == [
+            ('POST', '/tenants/'),
+            ('POST', '/domains/'),
+            ('POST', '/RPC'),
+            ('DELETE', '/sessions/'),
+        ]
+        requests = run()
+        assert [r for r in requests if r[0] == 'POST'] == [('POST', '/RPC')]
+        assert len([r for r in requests if r[0] == 'GET']) == 2
+        assert ('DELETE', '/sessions/') in requests
+
+        # entities removed behind our back are provisioned again
+        stub.responses = dict(
+            (path, [(404, {})]) for method, path in requests if method == 'GET'
+        )
+        requests = run()
+        assert ('POST', '/tenants/') in requests and ('POST', '/domains/') in requests
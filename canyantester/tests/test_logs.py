@@ -0,0 +1,143 @@
+import gzip
+import os
+import threading
+
+from canyantester.engine import run_workers
+from canyantester.logs import LogSink, OutputLog, RingBuffer, RotatingLog
+from canyantester.sipp import SippWorker
+from canyantester.tests.helpers import FAKESIPP
+
+
+def test_log_sink():
+    messages = []
+    release = threading.Event()
+
+    def echo(message):
+        # a slow terminal does not block the callers
+        release.wait()
+        messages.append(message)
+
+    sink = LogSink(echo, size=3)
+    for i in range(10):
+        sink('message %d' % i)
+    release.set()
+    sink.close()
+    assert messages[0] == 'message 0'
+    assert messages[-1].endswith('log messages dropped')
+    kept = messages[:-1]
+    assert kept == sorted(kept) and 3 <= len(kept) <= 4
+    assert int(messages[-1].split()[0]) == 10 - len(kept)
+
+
+def test_log_sink_errors(capsys):
+    messages = []
+
+    def echo(message):
+        if message == 'broken':
+            raise OSError('closed')
+        messages.append(message)
+
+    sink = LogSink(echo, size=1)
+    for message in ('first', 'broken', 'last'):
+        sink(message)
+        # the consumer survives the failure, the queue keeps being emptied
+        while not sink._queue.empty():
+            pass
+    sink.close()
+    assert messages == ['first', 'last']
+    assert (
+        '1 log messages failed to be echoed: OSError: closed' in capsys.readouterr().err
+    )
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(16)
+    buffer.write(b'first line\n')
+    assert buffer.get_lines() == ['first line']
+    buffer.write(b'second\nthird\n')
+    assert buffer.getvalue() == b'ne\nsecond\nthird\n'
+    assert buffer.get_lines() == ['second', 'third']
+
+
+def test_rotating_log(tmp_path):
+    filename = str(tmp_path / 'sipp.log')
+    with RotatingLog(filename, max_bytes=10, backups=2) as log:
+        for i in range(5):
+            log.write(b'%010d' % i)
+    assert log.get_filenames() == [
+        filename + '.gz',
+        filename + '.1.gz',
+        filename + '.2.gz',
+    ]
+    with gzip.open(filename + '.gz') as f:
+        assert f.read() == b'0000000004'
+    with gzip.open(filename + '.2.gz') as f:
+        assert f.read() == b'0000000002'
+    log.remove()
+    assert log.get_filenames() == []
+
+
+def test_output_log(tmp_path):
+    filename = str(tmp_path / 'sipp.log')
+    with OutputLog(filename, buffer_size=16) as output:
+        output.write(b'short\n')
+    # the short outputs stay in memory
+    assert output.get_filenames() == []
+    output.save()
+    with gzip.open(filename + '.gz') as f:
+        assert f.read() == b'short\n'
+
+    with OutputLog(filename, buffer_size=16) as output:
+        assert output.get_filenames() == []
+        output.write(b'first line\n')
+        output.write(b'second line\n')
+        assert output.get_filenames() == [filename + '.gz']
+        output.write(b'third line\n')
+    with gzip.open(filename + '.gz') as f:
+        assert f.read() == b'first line\nsecond line\nthird line\n'
+    assert output.buffer.get_lines() == ['third line']
+    output.remove()
+    assert output.get_filenames() == []
+
+
+def run_worker(directory, worker_id, extra_args):
+    messages = []
+    worker = SippWorker(
+        worker_id=worker_id,
+        config={
+            'scenario': 'scenario.xml',
+            'stats': False,
+            'output_buffer': 64,
+            'extra_args': extra_args,
+        },
+        target='127.0.0.1:5060',
+        executable=FAKESIPP,
+        directory=directory,
+        basedir=directory,
+        log=messages.append,
+    )
+    worker.setup()
+    run_workers([worker])
+    worker.debug()
+    return worker, messages
+
+
+def test_sipp_output(tmp_path):
+    directory = str(tmp_path)
+    with open(os.path.join(directory, 'scenario.xml'), 'w') as f:
+        f.write('<scenario/>')
+    filename = os.path.join(directory, 'sipp-000000_000000.log.gz')
+    worker, messages = run_worker(
+        directory, '000000_000000', '-fake_output 100 -fake_exit 1'
+    )
+    assert worker.get_exit_status() != 0
+    with gzip.open(filename) as f:
+        assert f.read().decode('utf-8').splitlines()[-1] == 'fake output line 99'
+    assert messages[-1] == '[000000_000000] | fake output line 99'
+    assert '[000000_000000] | fake output line 90' not in messages
+
+    # the output of the workers passing is not kept
+    worker, messages = run_worker(directory, '000000_000001', '-fake_output 100')
+    assert worker.get_exit_status() == 0
+    assert not os.path.exists(os.path.join(directory, 'sipp-000000_000001.log.gz'))
+    assert messages[-1].endswith('output = -')
@@ -0,0 +1,139 @@
+import csv
+import pytest  # type: ignore
+import yaml
+
+from canyantester import run_matrix
+from canyantester.matrix import (
+    build_cell_config,
+    format_table,
+    get_cells,
+    get_matrix_config,
+    schedule_cells,
+)
+from canyantester.tests.helpers import FAKESIPP
+from canyantester.tests.server import StubServer
+
+
+def test_get_matrix_config():
+    config = get_matrix_config(
+        {'workers': [{}], 'matrix': {'parameters': {'call_rate': [1, 2]}}}
+    )
+    assert (config['worker'], config['parallel']) == (0, 1)
+    for matrix in (
+        {},
+        {'parameters': {'type': ['uac']}},
+        {'parameters': {'call_rate': 10}},
+        {'parameters': {'call_rate': [1]}, 'worker': 1},
+        {'parameters': {'call_rate': [1]}, 'parallel': 0},
+    ):
+        with pytest.raises(RuntimeError):
+            get_matrix_config({'workers': [{}], 'matrix': matrix})
+
+
+def test_cells():
+    cells = get_cells({'call_rate': [10, 20], 'values.call_duration': [1, 2, 3]})
+    assert len(cells) == 6
+    assert list(cells[1].items()) == [('call_rate', 10), ('values.call_duration', 2)]
+    worker = {'call_rate': 1, 'values': {'to_user': 'bob'}}
+    config = build_cell_config(worker, cells[1])
+    assert config['call_rate'] == 10
+    assert config['values'] == {'to_user': 'bob', 'call_duration': 2}
+    assert worker == {'call_rate': 1, 'values': {'to_user': 'bob'}}
+
+
+def test_schedule_cells():
+    assert schedule_cells([1, 1, 1]) == [[0], [1], [2]]
+    assert schedule_cells([2, 2, 2, 2, 2], parallel=2) == [[0, 1], [2, 3], [4]]
+    assert schedule_cells([2, 2, 5, 1], parallel=4, max_instances=4) == [
+        [0, 1],
+        [2],
+        [3],
+    ]
+
+
+def test_format_table():
+    rows = [
+        {'call_rate': 10, 'calls': 5, 'successful': 5, 'failed': 0},
+        {'call_rate': 100, 'calls': 50, 'successful': 40, 'failed': 10},
+    ]
+    for row in rows:
+        row.update(throughput=1.5, p50=None, p95=None, p99=None, exit_status=0)
+    lines = format_table(['call_rate'], rows)
+    assert lines[0].split() == [
+        'call_rate',
+        'calls',
+        'successful',
+        'failed',
+        'throughput',
+        'p50',
+        'p95',
+        'p99',
+        'exit_status',
+    ]
+    assert lines[2].split()[:5] == ['100', '50', '40', '10', '1.500']
+    assert len(set(len(line) for line in lines)) == 1
+
+
+@pytest.mark.parametrize('parallel', [1, 4])
+def test_run_matrix(tmp_path, parallel):
+    config = tmp_path / 'matrix.yaml'
+    config.write_text(
+        yaml.dump(
+            {
+                'setup': [
+                    {
+                        'name': 'create',
+                        'uri': '/accounts',
+                        'method': 'POST',
+                        'payload': {'name': 'alice'},
+                    }
+                ],
+                'workers': [
+                    {
+                        'number': 2,
+                        'extra_args': ['-fake_capacity', '15'],
+                        'values': {'call_duration': 1000},
+                    }
+                ],
+                'matrix': {
+                    'parameters': {'call_rate': [10, 20], 'call_number': [5, 40]},
+                    'parallel': parallel,
+                },
+            },
+            sort_keys=False,
+        )
+    )
+    output = str(tmp_path / 'matrix.csv')
+    messages = []
+    with StubServer() as stub:
+        # the cells with failed calls fail the run once reported
+        with pytest.raises(RuntimeError, match='Error detected in 2 of 4 cells'):
+            run_matrix(
+                str(config),
+                executable=FAKESIPP,
+                directory=str(tmp_path),
+                apiurl=stub.url,
+                signalling_ports='5061-5999',
+                output=output,
+                echo=messages.append,
+            )
+    # provisioned once for all the cells
+    assert [r for r in stub.requests if r[0] == 'POST'] == [
+        ('POST', '/accounts', {'name': 'alice'})
+    ]
+    with open(output) as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['call_rate'], row['call_number']) for row in rows] == [
+        ('10', '5'),
+        ('10', '40'),
+        ('20', '5'),
+        ('20', '40'),
+    ]
+    assert [row['calls'] for row in rows] == ['10', '80', '10', '80']
+    assert [row['failed'] for row in rows] == ['0', '0', '2', '20']
+    assert [row['exit_status'] for row in rows] == ['0', '0', '1', '1']
+    assert '\nMatrix results:' in messages
+    # the signalling ports are taken from the given range
+    commands = [m for m in messages if '(delay = ' in m]
+    assert len(commands) == 8
+    assert all(' -p 5' in m for m in commands)
@@ -0,0 +1,75 @@
+import requests
+
+from canyantester.client import HTTPClient
+from canyantester.metrics import Metrics, MetricsServer
+from canyantester.stats import SippStats
+
+from .server import StubServer
+
+
+def test_render():
+    metrics = Metrics()
+    metrics.inc('canyantester_sipp_processes')
+    metrics.inc('canyantester_sipp_processes')
+    metrics.inc('canyantester_sipp_processes', value=-1)
+    metrics.observe(
+        'canyantester_step_duration_seconds', {'phase': 'setup', 'type': 'api'}, 0.2
+    )
+    for worker_id, failed in (('000000_000000', 1), ('000000_000001', 2)):
+        stats = SippStats()
+        stats.add_stat_row(
+            {
+                'TotalCallCreated': '10',
+                'SuccessfulCall(C)': str(10 - failed),
+                'FailedCall(C)': str(failed),
+                'FailedMaxUDPRetrans(C)': str(failed),
+                'CallRate(P)': '2.5',
+            }
+        )
+        metrics.set_worker_stats(worker_id, stats)
+    lines = metrics.render().splitlines()
+    assert '# TYPE canyantester_sipp_processes gauge' in lines
+    assert 'canyantester_sipp_processes 1' in lines
+    assert 'canyantester_calls_total{group="000000",result="created"} 20' in lines
+    assert 'canyantester_calls_total{group="000000",result="failed"} 3' in lines
+    assert (
+        'canyantester_call_failures_total{group="000000",reason="MaxUDPRetrans"} 3'
+        in lines
+    )
+    assert 'canyantester_call_rate{group="000000"} 5.0' in lines
+    assert (
+        'canyantester_step_duration_seconds_bucket'
+        '{phase="setup",type="api",le="0.1"} 0' in lines
+    )
+    assert (
+        'canyantester_step_duration_seconds_bucket'
+        '{phase="setup",type="api",le="0.25"} 1' in lines
+    )
+    assert (
+        'canyantester_step_duration_seconds_count{phase="setup",type="api"} 1'
+        in lines
+    )
+
+
+def test_metrics_server():
+    metrics = Metrics()
+    server = MetricsServer(metrics, '127.0.0.1', 0)
+    server.start()
+    try:
+        with StubServer() as api:
+            client = HTTPClient(metrics=metrics)
+            client.post('%s/tenants/' % api.url, json={})
+            client.close()
+        url = 'http://127.0.0.1:%d' % server.get_port()
+        response = requests.get('%s/metrics' % url)
+        assert requests.get('%s/other' % url).status_code == 404
+    finally:
+        server.stop()
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert (
+        'canyantester_api_request_duration_seconds_count'
+        '{host="%s",method="POST",status="200"} 1'
+        % api.url.split('//', 1)[1]
+        in response.text.splitlines()
+    )
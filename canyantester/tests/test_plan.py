@@ -0,0 +1,137 @@
+import copy
+import json
+import os
+import pytest  # type: ignore
+import tempfile
+import yaml
+
+from canyantester import run_plan, run_tester
+from canyantester.tests.helpers import FAKESIPP
+from canyantester.tests.server import StubServer
+
+
+CONFIG = {
+    'setup': [
+        {'uri': '/tenants', 'store_response': 'tenant', 'payload': {'name': 'a'}},
+        {
+            'uri': '/domains',
+            'store_response': 'domain',
+            'payload': {'tenant_id': '{tenant.id}'},
+        },
+    ],
+    'workers': [
+        {
+            'number': {'min': 1, 'max': 4},
+            'call_rate': {'min': 1, 'max': 1000},
+            'values': {'call_duration': {'min': 1000, 'max': 2000}},
+        },
+        {'number': 2, 'values': {'to_domain': '{domain.domain}'}},
+        {'type': 'kamailio_xhttp', 'uri': 'http://router:8000/rpc', 'delay': 1.5},
+    ],
+}
+
+
+def compile_plan(tmp_path, seed, config_data=None):
+    config = tmp_path / 'config.yaml'
+    config.write_text(yaml.dump(copy.deepcopy(config_data or CONFIG)))
+    output = tmp_path / ('plan-%d.json' % seed)
+    run_plan(
+        # the plan can be replayed from another directory
+        os.path.relpath(str(config)),
+        executable=FAKESIPP,
+        directory=str(tmp_path),
+        seed=seed,
+        signalling_ports='5061-5999',
+        output=str(output),
+        echo=lambda _: None,
+    )
+    return output
+
+
+def test_plan(tmp_path):
+    with open(str(compile_plan(tmp_path, 1))) as f:
+        plan = json.load(f)
+    assert plan['seed'] == 1
+    assert plan['config']['basedir'] == str(tmp_path)
+    assert [step['depends_on'] for step in plan['steps']['setup']] == [[], [0]]
+    assert plan['steps']['setup'][1]['placeholders'] == ['{tenant.id}']
+    first = [w for w in plan['workers'] if w['group'] == 0]
+    assert 1 <= len(first) <= 4
+    for instance in first:
+        assert instance['pending'] == []
+        assert instance['args'][0] == FAKESIPP
+        assert '{directory}/sipp-%s.xml' % instance['scenario_hash'] in instance['args']
+        assert instance['args'][instance['args'].index('-r') + 1] == str(
+            instance['config']['call_rate']
+        )
+    second = [w for w in plan['workers'] if w['group'] == 1]
+    assert [w['pending'] for w in second] == [['{domain.domain}']] * 2
+    assert [w['args'] for w in second] == [None, None]
+    ports = [w['ports'][1] for w in plan['workers'] if w['ports']]
+    assert len(set(ports)) == len(ports) == len(first) + 2
+    assert plan['workers'][-1]['start_offset'] == 1500
+    # each instance has its own seed, also sent to the agents
+    seeds = [w['seed'] for w in first + second]
+    assert len(set(seeds)) == len(seeds) and all(isinstance(s, int) for s in seeds)
+
+    # the same seed compiles the same plan, another one draws other values
+    assert (
+        compile_plan(tmp_path, 1).read_text() == compile_plan(tmp_path, 1).read_text()
+    )
+    assert (
+        compile_plan(tmp_path, 2).read_text() != compile_plan(tmp_path, 1).read_text()
+    )
+
+
+def test_plan_errors(tmp_path):
+    with pytest.raises(RuntimeError):
+        compile_plan(tmp_path, 1, {'workers': [{'type': 'unknown'}]})
+    with pytest.raises(RuntimeError):
+        compile_plan(tmp_path, 1, {'workers': [{'load_profile': {'type': 'x'}}]})
+
+
+def test_plan_temporary_directory(tmp_path, monkeypatch):
+    temporary = tmp_path / 'tmp'
+    temporary.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(temporary))
+    config = tmp_path / 'config.yaml'
+    config.write_text(yaml.dump(CONFIG))
+    messages = []
+    plan = run_plan(str(config), seed=1, echo=messages.append)
+    assert json.loads(messages[0])['workers'][0]['args'][0] == 'sipp'
+    assert plan['workers'] and os.listdir(str(temporary)) == []
+
+
+def test_run_plan(tmp_path):
+    config = {
+        'workers': [
+            {
+                'number': 2,
+                'call_number': {'min': 1, 'max': 100},
+                'values': {'call_duration': 1000},
+            }
+        ]
+    }
+    with open(str(compile_plan(tmp_path, 42, config))) as f:
+        plan = json.load(f)
+    messages = []
+    with StubServer() as stub:
+        run_tester(
+            str(tmp_path / 'plan-42.json'),
+            seed=1,
+            executable=FAKESIPP,
+            directory=str(tmp_path),
+            apiurl=stub.url,
+            stats=True,
+            echo=messages.append,
+        )
+    assert 'Setting the random seed: 42' in messages
+    for instance in plan['workers']:
+        args = ' '.join(instance['args']).replace('{directory}', str(tmp_path))
+        assert any(
+            m.startswith('[%s] %s' % (instance['worker_id'], args)) for m in messages
+        )
+    calls = sum(instance['config']['call_number'] for instance in plan['workers'])
+    assert any(
+        m.startswith('\nGlobal statistics: calls = %d,' % calls) for m in messages
+    )
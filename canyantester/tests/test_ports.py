@@ -0,0 +1,104 @@
+import pytest  # type: ignore
+import socket
+
+from canyantester.ports import (
+    PortAllocator,
+    Ports,
+    check_ports,
+    is_port_free,
+    parse_port_range,
+)
+from canyantester.sipp import SippWorker
+
+
+def test_parse_port_range():
+    assert parse_port_range('5061-5070') == (5061, 5070)
+    assert parse_port_range('5061') == (5061, 5061)
+    for value in ('5070-5061', 'a-b', '0-10', '60000-70000'):
+        with pytest.raises(RuntimeError):
+            parse_port_range(value)
+
+
+def test_allocate():
+    allocator = PortAllocator(
+        '5061-5064', '10000-10015', 8888, ['10.0.0.1', '10.0.0.2']
+    )
+    ports = [allocator.allocate(media_ports=6, control=True) for _ in range(4)]
+    assert [p.address for p in ports] == ['10.0.0.1', '10.0.0.2'] * 2
+    # each address has its own signalling and media ranges
+    assert [p.signalling for p in ports] == [5061, 5061, 5062, 5062]
+    assert [p.media for p in ports] == [10000, 10000, 10006, 10006]
+    # control ports are shared by all the addresses
+    assert [p.control for p in ports] == [8888, 8889, 8890, 8891]
+    assert allocator.allocate().media is None
+
+
+def test_exhaustion():
+    allocator = PortAllocator('5061-5062', '10000-10007')
+    allocator.allocate(media_ports=4)
+    allocator.allocate(media_ports=4)
+    with pytest.raises(RuntimeError) as e:
+        allocator.allocate(media_ports=4)
+    assert 'exhausted after 2 sipp instances' in str(e.value)
+    with pytest.raises(RuntimeError):
+        PortAllocator('5061-5062', '10000-10007').allocate(media_ports=12)
+    with pytest.raises(RuntimeError):
+        PortAllocator('8000-9000', '10000-10007', control_base=8888)
+
+
+def test_sipp_worker_ports(tmp_path):
+    allocator = PortAllocator(addresses=['10.0.0.1'])
+    worker = SippWorker(
+        worker_id='000000_000000',
+        config={'values': {'call_duration': 1000}, 'extra_args': '-p 6000'},
+        target='127.0.0.1:5060',
+        executable='sipp',
+        directory=str(tmp_path),
+        basedir=str(tmp_path),
+        ports=allocator.allocate(media_ports=100, control=True),
+    )
+    worker.setup()
+    args = ' '.join(worker._args)
+    assert '-cp 8888 -i 10.0.0.1 -mp 10000 -min_rtp_port 10004' in args
+    assert '-max_rtp_port 10099' in args
+    # ports set through extra_args take precedence
+    assert args.count('-p ') == 1 and args.endswith('-p 6000')
+    assert worker.get_control_port() == 8888
+
+
+def test_probe():
+    busy = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    busy.bind(('127.0.0.1', 0))
+    port = busy.getsockname()[1]
+    try:
+        assert not is_port_free('127.0.0.1', port)
+        allocator = PortAllocator(
+            '%d-%d' % (port, port + 1), '10000-10007', 8888, ['127.0.0.1']
+        )
+        # the port in use is skipped
+        assert allocator.allocate().signalling == port + 1
+        with pytest.raises(RuntimeError):
+            check_ports(Ports('127.0.0.1', port, None, 0, None))
+    finally:
+        busy.close()
+    check_ports(Ports('127.0.0.1', port, None, 0, None))
+
+
+def test_default_ranges():
+    # without a range of signalling ports sipp picks its own
+    ports = PortAllocator().allocate(media_ports=4, control=True)
+    assert ports.signalling is None
+    assert ports.media is not None and ports.control is not None
+
+
+def test_shard():
+    ports = []
+    for index in range(2):
+        allocator = PortAllocator('5061-5070', '10000-10015', 8888)
+        allocator.shard(index, 2)
+        ports.append(allocator.allocate(media_ports=4, control=True))
+    assert [p.signalling for p in ports] == [5061, 5066]
+    assert [p.media for p in ports] == [10000, 10008]
+    assert [p.control for p in ports] == [8888, 9388]
+    with pytest.raises(RuntimeError):
+        PortAllocator('5061-5062').shard(0, 3)
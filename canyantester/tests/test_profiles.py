@@ -0,0 +1,81 @@
+import asyncio
+import pytest  # type: ignore
+import socket
+
+from canyantester.engine import run_workers
+from canyantester.profiles import (
+    get_profile_monitors,
+    get_profile_rate,
+    validate_profile,
+)
+from canyantester.worker import Worker
+
+
+class ControlledWorker(Worker):
+    def __init__(self, worker_id, profile, port, duration):
+        super(ControlledWorker, self).__init__(worker_id)
+        self._profile = profile
+        self._port = port
+        self._duration = duration
+        self._running = False
+
+    async def arunner(self):
+        self._running = True
+        await asyncio.sleep(self._duration)
+        self._running = False
+
+    def get_load_profile(self):
+        return self._profile
+
+    def get_control_port(self):
+        return self._port
+
+    def get_control_host(self):
+        return '127.0.0.1'
+
+    def is_running(self):
+        return self._running
+
+
+def test_profile_rates():
+    ramp = {'type': 'ramp', 'from': 10, 'to': 110, 'duration': 100}
+    assert get_profile_rate(ramp, 0) == 10
+    assert get_profile_rate(ramp, 50) == 60
+    assert get_profile_rate(ramp, 200) == 110
+    step = {'type': 'step', 'steps': [{'at': 0, 'rate': 5}, {'at': 60, 'rate': 20}]}
+    assert get_profile_rate(step, 59) == 5
+    assert get_profile_rate(step, 60) == 20
+    spike = {'type': 'spike', 'base': 10, 'peak': 100, 'at': 30, 'length': 10}
+    assert [get_profile_rate(spike, t) for t in (29, 30, 39, 40)] == [10, 100, 100, 10]
+    sine = {'type': 'sine', 'min': 10, 'max': 30, 'period': 100}
+    assert get_profile_rate(sine, 0) == 10
+    assert get_profile_rate(sine, 50) == 30
+    assert abs(get_profile_rate(sine, 25) - 20) < 1e-9
+
+
+def test_validate_profile():
+    with pytest.raises(RuntimeError):
+        validate_profile({'type': 'unknown'})
+    with pytest.raises(RuntimeError):
+        validate_profile({'type': 'step'})
+    validate_profile({'type': 'ramp', 'from': 1, 'to': 2, 'duration': 10})
+
+
+def test_controller_sends_rates():
+    sockets = []
+    for _ in range(2):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(('127.0.0.1', 0))
+        s.settimeout(1)
+        sockets.append(s)
+    profile = {'type': 'step', 'steps': [{'at': 0, 'rate': 10}], 'interval': 0.1}
+    workers = [
+        ControlledWorker('000000_%06d' % i, profile, s.getsockname()[1], 0.25)
+        for i, s in enumerate(sockets)
+    ]
+    monitors = get_profile_monitors(workers, {'000000': 4})
+    assert len(monitors) == 1
+    run_workers(workers, monitors=monitors)
+    for s in sockets:
+        assert s.recv(1024) == b'cset rate 2.500'
+        s.close()
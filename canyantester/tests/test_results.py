@@ -0,0 +1,130 @@
+import pytest  # type: ignore
+import yaml
+
+from canyantester import run_compare, run_tester
+from canyantester.results import compare_records, open_store
+from canyantester.tests.helpers import FAKESIPP
+from canyantester.tests.server import StubServer
+
+
+def make_record(run_id, throughput, p95, status='passed', tag=None):
+    return {
+        'id': run_id,
+        'tag': tag,
+        'started_at': '2026-01-01T00:00:00+00:00',
+        'status': status,
+        'stats': {
+            'throughput': throughput,
+            'failure_rate': 0.0,
+            'response_time': {'p50': 10.0, 'p95': p95, 'p99': p95},
+        },
+        'phases': {'setup': 1.0},
+    }
+
+
+def test_compare_records():
+    baseline = make_record('a', 100.0, 20.0)
+    rows = compare_records(make_record('b', 95.0, 21.0), baseline)
+    assert [row['metric'] for row in rows] == [
+        'throughput',
+        'failure_rate',
+        'response_time.p50',
+        'response_time.p95',
+        'response_time.p99',
+    ]
+    assert not any(row['regression'] for row in rows)
+
+    rows = compare_records(
+        make_record('b', 80.0, 21.0),
+        baseline,
+        {'response_time.p95': '2%', 'phases.setup': 0.5},
+    )
+    regressions = dict((row['metric'], row['regression']) for row in rows)
+    assert regressions['throughput']
+    assert regressions['response_time.p95']
+    assert not regressions['response_time.p99']
+    assert not regressions['phases.setup']
+    with pytest.raises(RuntimeError):
+        compare_records(baseline, baseline, {'unknown': '1%'})
+
+
+@pytest.mark.parametrize('filename', ['results.jsonl', 'results.db'])
+def test_run_compare(tmp_path, filename):
+    results = str(tmp_path / filename)
+    store = open_store(results)
+    store.append(make_record('a1', 100.0, 20.0, tag='baseline'))
+    store.append(make_record('b2', 99.0, 20.5))
+    assert [record['id'] for record in store.get_records()] == ['a1', 'b2']
+    assert len(run_compare(results, echo=lambda _: None)) == 5
+
+    store.append(make_record('c3', 50.0, 20.0))
+    messages = []
+    with pytest.raises(RuntimeError) as e:
+        run_compare(results, echo=messages.append)
+    assert 'throughput' in str(e.value)
+    assert any(line.endswith('REGRESSION') for line in messages)
+    run_compare(results, tolerances=['throughput=60%'], echo=lambda _: None)
+    with pytest.raises(RuntimeError):
+        run_compare(results, baseline='missing', echo=lambda _: None)
+
+    store.append(make_record('d4', 100.0, 20.0, status='failed'))
+    with pytest.raises(RuntimeError) as e:
+        run_compare(results, echo=lambda _: None)
+    assert 'did not pass' in str(e.value)
+
+
+def test_run_record(tmp_path):
+    config = tmp_path / 'config.yaml'
+    config_data = {
+        'setup': [{'uri': '/tenants/', 'store_response': 'tenant'}],
+        'workers': [
+            {
+                'number': 2,
+                'repeat': 2,
+                'call_number': 10,
+                'extra_args': ['-fake_sleep', '0.1'],
+                'values': {'call_duration': 1000},
+            }
+        ],
+        'teardown': [{'uri': '/tenants/{tenant.id}', 'method': 'DELETE'}],
+    }
+    config.write_text(yaml.dump(config_data))
+    results = str(tmp_path / 'results.jsonl')
+    with StubServer() as stub:
+        run_tester(
+            str(config),
+            executable=FAKESIPP,
+            directory=str(tmp_path),
+            apiurl=stub.url,
+            seed='1234',
+            results=results,
+            tag='baseline',
+            echo=lambda _: None,
+        )
+        config_data['workers'][0]['extra_args'].extend(['-fake_failed', '10'])
+        config.write_text(yaml.dump(config_data))
+        with pytest.raises(RuntimeError):
+            run_tester(
+                str(config),
+                executable=FAKESIPP,
+                directory=str(tmp_path),
+                apiurl=stub.url,
+                results=results,
+                echo=lambda _: None,
+            )
+    passed, failed = open_store(results).get_records()
+    assert (passed['seed'], passed['tag'], passed['status']) == (
+        '1234',
+        'baseline',
+        'passed',
+    )
+    assert passed['config']['workers'][0]['call_number'] == 10
+    assert sorted(passed['phases']) == ['check', 'setup', 'teardown', 'workers']
+    worker = passed['workers']['000000_000001']
+    assert worker['exit_codes'] == [0, 0]
+    assert len(worker['durations']) == 2
+    assert worker['stats']['calls'] == 20
+    assert passed['stats']['calls'] == 40
+    assert passed['api']['calls'] == 2
+    assert (failed['status'], failed['error']) == ('failed', 'Error detected, aborted!')
+    assert failed['stats']['failure_rate'] == 1.0
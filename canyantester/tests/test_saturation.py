@@ -0,0 +1,126 @@
+import os
+import pytest  # type: ignore
+import subprocess
+import sys
+import time
+import yaml
+
+from canyantester import run_tester
+from canyantester.saturation import (
+    CLOCK_TICKS,
+    SaturationMonitor,
+    format_saturation,
+    read_process,
+)
+from canyantester.tests.helpers import FAKESIPP
+from canyantester.tests.server import StubServer
+
+UDP_HEADER = (
+    '   sl  local_address rem_address   st tx_queue rx_queue tr tm->when '
+    'retrnsmt   uid  timeout inode ref pointer drops\n'
+)
+
+
+def write_proc(proc, cpu_ticks, drops, host_busy, host_idle, rcvbuf_errors):
+    os.makedirs(str(proc / '42' / 'fd'), exist_ok=True)
+    os.makedirs(str(proc / 'net'), exist_ok=True)
+    (proc / '42' / 'stat').write_text(
+        '42 (sipp worker) S 1 42 42 0 -1 4194304 100 0 0 0 %d 0 0 0 20 0 1 0\n'
+        % cpu_ticks
+    )
+    (proc / '42' / 'status').write_text(
+        'Name:\tsipp\nVmRSS:\t    2048 kB\n'
+        'voluntary_ctxt_switches:\t10\nnonvoluntary_ctxt_switches:\t%d\n' % cpu_ticks
+    )
+    if not os.path.lexists(str(proc / '42' / 'fd' / '3')):
+        os.symlink('socket:[1234]', str(proc / '42' / 'fd' / '3'))
+    (proc / 'net' / 'udp').write_text(
+        UDP_HEADER
+        + '  1: 0100007F:13C4 00000000:0000 07 00000000:00000000 00:00000000 '
+        '00000000     0        0 1234 2 0000000000000000 %d\n' % drops
+    )
+    (proc / 'net' / 'snmp').write_text(
+        'Udp: InDatagrams NoPorts InErrors OutDatagrams RcvbufErrors SndbufErrors\n'
+        'Udp: 100 0 0 100 %d 0\n' % rcvbuf_errors
+    )
+    (proc / 'stat').write_text('cpu  %d 0 0 %d 0 0 0 0 0 0\n' % (host_busy, host_idle))
+
+
+def test_saturation_verdict(tmp_path):
+    proc = tmp_path / 'proc'
+    monitor = SaturationMonitor(proc=str(proc))
+    write_proc(proc, 0, drops=0, host_busy=0, host_idle=0, rcvbuf_errors=0)
+    # an idle process without sockets
+    os.makedirs(str(proc / '43' / 'fd'))
+    for name in ('stat', 'status'):
+        (proc / '43' / name).write_text((proc / '42' / name).read_text())
+    monitor.sample([('000000_000000', 42), ('000000_000001', 43)])
+    time.sleep(0.1)
+    # a whole second of CPU time in 0.1 seconds
+    write_proc(proc, CLOCK_TICKS, 5, host_busy=100, host_idle=900, rcvbuf_errors=0)
+    monitor.sample([('000000_000000', 42), ('000000_000001', 43)])
+    report = monitor.get_report()
+    assert report['saturated']
+    process = report['processes']['000000_000000']
+    assert process['flags'] == ['cpu-bound', 'dropping']
+    assert (process['drops'], process['peak_rss']) == (5, 2048 * 1024)
+    assert report['host']['flags'] == []
+    assert report['reasons'] == ['000000_000000 cpu-bound, dropping']
+    lines = format_saturation(report)
+    # the processes not flagged are only counted
+    assert lines[1] == '2 processes sampled, 1 flagged'
+    assert lines[2].startswith('[000000_000000] cpu = ')
+    assert lines[2].endswith('(cpu-bound, dropping)')
+    assert len(lines) == 4 and 'is saturated' in lines[-1]
+
+    write_proc(proc, CLOCK_TICKS, 5, host_busy=20000, host_idle=1000, rcvbuf_errors=3)
+    monitor.sample([])
+    report = monitor.get_report()
+    assert report['host']['flags'] == ['cpu-bound', 'dropping']
+    assert report['host']['udp_errors']['RcvbufErrors'] == 3
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/stat'), reason="no /proc")
+def test_read_process():
+    busy = subprocess.Popen([sys.executable, '-c', 'while True: pass'])
+    try:
+        monitor = SaturationMonitor()
+        for _ in range(3):
+            monitor.sample([('busy', busy.pid)])
+            time.sleep(0.2)
+        assert read_process(busy.pid).rss > 0
+    finally:
+        busy.kill()
+        busy.wait()
+    assert read_process(busy.pid) is None
+    assert monitor.get_report()['processes']['busy']['peak_cpu'] > 0.5
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/stat'), reason="no /proc")
+def test_saturation_report(tmp_path):
+    config = tmp_path / 'config.yaml'
+    config.write_text(
+        yaml.dump(
+            {
+                'workers': [
+                    {
+                        'number': 2,
+                        'extra_args': ['-fake_sleep', '0.5'],
+                        'values': {'call_duration': 1000},
+                    }
+                ]
+            }
+        )
+    )
+    messages = []
+    with StubServer() as stub:
+        run_tester(
+            str(config),
+            executable=FAKESIPP,
+            directory=str(tmp_path),
+            apiurl=stub.url,
+            saturation_interval=0.1,
+            echo=messages.append,
+        )
+    assert any(m.endswith('processes sampled, 0 flagged') for m in messages), messages
+    assert any(m.startswith('Verdict: ') for m in messages)
@@ -0,0 +1,145 @@
+import json
+import pytest  # type: ignore
+import subprocess
+import sys
+import yaml
+
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from canyantester import run_tester
+from canyantester.serve import RunServer, WarmCache, submit_run
+from canyantester.tests.helpers import FAKESIPP
+from canyantester.tests.server import StubServer
+
+
+TOKEN = 'secret'
+
+
+def test_lazy_imports():
+    modules = subprocess.check_output(
+        [
+            sys.executable,
+            '-c',
+            'import sys, canyantester; '
+            'print(" ".join(m for m in ("requests", "yaml", "canyantester.serve", '
+            '"canyantester.distributed", "canyantester.sipp", "sqlite3", '
+            '"asyncio", "gzip", "urllib.request") if m in sys.modules))',
+        ]
+    )
+    assert modules.strip() == b''
+
+
+def test_serve(tmp_path):
+    config = tmp_path / 'config.yaml'
+    config.write_text(
+        yaml.dump(
+            {
+                'setup': [
+                    {
+                        'name': 'create',
+                        'uri': '/accounts',
+                        'method': 'POST',
+                        'payload': {'name': 'alice'},
+                    }
+                ],
+                'workers': [{'number': 2, 'values': {'call_duration': 1000}}],
+            }
+        )
+    )
+    cache = WarmCache()
+    server = RunServer(
+        lambda config, echo, **options: run_tester(
+            config=config,
+            executable=FAKESIPP,
+            directory=str(tmp_path),
+            echo=echo,
+            cache=cache,
+            **options
+        ),
+        TOKEN,
+        port=0,
+        log=lambda _: None,
+    )
+    server.start()
+    url = 'http://127.0.0.1:%d' % server.get_port()
+    try:
+        with StubServer() as stub:
+            for seed in (1, 2):
+                messages = []
+                submit_run(
+                    url,
+                    str(config),
+                    {
+                        'apiurl': stub.url,
+                        'seed': seed,
+                        'results': None,
+                        'stats': True,
+                    },
+                    token=TOKEN,
+                    echo=messages.append,
+                )
+                assert 'Setting the random seed: %d' % seed in messages
+                assert any(m.startswith('\nGlobal statistics') for m in messages)
+            # the runs failing are reported by the client
+            with pytest.raises(RuntimeError):
+                submit_run(
+                    url,
+                    str(tmp_path / 'missing.yaml'),
+                    {'apiurl': stub.url},
+                    token=TOKEN,
+                    echo=lambda _: None,
+                )
+        assert len(cache._configs) == 1
+        assert cache._session is not None
+    finally:
+        server.stop()
+        cache.close()
+
+
+def test_serve_rejected(tmp_path):
+    runs = []
+    server = RunServer(
+        lambda config, echo, **options: runs.append(options),
+        TOKEN,
+        port=0,
+        log=lambda _: None,
+    )
+    server.start()
+    url = 'http://127.0.0.1:%d' % server.get_port()
+    config = tmp_path / 'config.yaml'
+    config.write_text('workers: []\n')
+
+    def post(options, token=TOKEN, content_type='application/json'):
+        body = {'config': str(config), 'options': options}
+        request = Request(
+            url + '/run',
+            data=json.dumps(body).encode('utf-8'),
+            headers={
+                'Content-Type': content_type,
+                'Authorization': 'Bearer %s' % token,
+            },
+        )
+        try:
+            with urlopen(request) as response:
+                response.read()
+                return response.status
+        except HTTPError as e:
+            return e.code
+
+    try:
+        assert post({'seed': 1}, token='wrong') == 401
+        assert post({'seed': 1}, content_type='text/plain') == 415
+        assert post({'executable': '/bin/sh'}) == 400
+        assert post({'trace': '/tmp/trace.json'}) == 400
+        assert post({'seed': 1}) == 200
+        with pytest.raises(RuntimeError) as e:
+            submit_run(url, str(config), {'results': 'runs.db'}, token=TOKEN)
+        assert 'results' in str(e.value)
+        with pytest.raises(RuntimeError):
+            submit_run(url, str(config), {'seed': 1}, token='wrong')
+    finally:
+        server.stop()
+    assert runs == [{'seed': 1}]
+    with pytest.raises(RuntimeError):
+        RunServer(lambda config, echo, **options: None, None, port=0)
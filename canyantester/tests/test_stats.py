@@ -0,0 +1,105 @@
+import os
+
+from canyantester.engine import run_workers
+from canyantester.sipp import SippWorker
+from canyantester.stats import (
+    FileTail,
+    Histogram,
+    SippStats,
+    SippStatsReader,
+    merge_stats,
+    parse_duration,
+)
+from canyantester.tests.helpers import FAKESIPP
+
+
+def test_parse_duration():
+    assert parse_duration('01:02:03:500000') == 3723.5
+    assert parse_duration('00:00:10:250') == 10.25
+
+
+def test_histogram():
+    histogram = Histogram()
+    for value in range(1, 1001):
+        histogram.add(float(value))
+    assert histogram.count == 1000
+    assert histogram.min == 1.0 and histogram.max == 1000.0
+    assert abs(histogram.percentile(50) - 500) < 500 * 0.02
+    assert abs(histogram.percentile(99) - 990) < 990 * 0.02
+    other = Histogram()
+    other.add(2000.0)
+    histogram.merge(other)
+    assert histogram.count == 1001
+    assert histogram.percentile(100) == 2000.0
+
+
+def test_file_tail(tmp_path):
+    filename = str(tmp_path / 'stat.csv')
+    tail = FileTail([str(tmp_path / 'missing.csv'), filename])
+    assert tail.read_lines() == []
+    with open(filename, 'w') as f:
+        f.write('a;b\n1;')
+    assert tail.read_lines() == ['a;b']
+    with open(filename, 'a') as f:
+        f.write('2\n')
+    assert tail.read_lines() == ['1;2']
+
+
+def test_stats_reader(tmp_path):
+    stat_filename = str(tmp_path / 'stat.csv')
+    rtt_filename = str(tmp_path / 'rtt.csv')
+    stats = SippStats()
+    reader = SippStatsReader(stats, stat_filename, [rtt_filename])
+    with open(stat_filename, 'w') as f:
+        f.write(
+            'ElapsedTime(C);CallRate(P);TotalCallCreated;SuccessfulCall(C);'
+            'FailedCall(C);FailedMaxUDPRetrans(C);FailedMaxUDPRetrans(P);\n'
+            '00:00:02:000000;5.0;10;8;2;2;2;\n'
+        )
+    with open(rtt_filename, 'w') as f:
+        f.write('Date_ms;response_time_ms;rtd_no\n1;10.0;1\n2;30.0;1\n')
+    reader.read()
+    summary = stats.summary()
+    assert summary['calls'] == 10
+    assert summary['successful'] == 8
+    assert summary['failures'] == {'MaxUDPRetrans': 2}
+    assert summary['throughput'] == 4.0
+    assert summary['response_time']['count'] == 2
+    # a new process adds its counters to the ones of the previous processes
+    stats.start_process()
+    stats.add_stat_row({'TotalCallCreated': '5', 'SuccessfulCall(C)': '5'})
+    assert stats.summary()['calls'] == 15
+    merged = merge_stats([stats, stats])
+    assert merged.summary()['successful'] == 26
+
+
+def test_sipp_worker_stats(tmp_path):
+    directory = str(tmp_path)
+    with open(os.path.join(directory, 'scenario.xml'), 'w') as f:
+        f.write('<scenario/>')
+    worker = SippWorker(
+        worker_id='000000_000000',
+        config={
+            'scenario': 'scenario.xml',
+            'repeat': 2,
+            'call_number': 20,
+            'stats_interval': 0.1,
+            'extra_args': '-fake_sleep 0.3 -fake_failed 4 -fake_rtt 25',
+        },
+        target='127.0.0.1:5060',
+        executable=FAKESIPP,
+        directory=directory,
+        basedir=directory,
+        log=lambda *args: None,
+        stats=True,
+    )
+    worker.setup()
+    run_workers([worker])
+    assert worker.get_exit_codes() == [1, 1]
+    summary = worker.get_stats().summary()
+    assert summary['calls'] == 40
+    # the statistics files are removed once read
+    assert not [name for name in os.listdir(directory) if name.endswith('.csv')]
+    assert summary['failed'] == 8
+    assert summary['response_time']['count'] == 32
+    assert abs(summary['response_time']['p50'] - 25) < 1
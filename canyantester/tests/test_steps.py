@@ -0,0 +1,77 @@
+import pytest  # type: ignore
+import threading
+import time
+
+from canyantester.steps import build_dependencies, resolve_hosts, run_steps
+
+
+STEPS = [
+    {'uri': '/tenants/', 'store_response': 'tenant'},
+    {'uri': '/carriers/', 'store_response': 'carrier', 'payload': {'name': 'c'}},
+    {
+        'uri': '/domains/',
+        'store_response': 'domain',
+        'payload': {'tenant_id': '{tenant.id}', 'name': 'domain_{random.uuid4}'},
+    },
+    {
+        'uri': '/ipbx/',
+        'store_response': 'ipbx',
+        'payload': {'tenant_id': '{tenant.id}', 'domain_id': '{domain.id}'},
+    },
+    {'uri': '/carriers/{carrier.id}/check', 'depends_on': 'ipbx'},
+]
+
+
+def test_build_dependencies():
+    assert build_dependencies(STEPS) == [set(), set(), {0}, {0, 2}, {1, 3}]
+
+
+def test_resolve_hosts():
+    steps = [{}, {'host': 'http://other'}, {}]
+    assert resolve_hosts(steps, 'http://api') == [
+        'http://api',
+        'http://other',
+        'http://other',
+    ]
+
+
+def test_run_steps_sequential():
+    order = []
+    run_steps(STEPS, lambda i, config: order.append(i))
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_run_steps_parallel():
+    lock = threading.Lock()
+    started = {}
+    finished = {}
+
+    def func(i, config):
+        with lock:
+            started[i] = time.monotonic()
+        time.sleep(0.1)
+        with lock:
+            finished[i] = time.monotonic()
+
+    run_steps(STEPS, func, parallelism=4)
+    assert len(finished) == len(STEPS)
+    # independent steps start together
+    assert abs(started[0] - started[1]) < 0.05
+    for i, dependencies in enumerate(build_dependencies(STEPS)):
+        for j in dependencies:
+            assert started[i] >= finished[j]
+
+
+def test_run_steps_error():
+    executed = []
+
+    def func(i, config):
+        if i == 0:
+            raise RuntimeError()
+        executed.append(i)
+
+    with pytest.raises(RuntimeError):
+        run_steps(STEPS, func, parallelism=4)
+    # steps depending on the failed one are never started
+    assert 2 not in executed
+    assert 3 not in executed
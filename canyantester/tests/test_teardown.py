@@ -0,0 +1,108 @@
+import os
+import pytest  # type: ignore
+import signal
+import threading
+import time
+import yaml
+
+from canyantester import do_teardown, run_tester
+from canyantester.client import HTTPClient
+from canyantester.steps import build_teardown_dependencies
+from canyantester.tests.helpers import FAKESIPP
+from canyantester.tests.server import StubServer
+
+SETUP = [
+    {'uri': '/tenants/', 'store_response': 'tenant'},
+    {'uri': '/domains/', 'store_response': 'domain', 'payload': {'t': '{tenant.id}'}},
+    {'uri': '/ipbx/', 'store_response': 'ipbx', 'payload': {'d': '{domain.id}'}},
+    {'uri': '/carriers/', 'store_response': 'carrier'},
+]
+TEARDOWN = [
+    {'uri': '/ipbx/{ipbx.id}', 'method': 'DELETE'},
+    {'uri': '/domains/{domain.id}', 'method': 'DELETE'},
+    {'uri': '/carriers/{carrier.id}', 'method': 'DELETE'},
+    {'uri': '/tenants/{tenant.id}', 'method': 'DELETE'},
+]
+
+
+def test_build_teardown_dependencies():
+    assert build_teardown_dependencies(TEARDOWN, SETUP) == [
+        set(),
+        {0},
+        set(),
+        {0, 1},
+    ]
+
+
+def test_kamailio_ready_probe():
+    with StubServer() as stub:
+        stub.responses['/RPC'] = [
+            (200, {'result': 'reloaded'}),
+            (404, {}),
+            (200, {'result': {'ready': False}}),
+            (200, {'result': {'ready': True}}),
+        ]
+        config_data = {
+            'teardown': [
+                {
+                    'type': 'kamailio_xhttp',
+                    'uri': '%s/RPC' % stub.url,
+                    'payload': {'method': 'dispatcher.reload'},
+                    'ready': {
+                        'payload': {'method': 'dispatcher.list'},
+                        'expected_paths': {'result.ready': True},
+                        'poll_interval': 0.05,
+                    },
+                }
+            ]
+        }
+        client = HTTPClient()
+        started_at = time.monotonic()
+        do_teardown(
+            config_data, False, stub.url, {}, False, echo=lambda _: None, client=client
+        )
+        client.close()
+    assert time.monotonic() - started_at < 2
+    assert [payload['method'] for _, _, payload in stub.requests] == [
+        'dispatcher.reload'
+    ] + ['dispatcher.list'] * 3
+
+
+def test_interrupted_run(tmp_path):
+    with StubServer() as stub:
+        config = tmp_path / 'config.yaml'
+        config.write_text(
+            yaml.dump(
+                {
+                    'setup': [{'uri': '/tenants/', 'store_response': 'tenant'}],
+                    'workers': [
+                        {
+                            'number': 2,
+                            'extra_args': ['-fake_sleep', '30'],
+                            'values': {'call_duration': 1000},
+                        }
+                    ],
+                    'check': [{'uri': '/cdrs/', 'method': 'GET'}],
+                    'teardown': [{'uri': '/tenants/{tenant.id}', 'method': 'DELETE'}],
+                }
+            )
+        )
+        messages = []
+        timer = threading.Timer(1, os.kill, (os.getpid(), signal.SIGINT))
+        timer.start()
+        started_at = time.monotonic()
+        with pytest.raises(RuntimeError) as e:
+            run_tester(
+                str(config),
+                executable=FAKESIPP,
+                directory=str(tmp_path),
+                apiurl=stub.url,
+                teardown_timeout=5,
+                echo=messages.append,
+            )
+        assert 'Interrupted' in str(e.value)
+        assert time.monotonic() - started_at < 10
+        methods = [method for method, _, _ in stub.requests]
+        # no check after an interruption, only the teardown
+        assert methods == ['POST', 'DELETE']
+    assert len([m for m in messages if m.endswith("terminated")]) == 2, messages
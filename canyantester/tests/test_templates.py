@@ -0,0 +1,58 @@
+import os
+
+from canyantester.api import resolve_variables
+from canyantester.sipp import SippWorker
+from canyantester.templates import ScenarioCache, ScenarioTemplate
+
+
+def test_template_keys():
+    template = ScenarioTemplate('%(a)s %%(b)s %(c)d 100%% %(a)s')
+    assert template.get_keys() == ('a', 'c')
+    assert template.render({'a': 'x', 'c': 1}) == 'x %(b)s 1 100% x'
+
+
+def test_resolve_variables():
+    stored_responses = {
+        'tenant': {'id': 1, 'domains': [{'name': 'a.com'}]},
+        'did': {'number': '0190'},
+    }
+    assert (
+        resolve_variables('{did.number}@{tenant.domains.0.name}', stored_responses)
+        == '0190@a.com'
+    )
+    assert resolve_variables('no placeholders', stored_responses) == 'no placeholders'
+
+
+def test_scenario_shared_between_workers(tmp_path):
+    directory = str(tmp_path)
+    with open(os.path.join(directory, 'scenario.xml'), 'w') as f:
+        f.write('<user>%(to_user)s@%(to_domain)s</user>')
+    scenarios = ScenarioCache(directory, directory)
+    config = {
+        'scenario': 'scenario.xml',
+        'values': {
+            'to_user': ['alice', 'bob'],
+            'to_domain': '{domain.name}.{domain.tld}',
+            'unused': {'min': 1, 'max': 1000},
+        },
+    }
+    filenames = []
+    for j in range(10):
+        worker = SippWorker(
+            worker_id='000000_%06d' % j,
+            config=config,
+            directory=directory,
+            basedir=directory,
+            stored_responses={'domain': {'name': 'example', 'tld': 'com'}},
+            scenarios=scenarios,
+        )
+        worker.setup()
+        filenames.append(worker._filename_xml)
+    assert len(set(filenames)) == 2
+    assert sorted(f for f in os.listdir(directory) if f.startswith('sipp-')) == sorted(
+        os.path.basename(f) for f in set(filenames)
+    )
+    with open(filenames[1]) as f:
+        assert f.read() == '<user>bob@example.com</user>'
+    # the configuration is not modified by the setup
+    assert config['values']['to_domain'] == '{domain.name}.{domain.tld}'
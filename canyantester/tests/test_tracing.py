@@ -0,0 +1,121 @@
+import json
+import threading
+import yaml
+
+from canyantester import run_tester
+from canyantester.tests.helpers import FAKESIPP
+from canyantester.tests.server import StubServer
+from canyantester.tracing import Tracer, current_span
+
+
+def test_tracer():
+    tracer = Tracer()
+    run = tracer.start('run')
+
+    def step(parent):
+        with tracer.span('step', parent=parent):
+            with tracer.span('call'):
+                pass
+
+    with tracer.span('setup') as attributes:
+        attributes['status_code'] = 503
+        thread = threading.Thread(target=step, args=(current_span(),))
+        thread.start()
+        thread.join()
+        with tracer.span('inner', worker_id='000000_000000', exit_code=0):
+            pass
+        # the spans left open are not exported
+        tracer.start('open')
+    tracer.end(run)
+    spans = dict((span['name'], span) for span in tracer.get_spans())
+    assert sorted(spans) == ['call', 'inner', 'run', 'setup', 'step']
+    assert spans['setup']['parent_id'] == run['span_id']
+    assert spans['step']['parent_id'] == spans['setup']['span_id']
+    assert spans['call']['parent_id'] == spans['step']['span_id']
+    assert spans['inner']['parent_id'] == spans['setup']['span_id']
+    assert spans['setup']['error'] and not spans['inner']['error']
+
+    events = tracer.to_chrome_trace()['traceEvents']
+    lanes = dict(
+        (event['args']['name'], event['tid']) for event in events if event['ph'] == 'M'
+    )
+    inner = [event for event in events if event['name'] == 'inner'][0]
+    assert inner['tid'] == lanes['000000_000000']
+    assert inner['args'] == {'worker_id': '000000_000000', 'exit_code': 0}
+
+    otlp = tracer.to_otlp()['resourceSpans'][0]['scopeSpans'][0]['spans']
+    setup = [span for span in otlp if span['name'] == 'setup'][0]
+    assert setup['traceId'] == tracer.trace_id
+    assert setup['parentSpanId'] == run['span_id']
+    assert setup['status'] == {'code': 2}
+    assert setup['attributes'] == [{'key': 'status_code', 'value': {'intValue': '503'}}]
+
+
+def test_run_trace(tmp_path):
+    config = tmp_path / 'config.yaml'
+    trace = tmp_path / 'trace.json'
+    messages = []
+    with StubServer() as stub, StubServer() as collector:
+        config.write_text(
+            yaml.dump(
+                {
+                    'setup': [{'uri': '/accounts', 'store_response': 'account'}],
+                    'workers': [
+                        {'number': 2, 'repeat': 2, 'values': {'call_duration': 1000}},
+                        {'type': 'kamailio_xhttp', 'uri': stub.url + '/rpc'},
+                    ],
+                    'check': [{'uri': '/ratings', 'method': 'GET', 'delay': 0.1}],
+                }
+            )
+        )
+        run_tester(
+            str(config),
+            executable=FAKESIPP,
+            directory=str(tmp_path),
+            apiurl=stub.url,
+            trace=str(trace),
+            otlp_endpoint=collector.url + '/v1/traces',
+            echo=messages.append,
+        )
+    events = [
+        event
+        for event in json.loads(trace.read_text())['traceEvents']
+        if event['ph'] == 'X'
+    ]
+    names = [event['name'] for event in events]
+    for name in ('run', 'setup', 'setup 0', 'workers', 'check', 'delay', 'teardown'):
+        assert name in names
+    post = [event for event in events if event['name'] == 'POST /accounts'][0]
+    assert post['args']['status_code'] == 200
+    sipp = sorted(
+        (
+            event['args']['worker_id'],
+            event['args']['repeat'],
+            event['args']['exit_code'],
+        )
+        for event in events
+        if event['name'] == 'sipp'
+    )
+    assert sipp == [
+        ('000000_000000', 0, 0),
+        ('000000_000000', 1, 0),
+        ('000000_000001', 0, 0),
+        ('000000_000001', 1, 0),
+    ]
+    assert len([name for name in names if name == 'setup sipp']) == 2
+    kamailio = [event for event in events if event['name'] == 'kamailio_xhttp'][0]
+    assert kamailio['args']['exit_code'] == 0
+
+    [(method, path, payload)] = collector.requests
+    assert (method, path) == ('POST', '/v1/traces')
+    spans = payload['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert len(spans) == len(events)
+    # the runner of the kamailio worker, in another thread, is nested in the
+    # span of the workers
+    ids = dict((span['name'], span['spanId']) for span in spans)
+    assert [
+        span['parentSpanId'] for span in spans if span['name'] == 'kamailio_xhttp'
+    ] == [ids['workers']]
+    assert any(
+        m.startswith('Trace of %d spans written' % len(events)) for m in messages
+    )
@@ -0,0 +1,186 @@
+import pytest  # type: ignore
+import time
+import yaml
+
+from canyantester import run_tester
+from canyantester.engine import run_workers
+from canyantester.uac import (
+    Call,
+    UACWorker,
+    get_digest_response,
+    get_header,
+    get_route_set,
+    parse_message,
+)
+from canyantester.tests.server import StubServer
+from canyantester.tests.uas import StubUAS
+
+
+def run_uac(uas, config, messages=None):
+    worker = UACWorker(
+        '000000_000000',
+        config,
+        target=uas.target,
+        log=(messages if messages is not None else []).append,
+    )
+    worker.setup()
+    run_workers([worker])
+    worker.debug()
+    return worker
+
+
+def test_digest_response():
+    # RFC 2617, section 3.5
+    assert (
+        get_digest_response(
+            'Mufasa',
+            'Circle Of Life',
+            'testrealm@host.com',
+            'GET',
+            '/dir/index.html',
+            'dcd98b7102dd2f0e8b11d0f600bfb0c093',
+            'auth',
+            '00000001',
+            '0a4f113b',
+        )
+        == '6629fae49393a05397450978507c4ef1'
+    )
+
+
+def test_parse_message():
+    message = parse_message(
+        b'SIP/2.0 200 OK\r\n'
+        b'v: SIP/2.0/UDP 127.0.0.1:5060;branch=z9hG4bK1\r\n'
+        b'i: abc@127.0.0.1\r\n'
+        b'CSeq: 2 INVITE\r\n'
+        b'Record-Route: <sip:p1;lr>, <sip:p2;lr>\r\n'
+        b'Record-Route: <sip:p3;lr>\r\n'
+        b'l: 0\r\n\r\n'
+    )
+    assert message.status == 200
+    assert get_header(message, 'call-id') == 'abc@127.0.0.1'
+    assert get_header(message, 'via').endswith('branch=z9hG4bK1')
+    assert get_route_set(message) == ['<sip:p3;lr>', '<sip:p2;lr>', '<sip:p1;lr>']
+
+
+def test_uac_digest_auth():
+    with StubUAS(username='alice', password='secret') as uas:
+        worker = run_uac(
+            uas,
+            {
+                'call_number': 20,
+                'call_rate': 200,
+                'call_limit': 5,
+                'values': {'username': 'alice', 'password': 'secret'},
+            },
+        )
+    summary = worker.get_stats().summary()
+    assert worker.get_exit_status() == 0
+    assert (summary['calls'], summary['successful'], summary['failed']) == (20, 20, 0)
+    assert summary['response_time']['count'] == 20
+    methods = [method for method, _ in uas.requests]
+    # each call is challenged once
+    assert methods.count('INVITE') == 40
+    assert methods.count('ACK') == 40
+    assert methods.count('BYE') == 20
+    assert uas.active == 0
+
+
+def test_uac_call_limit():
+    with StubUAS() as uas:
+        started_at = time.monotonic()
+        worker = run_uac(
+            uas,
+            {
+                'call_number': 9,
+                'call_rate': 1000,
+                'call_limit': 3,
+                'values': {'call_duration': 200},
+            },
+        )
+        elapsed = time.monotonic() - started_at
+    assert worker.get_stats().summary()['successful'] == 9
+    assert uas.max_active == 3
+    assert elapsed >= 0.6
+
+
+@pytest.mark.parametrize(
+    'options, failure',
+    [
+        ({'reject': 486}, 'UnexpectedMessage'),
+        ({'username': 'alice', 'password': 'other'}, 'UnexpectedMessage'),
+        ({'drop': 1000}, 'MaxUDPRetrans'),
+    ],
+)
+def test_uac_failures(options, failure):
+    with StubUAS(**options) as uas:
+        worker = run_uac(
+            uas,
+            {
+                'call_number': 2,
+                'call_limit': 2,
+                'call_rate': 100,
+                'retrans': 50,
+                'transaction_timeout': 0.5,
+                'values': {'username': 'alice', 'password': 'secret'},
+            },
+        )
+    summary = worker.get_stats().summary()
+    assert worker.get_exit_status() == 1
+    assert summary['failures'] == {failure: 2}
+    if 'drop' in options:
+        assert summary['retransmissions'] > 0
+
+
+@pytest.mark.parametrize(
+    'error, failure',
+    [(OSError('unreachable'), 'CmdNotSent'), (KeyError('realm'), 'UnexpectedMessage')],
+)
+def test_uac_errors(monkeypatch, error, failure):
+    async def run(call):
+        raise error
+
+    monkeypatch.setattr(Call, 'run', run)
+    with StubUAS() as uas:
+        worker = run_uac(uas, {'call_number': 2, 'call_limit': 2, 'call_rate': 100})
+    # the calls fail, not the worker
+    summary = worker.get_stats().summary()
+    assert worker.get_exit_status() == 1
+    assert (summary['failed'], summary['failures']) == (2, {failure: 2})
+
+
+def test_uac_retransmission():
+    with StubUAS(drop=1) as uas:
+        worker = run_uac(uas, {'retrans': 50})
+    summary = worker.get_stats().summary()
+    assert (summary['successful'], summary['retransmissions']) == (1, 1)
+
+
+def test_uac_run_tester(tmp_path):
+    config = tmp_path / 'config.yaml'
+    config.write_text(
+        yaml.dump(
+            {
+                'workers': [
+                    {
+                        'type': 'uac',
+                        'number': 3,
+                        'call_number': 10,
+                        'call_rate': 100,
+                        'call_limit': 10,
+                    }
+                ]
+            }
+        )
+    )
+    messages = []
+    with StubServer() as stub, StubUAS() as uas:
+        run_tester(
+            str(config),
+            target=uas.target,
+            directory=str(tmp_path),
+            apiurl=stub.url,
+            echo=messages.append,
+        )
+    summary = [m for m in messages if m.startswith('\nGlobal statistics')]
+    assert 'calls = 30, successful = 30, failed = 0' in summary[0]
@@ -0,0 +1,136 @@
+import socket
+import threading
+
+from uuid import uuid4
+
+from canyantester.uac import (
+    build_message,
+    get_digest_response,
+    get_header,
+    parse_challenge,
+    parse_message,
+)
+
+
+class StubUAS(object):
+    """
+    Loopback UDP user agent server answering INVITE with 100, 180 and 200, or
+    with a 407 challenge when it has credentials, and BYE with 200.
+
+    `drop` INVITE requests are ignored first, to be retransmitted, and
+    `reject` is the final response to the INVITE requests when set.
+    """
+
+    def __init__(self, username=None, password=None, drop=0, reject=None):
+        self.username = username
+        self.password = password
+        self.drop = drop
+        self.reject = reject
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._dialogs = set()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.settimeout(0.1)
+        self._running = False
+        self._thread = None
+
+    @property
+    def target(self):
+        return '127.0.0.1:%d' % self._socket.getsockname()[1]
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+        self._socket.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _serve(self):
+        while self._running:
+            try:
+                data, addr = self._socket.recvfrom(65535)
+            except socket.timeout:
+                continue
+            request = parse_message(data)
+            self.requests.append((request.method, get_header(request, 'call-id')))
+            for status in self._handle(request):
+                self._socket.sendto(self._respond(request, status), addr)
+
+    def _handle(self, request):
+        call_id = get_header(request, 'call-id')
+        if request.method == 'INVITE':
+            if self.drop:
+                self.drop -= 1
+                return []
+            if self.reject:
+                return [100, self.reject]
+            if self.username is not None:
+                credentials = get_header(request, 'proxy-authorization')
+                if credentials is None:
+                    return [100, 407]
+                if not self._check(request, parse_challenge(credentials)):
+                    return [100, 403]
+            if call_id not in self._dialogs:
+                self._dialogs.add(call_id)
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            return [100, 180, 200]
+        if request.method == 'BYE':
+            if call_id in self._dialogs:
+                self._dialogs.discard(call_id)
+                self.active -= 1
+            return [200]
+        return []
+
+    def _check(self, request, credentials):
+        return credentials.get('response') == get_digest_response(
+            self.username,
+            self.password,
+            credentials.get('realm'),
+            request.method,
+            credentials.get('uri'),
+            credentials.get('nonce'),
+            credentials.get('qop'),
+            credentials.get('nc'),
+            credentials.get('cnonce'),
+        )
+
+    def _respond(self, request, status):
+        to = get_header(request, 'to')
+        if status != 100 and 'tag=' not in to:
+            to = '%s;tag=uas' % to
+        headers = [('Via', value) for value in request.headers['via']]
+        headers.extend(
+            [
+                ('From', get_header(request, 'from')),
+                ('To', to),
+                ('Call-ID', get_header(request, 'call-id')),
+                ('CSeq', get_header(request, 'cseq')),
+            ]
+        )
+        if status == 407:
+            headers.append(
+                (
+                    'Proxy-Authenticate',
+                    'Digest realm="canyan", nonce="%s", qop="auth", algorithm=MD5'
+                    % uuid4().hex,
+                )
+            )
+        if status == 200 and request.method == 'INVITE':
+            headers.append(
+                ('Contact', '<sip:uas@%s>' % self.target),
+            )
+        return build_message('SIP/2.0 %d Stub' % status, headers)
@@ -0,0 +1,220 @@
+import binascii
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+
+OTLP_ENDPOINT = 'http://127.0.0.1:4318/v1/traces'
+
+# span open in the current thread or asyncio task
+_current = contextvars.ContextVar('canyantester_span', default=None)
+
+
+def new_id(size):
+    # the random module is seeded by the run
+    return binascii.hexlify(os.urandom(size)).decode('ascii')
+
+
+def current_span():
+    return _current.get()
+
+
+class Tracer(object):
+    """
+    Timed spans of a run with their attributes, each one nested in the span
+    open when it starts, or in the first span of the run. The spans of a
+    worker are drawn on the lane of its worker id, the other ones on the lane
+    of their thread.
+    """
+
+    def __init__(self):
+        self.trace_id = new_id(16)
+        self._started_at = time.monotonic()
+        # wall clock time of the monotonic clock origin
+        self._epoch = time.time() - self._started_at
+        self._root = None
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def start(self, name, parent=None, **attributes):
+        span = {
+            'name': name,
+            'span_id': new_id(8),
+            'parent_id': parent or current_span() or self._root,
+            'lane': attributes.get('worker_id') or threading.current_thread().name,
+            'start': time.monotonic(),
+            'end': None,
+            'attributes': attributes,
+            'error': False,
+        }
+        with self._lock:
+            if self._root is None:
+                self._root = span['span_id']
+            self._spans.append(span)
+        return span
+
+    def end(self, span, error=False):
+        span['end'] = time.monotonic()
+        span['error'] = span['error'] or error or is_error(span['attributes'])
+
+    def add(self, name, started_at, ended_at, attributes=None, error=False):
+        """
+        Record a span already done, from its monotonic start and end times
+        """
+        span = self.start(name, **(attributes or {}))
+        span['start'], span['end'], span['error'] = started_at, ended_at, error
+        return span
+
+    @contextlib.contextmanager
+    def span(self, name, parent=None, **attributes):
+        """
+        Open a span, yielding its attributes to be completed
+        """
+        span = self.start(name, parent, **attributes)
+        token = _current.set(span['span_id'])
+        try:
+            yield span['attributes']
+        except BaseException:
+            span['error'] = True
+            raise
+        finally:
+            _current.reset(token)
+            self.end(span)
+
+    def get_spans(self):
+        """
+        The spans done, sorted by start time
+        """
+        with self._lock:
+            spans = [span for span in self._spans if span['end'] is not None]
+        return sorted(spans, key=lambda span: span['start'])
+
+    def to_chrome_trace(self):
+        """
+        Return the spans in the Chrome trace event format, loaded by
+        chrome://tracing and Perfetto
+        """
+        pid = os.getpid()
+        lanes = {}
+        events = []
+        for span in self.get_spans():
+            if span['lane'] not in lanes:
+                lanes[span['lane']] = len(lanes) + 1
+                events.append(
+                    {
+                        'name': 'thread_name',
+                        'ph': 'M',
+                        'pid': pid,
+                        'tid': lanes[span['lane']],
+                        'args': {'name': span['lane']},
+                    }
+                )
+            events.append(
+                {
+                    'name': span['name'],
+                    'cat': 'error' if span['error'] else 'canyantester',
+                    'ph': 'X',
+                    'pid': pid,
+                    'tid': lanes[span['lane']],
+                    'ts': (span['start'] - self._started_at) * 1000000.0,
+                    'dur': (span['end'] - span['start']) * 1000000.0,
+                    'args': span['attributes'],
+                }
+            )
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+    def to_otlp(self):
+        """
+        Return the spans as an OTLP/HTTP JSON export request
+        """
+
+        def get_time(monotonic):
+            return str(int((self._epoch + monotonic) * 1000000000))
+
+        spans = []
+        for span in self.get_spans():
+            otlp_span = {
+                'traceId': self.trace_id,
+                'spanId': span['span_id'],
+                'name': span['name'],
+                # SPAN_KIND_INTERNAL
+                'kind': 1,
+                'startTimeUnixNano': get_time(span['start']),
+                'endTimeUnixNano': get_time(span['end']),
+                'attributes': [
+                    {'key': key, 'value': get_otlp_value(value)}
+                    for key, value in sorted(span['attributes'].items())
+                    if value is not None
+                ],
+                # STATUS_CODE_ERROR or STATUS_CODE_UNSET
+                'status': {'code': 2 if span['error'] else 0},
+            }
+            if span['parent_id'] is not None:
+                otlp_span['parentSpanId'] = span['parent_id']
+            spans.append(otlp_span)
+        return {
+            'resourceSpans': [
+                {
+                    'resource': {
+                        'attributes': [
+                            {
+                                'key': 'service.name',
+                                'value': {'stringValue': 'canyantester'},
+                            }
+                        ]
+                    },
+                    'scopeSpans': [{'scope': {'name': 'canyantester'}, 'spans': spans}],
+                }
+            ]
+        }
+
+    def export_otlp(self, endpoint=OTLP_ENDPOINT, timeout=10):
+        request = Request(
+            endpoint,
+            data=json.dumps(self.to_otlp()).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+        )
+        try:
+            with urlopen(request, timeout=timeout):
+                pass
+        except (URLError, OSError) as e:
+            raise RuntimeError(
+                "Cannot export the trace to %s: %s" % (endpoint, e)
+            ) from e
+
+
+def is_error(attributes):
+    status_code = attributes.get('status_code')
+    return bool(attributes.get('exit_code')) or (
+        status_code is not None and status_code >= 400
+    )
+
+
+def get_otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    elif isinstance(value, int):
+        # 64 bits integers are strings in the JSON encoding
+        return {'intValue': str(value)}
+    elif isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def span(tracer, name, **attributes):
+    """
+    Open a span of the tracer of a run, if any, yielding its attributes
+    """
+    if tracer is None:
+        return contextlib.nullcontext(attributes)
+    return tracer.span(name, **attributes)
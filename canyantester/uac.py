@@ -0,0 +1,613 @@
+import asyncio
+import hashlib
+import re
+import time
+
+from collections import Counter, namedtuple
+from uuid import uuid4
+
+from .engine import run_workers
+from .metrics import get_worker_group
+from .sipp import get_worker_values
+from .stats import SippStats, format_summary
+from .utils import get_int_from_config
+from .worker import Worker, get_exit_status
+
+# RFC 3261 timers, in seconds
+T1 = 0.5
+T2 = 4.0
+
+COMPACT_HEADERS = {
+    'v': 'via',
+    'f': 'from',
+    't': 'to',
+    'i': 'call-id',
+    'm': 'contact',
+    'l': 'content-length',
+    'c': 'content-type',
+}
+
+Message = namedtuple('Message', ['method', 'uri', 'status', 'headers', 'body'])
+
+
+class CallFailed(RuntimeError):
+    """
+    A call failed, `reason` is the sipp failure counter it is reported with
+    """
+
+    def __init__(self, reason, message):
+        super(CallFailed, self).__init__(message)
+        self.reason = reason
+
+
+def parse_message(data):
+    """
+    Parse a SIP request or response, header names are lower case and
+    expanded from their compact form
+    """
+    head, _, body = data.decode('utf-8', 'replace').partition('\r\n\r\n')
+    lines = head.split('\r\n')
+    first, second = (lines[0].split(' ', 2) + [''])[:2]
+    if first == 'SIP/2.0':
+        method, uri, status = None, None, int(second)
+    else:
+        method, uri, status = first, second, None
+    headers = {}
+    name = None
+    for line in lines[1:]:
+        if line[:1] in (' ', '\t') and name is not None:
+            headers[name][-1] += ' ' + line.strip()
+            continue
+        name, _, value = line.partition(':')
+        name = name.strip().lower()
+        name = COMPACT_HEADERS.get(name, name)
+        headers.setdefault(name, []).append(value.strip())
+    return Message(method, uri, status, headers, body)
+
+
+def get_header(message, name, default=None):
+    values = message.headers.get(name)
+    return values[0] if values else default
+
+
+def get_uri(value):
+    match = re.search(r'<([^>]*)>', value or '')
+    if match:
+        return match.group(1)
+    return (value or '').split(';', 1)[0].strip() or None
+
+
+def get_route_set(message):
+    """
+    Return the route set of a dialog from the Record-Route headers of the
+    response establishing it, in the order the UAC has to use them
+    """
+    routes = []
+    for value in message.headers.get('record-route', []):
+        routes.extend(route.strip() for route in re.split(r',(?![^<]*>)', value))
+    return list(reversed(routes))
+
+
+def build_message(start_line, headers, body=''):
+    body = body.encode('utf-8')
+    lines = [start_line] + ['%s: %s' % header for header in headers]
+    lines.append('Content-Length: %d' % len(body))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + body
+
+
+def parse_challenge(value):
+    """
+    Return the parameters of a digest challenge or credentials
+    """
+    _, _, params = (value or '').strip().partition(' ')
+    return dict(
+        (match.group(1).lower(), match.group(3 if match.group(2) is None else 2))
+        for match in re.finditer(r'([\w-]+)\s*=\s*(?:"([^"]*)"|([^\s,]*))', params)
+    )
+
+
+def md5(value):
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def get_digest_response(
+    username, password, realm, method, uri, nonce, qop=None, nc=None, cnonce=None
+):
+    """
+    Digest response of RFC 2617 with the MD5 algorithm
+    """
+    ha1 = md5('%s:%s:%s' % (username, realm, password))
+    ha2 = md5('%s:%s' % (method, uri))
+    if qop:
+        return md5('%s:%s:%s:%s:%s:%s' % (ha1, nonce, nc, cnonce, qop, ha2))
+    return md5('%s:%s:%s' % (ha1, nonce, ha2))
+
+
+def get_authorization(response, username, password, method, uri):
+    """
+    Return the header answering the 401 or 407 challenge of a response
+    """
+    if response.status == 401:
+        name, header = 'www-authenticate', 'Authorization'
+    else:
+        name, header = 'proxy-authenticate', 'Proxy-Authorization'
+    challenge = parse_challenge(get_header(response, name))
+    if challenge.get('algorithm', 'MD5').upper() != 'MD5':
+        raise CallFailed(
+            'UnexpectedMessage',
+            "Unsupported digest algorithm %s" % challenge['algorithm'],
+        )
+    qop = nc = cnonce = None
+    if 'auth' in [q.strip() for q in challenge.get('qop', '').split(',')]:
+        qop, nc, cnonce = 'auth', '00000001', uuid4().hex[:16]
+    realm, nonce = challenge.get('realm', ''), challenge.get('nonce', '')
+    params = [
+        'username="%s"' % username,
+        'realm="%s"' % realm,
+        'nonce="%s"' % nonce,
+        'uri="%s"' % uri,
+        'response="%s"'
+        % get_digest_response(
+            username, password, realm, method, uri, nonce, qop, nc, cnonce
+        ),
+        'algorithm=MD5',
+    ]
+    if challenge.get('opaque') is not None:
+        params.append('opaque="%s"' % challenge['opaque'])
+    if qop:
+        params.extend(['qop=%s' % qop, 'nc=%s' % nc, 'cnonce="%s"' % cnonce])
+    return header, 'Digest %s' % ', '.join(params)
+
+
+def format_host(host):
+    return '[%s]' % host if ':' in host else host
+
+
+class UserAgent(asyncio.DatagramProtocol):
+    """
+    UDP SIP user agent client running many concurrent calls over a single
+    socket: the responses are dispatched to their transaction by Call-ID and
+    CSeq, and the requests are retransmitted as in RFC 3261 until a response
+    arrives or the transaction times out.
+    """
+
+    def __init__(self, retrans=T1, transaction_timeout=64 * T1):
+        self._retrans = retrans
+        self._timeout = transaction_timeout
+        self._transport = None
+        self._transactions = {}
+        self._acks = {}
+        self.local_address = None
+        self.retransmissions = 0
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self.local_address = transport.get_extra_info('sockname')[:2]
+
+    def datagram_received(self, data, addr):
+        try:
+            message = parse_message(data)
+            number, method = get_header(message, 'cseq').split()
+            key = (get_header(message, 'call-id'), int(number), method)
+        except (AttributeError, IndexError, ValueError):
+            return
+        if message.status is None:
+            # requests from the other side are not supported
+            return
+        queue = self._transactions.get(key)
+        if queue is not None:
+            queue.put_nowait(message)
+        elif method == 'INVITE' and message.status < 300 and key[0] in self._acks:
+            # the ACK has been lost and the 2xx response is retransmitted
+            self.send(self._acks[key[0]])
+
+    def error_received(self, exc):
+        # the retransmissions and the transaction timeout take care of it
+        pass
+
+    def send(self, data):
+        self._transport.sendto(data)
+
+    def set_ack(self, call_id, data):
+        if data is None:
+            self._acks.pop(call_id, None)
+        else:
+            self._acks[call_id] = data
+
+    async def request(self, data, call_id, cseq, method):
+        """
+        Send a request and return its final response
+        """
+        key = (call_id, cseq, method)
+        queue = asyncio.Queue()
+        self._transactions[key] = queue
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self._timeout
+        interval = self._retrans
+        retransmit = True
+        try:
+            self.send(data)
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise CallFailed('MaxUDPRetrans', "%s timed out" % method)
+                try:
+                    response = await asyncio.wait_for(
+                        queue.get(),
+                        min(interval, remaining) if retransmit else remaining,
+                    )
+                except asyncio.TimeoutError:
+                    if retransmit and loop.time() < deadline:
+                        self.send(data)
+                        self.retransmissions += 1
+                        interval *= 2
+                        if method != 'INVITE':
+                            interval = min(interval, T2)
+                    continue
+                if response.status >= 200:
+                    return response
+                if method == 'INVITE':
+                    # the INVITE is not retransmitted after a provisional response
+                    retransmit = False
+                else:
+                    interval = T2
+        finally:
+            del self._transactions[key]
+
+
+class Call(object):
+    """
+    INVITE, ACK, pause and BYE call flow of a user agent client, answering a
+    401 or 407 challenge when it has credentials
+    """
+
+    def __init__(
+        self,
+        agent,
+        request_uri,
+        from_uri,
+        to_uri,
+        duration=0,
+        username=None,
+        password=None,
+        media_port=9,
+    ):
+        self._agent = agent
+        self._request_uri = request_uri
+        self._from_uri = from_uri
+        self._to_uri = to_uri
+        self._duration = duration
+        self._username = username
+        self._password = password
+        self._media_port = media_port
+        host, port = agent.local_address
+        self._host = host
+        self._via = 'SIP/2.0/UDP %s:%d' % (format_host(host), port)
+        self._contact = '<sip:canyantester@%s:%d>' % (format_host(host), port)
+        self._call_id = '%s@%s' % (uuid4().hex, host)
+        self._from = '<%s>;tag=%s' % (from_uri, uuid4().hex[:16])
+
+    def _build(self, method, uri, branch, to, cseq, routes=(), extra=(), body=''):
+        headers = [
+            ('Via', '%s;branch=%s;rport' % (self._via, branch)),
+            ('Max-Forwards', '70'),
+            ('From', self._from),
+            ('To', to),
+            ('Call-ID', self._call_id),
+            ('CSeq', '%d %s' % (cseq, method)),
+            ('Contact', self._contact),
+        ]
+        headers.extend(('Route', route) for route in routes)
+        headers.extend(extra)
+        if body:
+            headers.append(('Content-Type', 'application/sdp'))
+        return build_message('%s %s SIP/2.0' % (method, uri), headers, body)
+
+    def _get_sdp(self):
+        ip_type = '6' if ':' in self._host else '4'
+        return (
+            'v=0\r\n'
+            'o=canyantester 1 1 IN IP%(ip_type)s %(host)s\r\n'
+            's=-\r\n'
+            'c=IN IP%(ip_type)s %(host)s\r\n'
+            't=0 0\r\n'
+            'm=audio %(port)d RTP/AVP 0 8\r\n'
+            'a=rtpmap:0 PCMU/8000\r\n'
+            'a=rtpmap:8 PCMA/8000\r\n'
+        ) % {'ip_type': ip_type, 'host': self._host, 'port': self._media_port}
+
+    async def run(self):
+        """
+        Run the call and return the time from the first INVITE to its 2xx
+        response in milliseconds, or raise CallFailed
+        """
+        started_at = time.monotonic()
+        to = '<%s>' % self._to_uri
+        cseq = 1
+        extra = []
+        while True:
+            branch = 'z9hG4bK%s' % uuid4().hex
+            invite = self._build(
+                'INVITE',
+                self._request_uri,
+                branch,
+                to,
+                cseq,
+                extra=extra,
+                body=self._get_sdp(),
+            )
+            response = await self._agent.request(invite, self._call_id, cseq, 'INVITE')
+            if response.status >= 300:
+                # the ACK of a non-2xx response belongs to the INVITE transaction
+                self._agent.send(
+                    self._build(
+                        'ACK',
+                        self._request_uri,
+                        branch,
+                        get_header(response, 'to', to),
+                        cseq,
+                    )
+                )
+            if response.status in (401, 407) and not extra and self._username:
+                extra = [
+                    get_authorization(
+                        response,
+                        self._username,
+                        self._password,
+                        'INVITE',
+                        self._request_uri,
+                    )
+                ]
+                cseq += 1
+                continue
+            break
+        response_time = (time.monotonic() - started_at) * 1000.0
+        if response.status >= 300:
+            raise CallFailed(
+                'UnexpectedMessage', "INVITE rejected with %d" % response.status
+            )
+
+        to = get_header(response, 'to', to)
+        routes = get_route_set(response)
+        target = get_uri(get_header(response, 'contact')) or self._request_uri
+        ack = self._build('ACK', target, 'z9hG4bK%s' % uuid4().hex, to, cseq, routes)
+        self._agent.set_ack(self._call_id, ack)
+        try:
+            self._agent.send(ack)
+            await asyncio.sleep(self._duration / 1000.0)
+            cseq += 1
+            bye = self._build(
+                'BYE', target, 'z9hG4bK%s' % uuid4().hex, to, cseq, routes
+            )
+            response = await self._agent.request(bye, self._call_id, cseq, 'BYE')
+        finally:
+            self._agent.set_ack(self._call_id, None)
+        if response.status >= 300:
+            raise CallFailed(
+                'UnexpectedMessage', "BYE rejected with %d" % response.status
+            )
+        return response_time
+
+
+class UACWorker(Worker):
+    """
+    Worker placing calls from a built-in asyncio SIP user agent instead of a
+    sipp process, with many concurrent calls over a single UDP socket and the
+    `call_rate`, `call_limit` and `call_number` semantics of sipp. It runs the
+    call flow of the default scenarios: INVITE, ACK, pause and BYE.
+    """
+
+    def __init__(
+        self,
+        worker_id,
+        config,
+        target=None,
+        log=print,
+        stored_responses=None,
+        verbose=False,
+        metrics=None,
+        ports=None,
+    ):
+        super(UACWorker, self).__init__(worker_id)
+        self._config = config
+        self._target = target
+        self._log = log
+        self._stored_responses = stored_responses or {}
+        self._verbose = verbose
+        self._metrics = metrics
+        self._ports = ports
+        self._delay = get_int_from_config(self._config, 'delay', 0)
+        self._stats = SippStats()
+        self._stats_interval = self._config.get('stats_interval', 1)
+        self._values = {}
+        self._address = None
+
+    def setup(self):
+        self._values = get_worker_values(
+            self._config.get('values', {}), self._worker_id, self._stored_responses
+        )
+        target = self._target
+        if target.startswith('['):
+            host, _, port = target[1:].partition(']')
+            port = port.lstrip(':')
+        elif target.count(':') == 1:
+            host, _, port = target.partition(':')
+        else:
+            host, port = target, None
+        self._address = (host, int(port or 5060))
+
+    def runner(self):
+        run_workers([self])
+
+    async def arunner(self):
+        # filled run after run, for the failure budget to watch
+        self._exit_codes = []
+        self._durations = []
+        for _ in range(get_int_from_config(self._config, 'repeat', 1)):
+            self._log(
+                "[%s] uac %s:%d (delay = %s)"
+                % ((self._worker_id,) + self._address + (self._delay,))
+            )
+            started_at = time.monotonic()
+            try:
+                exit_code = await asyncio.wait_for(
+                    self._run(), timeout=self._config.get('timeout', None)
+                )
+            except asyncio.TimeoutError:
+                exit_code = -1
+            except asyncio.CancelledError:
+                self._exit_codes.append(-1)
+                raise
+            finally:
+                self._durations.append(time.monotonic() - started_at)
+            self._exit_codes.append(exit_code)
+            if self._metrics is not None:
+                self._metrics.inc(
+                    'canyantester_worker_runs_total',
+                    {
+                        'group': get_worker_group(self._worker_id),
+                        'result': 'success' if exit_code == 0 else 'error',
+                    },
+                )
+
+    def _get_uri(self, user, host, port=None):
+        if port is None:
+            return 'sip:%s@%s' % (user, format_host(str(host)))
+        return 'sip:%s@%s:%s' % (user, format_host(str(host)), port)
+
+    def _new_call(self, agent):
+        values = self._values
+        host, port = self._address
+        to_user = values.get('to_user', values.get('service', 'service'))
+        media_port = 9
+        if self._ports is not None and self._ports.media is not None:
+            media_port = self._ports.media
+        return Call(
+            agent,
+            request_uri=self._get_uri(values.get('service', to_user), host, port),
+            from_uri=self._get_uri(
+                values.get('from_user', 'canyantester'),
+                values.get('from_domain', agent.local_address[0]),
+            ),
+            to_uri=self._get_uri(
+                to_user, values.get('to_domain', host), values.get('to_port', port)
+            ),
+            duration=float(values.get('call_duration', 0) or 0),
+            username=values.get('username'),
+            password=values.get('password'),
+            media_port=media_port,
+        )
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        local_addr = None
+        if self._ports is not None:
+            local_addr = (
+                self._ports.address or '0.0.0.0',
+                self._ports.signalling or 0,
+            )
+        transport, agent = await loop.create_datagram_endpoint(
+            lambda: UserAgent(
+                retrans=int(self._config.get('retrans', T1 * 1000)) / 1000.0,
+                transaction_timeout=float(
+                    self._config.get('transaction_timeout', 64 * T1)
+                ),
+            ),
+            local_addr=local_addr,
+            remote_addr=self._address,
+        )
+        rate = get_int_from_config(self._config, 'call_rate', 1)
+        interval = (
+            get_int_from_config(self._config, 'call_rate_period', 1000) / 1000.0 / rate
+            if rate
+            else 0.0
+        )
+        slots = asyncio.Semaphore(get_int_from_config(self._config, 'call_limit', 1))
+        counters = Counter()
+        calls = set()
+        started_at = loop.time()
+        self._stats.start_process()
+
+        def update_stats():
+            elapsed = loop.time() - started_at
+            self._stats.set_current(
+                dict(counters, Retransmissions=agent.retransmissions),
+                elapsed,
+                counters['TotalCallCreated'] / elapsed if elapsed else 0.0,
+            )
+            if self._metrics is not None:
+                self._metrics.set_worker_stats(self._worker_id, self._stats)
+
+        async def report():
+            while True:
+                await asyncio.sleep(self._stats_interval)
+                update_stats()
+
+        def fail(reason, error):
+            counters['FailedCall'] += 1
+            counters['Failed%s' % reason] += 1
+            if self._verbose:
+                self._log("[%s] call failed: %s" % (self._worker_id, error))
+
+        async def place(call):
+            try:
+                response_time = await call.run()
+            except CallFailed as e:
+                fail(e.reason, e)
+            except OSError as e:
+                # counted like the messages sipp fails to send
+                fail('CmdNotSent', e)
+            except Exception as e:
+                # e.g. a response missing a header, the other calls go on
+                fail('UnexpectedMessage', e)
+            else:
+                counters['SuccessfulCall'] += 1
+                self._stats.add_response_time(response_time)
+            finally:
+                slots.release()
+
+        reporter = asyncio.ensure_future(report())
+        try:
+            for n in range(get_int_from_config(self._config, 'call_number', 1)):
+                await asyncio.sleep(max(started_at + n * interval - loop.time(), 0))
+                await slots.acquire()
+                counters['TotalCallCreated'] += 1
+                task = asyncio.ensure_future(place(self._new_call(agent)))
+                calls.add(task)
+                task.add_done_callback(calls.discard)
+            await asyncio.gather(*calls)
+        finally:
+            for task in list(calls) + [reporter]:
+                task.cancel()
+            await asyncio.gather(*(list(calls) + [reporter]), return_exceptions=True)
+            update_stats()
+            transport.close()
+        return 1 if counters['FailedCall'] else 0
+
+    def get_stats(self):
+        return self._stats
+
+    def debug(self):
+        if self._exit_codes is None:
+            # cancelled before its start
+            self._exit_codes = []
+        non_zero_exit_codes = [code for code in self._exit_codes if code != 0]
+        self._exit_status = get_exit_status(
+            self._exit_codes, self._config.get('max_errors', 0)
+        )
+        self._log(
+            "[%s] runs = %s, errors = %s, exit codes = %s, target = %s:%d"
+            % (
+                (
+                    self._worker_id,
+                    len(self._exit_codes),
+                    len(non_zero_exit_codes),
+                    ', '.join(map(str, self._exit_codes)),
+                )
+                + self._address
+            )
+        )
+        if self._stats.get_counters():
+            self._log(
+                "[%s] %s" % (self._worker_id, format_summary(self._stats.summary()))
+            )
@@ -7,6 +7,16 @@ def generate_random_seed():
     return struct.unpack('I', os.urandom(4))[0]
 
 
+def load_yaml(stream):
+    """
+    Parse a YAML document, importing the parser only when a configuration is
+    actually loaded
+    """
+    import yaml
+
+    return yaml.load(stream, Loader=getattr(yaml, 'CLoader', yaml.Loader))
+
+
 def get_min_max_from_config(config, key, d=None):
     value = config.get(key)
     if value is None:
@@ -23,3 +33,12 @@ def get_int_from_config(config, key, d=None):
     if value is None:
         return d
     return random.randint(*value)
+
+
+def percentile(values, p):
+    """
+    Return the p-th percentile of a list of values sorted in ascending order
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
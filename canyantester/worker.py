@@ -1,6 +1,22 @@
+import asyncio
+import contextvars
+
+
+def get_exit_status(exit_codes, max_errors=0):
+    """
+    Return the first non-zero exit code when the number of failed runs exceeds
+    the maximum number of errors allowed, otherwise 0
+    """
+    non_zero_exit_codes = [code for code in exit_codes if code != 0]
+    return non_zero_exit_codes[0] if len(non_zero_exit_codes) > max_errors else 0
+
+
 class Worker(object):
-    def __init__(self):
+    def __init__(self, worker_id=None):
+        self._worker_id = worker_id
+        self._delay = 0
         self._exit_codes = None
+        self._durations = None
         self._exit_status = None
 
     def __call__(self):
@@ -18,11 +34,44 @@ class Worker(object):
     def runner(self):
         raise NotImplementedError()
 
+    async def arunner(self):
+        loop = asyncio.get_event_loop()
+        # the runner sees the context of the task, e.g. its span
+        context = contextvars.copy_context()
+        await loop.run_in_executor(None, context.run, self.runner)
+
+    def get_worker_id(self):
+        return self._worker_id
+
+    def get_delay(self):
+        """
+        Start offset of the worker in milliseconds, relative to the start of the run
+        """
+        return self._delay
+
     def get_exit_codes(self):
         return self._exit_codes
 
+    def get_durations(self):
+        """
+        Duration in seconds of each run of the worker
+        """
+        return self._durations
+
     def get_exit_status(self):
         return self._exit_status
 
+    def get_stats(self):
+        return None
+
+    def get_load_profile(self):
+        return None
+
+    def get_pid(self):
+        """
+        Process id of the load generator process currently running, if any
+        """
+        return None
+
     def debug(self):
         pass
@@ -22,7 +22,6 @@ setuptools.setup(
     install_requires=[
         'Click>=7.0',
         'PyYAML>=3.13',
-        'dotty-dict>=1.2.1',
         'requests>=2.22.0',
     ],
     packages=find_packages(),